@@ -0,0 +1,410 @@
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from mock_dsm import MockDSM
+
+SCENARIOS = ("login_storm", "listing", "uploads", "session_growth")
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+# ============= 量測 =============
+
+def percentile(sorted_values, fraction):
+    """最近排名法的百分位數"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def rss_mb():
+    """目前的常駐記憶體（MB），無法取得時回傳 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以位元組為單位，Linux 為 KB
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def process_write_bytes():
+    """行程累計寫入磁碟的位元組數（僅 Linux）"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class SessionFileMeter:
+    """統計 SessionManager.save_sessions 的次數、耗時與寫入量"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.original = manager.save_sessions
+        manager.save_sessions = self.save
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.saves = 0
+        self.seconds = 0.0
+        self.bytes_written = 0
+
+    def save(self):
+        started = time.perf_counter()
+        try:
+            self.original()
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                size = os.path.getsize(self.manager.session_file)
+            except OSError:
+                size = 0
+            with self.lock:
+                self.seconds += elapsed
+                self.saves += 1
+                self.bytes_written += size
+
+    def snapshot(self):
+        try:
+            size = os.path.getsize(self.manager.session_file)
+        except OSError:
+            size = 0
+        return {
+            "saves": self.saves,
+            "save_seconds": round(self.seconds, 4),
+            "mean_save_ms": round(self.seconds / self.saves * 1000, 3) if self.saves else 0.0,
+            "bytes_written": self.bytes_written,
+            "file_size_bytes": size,
+            "sessions": len(self.manager.sessions)
+        }
+
+
+def timed(operation):
+    """執行一次操作，回傳 (耗時, None 或錯誤說明)"""
+    started = time.perf_counter()
+    try:
+        error = operation()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - started, error
+
+
+def run_operations(ctx, operations, concurrency):
+    """以 concurrency 個執行緒執行所有操作並彙整結果"""
+    ctx.meter.reset()
+    write_bytes = process_write_bytes()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, operations))
+    elapsed = time.perf_counter() - started
+    written = process_write_bytes()
+
+    latencies = sorted(duration for duration, _ in results)
+    errors = [error for _, error in results if error]
+    return {
+        "requests": len(results),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0
+        },
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "session_file": ctx.meter.snapshot(),
+        "process_write_bytes": written - write_bytes if written is not None and write_bytes is not None else None
+    }
+
+
+# ============= 測試環境 =============
+
+class BenchContext:
+    """嵌入的模擬 NAS 與 Flask app；使用暫存的設定檔與 session 檔案，不影響正式資料"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="dsm_bench_")
+        self.mock = MockDSM(root=os.path.join(self.workdir, "nas"), latency=args.nas_latency,
+                            bandwidth=args.nas_bandwidth, task_duration=0.2)
+        self.mock.seed(files=args.seed_files, folders=args.seed_folders, file_size=1024)
+        self.folders = ["/home/www"] + [f"/home/www/folder{index:03d}" for index in range(args.seed_folders)]
+        self.mock_server, nas_base_url = self.mock.serve(port=0)
+
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config.setdefault("SESSION", {})["SESSION_FILE"] = os.path.join(self.workdir, "session.json")
+        config.setdefault("DOWNLOAD", {})["CACHE_DIR"] = os.path.join(self.workdir, "download_cache")
+        config.setdefault("THUMBNAIL", {})["CACHE_DIR"] = os.path.join(self.workdir, "thumbnail_cache")
+        config.setdefault("INDEX", {})["DB_FILE"] = os.path.join(self.workdir, "metadata_index.db")
+        config.setdefault("LOGGING", {})["LEVEL"] = "WARNING"
+        config.setdefault("TRACING", {}).update({"EXPORT_FILE": "", "EXPORT_ENDPOINT": ""})
+        config_file = os.path.join(self.workdir, "config.json")
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        os.environ["NAS_BASE_URL"] = nas_base_url
+        os.environ["DSM_CONFIG_FILE"] = config_file
+        os.environ.setdefault("FLASK_SECRET_KEY", uuid.uuid4().hex)
+        import server
+        self.server = server
+        self.app = server.app
+        self.meter = SessionFileMeter(server.session_manager)
+
+    def login(self, account=None):
+        """建立已登入的 test client"""
+        client = self.app.test_client()
+        with client.post('/api/login', json={"account": account or f"bench{uuid.uuid4().hex[:8]}",
+                                             "password": "bench"}) as response:
+            if not response.get_json().get("success"):
+                raise RuntimeError(f"登入失敗: {response.get_json()}")
+        return client
+
+    def client_pool(self, size):
+        clients = queue.Queue()
+        for index in range(size):
+            clients.put(self.login(f"bench{index}"))
+        return clients
+
+    def close(self):
+        self.mock_server.shutdown()
+
+
+def check_response(response):
+    """成功回傳 None，失敗回傳錯誤說明"""
+    with response:
+        data = response.get_json(silent=True) if response.mimetype == 'application/json' else None
+        if response.status_code < 400 and (data is None or data.get("success", True)):
+            return None
+        return f"HTTP {response.status_code}: {(data or {}).get('error', '')}"
+
+
+def with_client(clients, call):
+    client = clients.get()
+    try:
+        return call(client)
+    finally:
+        clients.put(client)
+
+
+# ============= 情境 =============
+
+def scenario_login_storm(ctx):
+    """大量使用者同時登入：每次登入都會寫入 session 檔案"""
+    args = ctx.args
+
+    def login(index):
+        client = ctx.app.test_client()
+        return check_response(client.post('/api/login', json={"account": f"storm{index % 100}", "password": "x"}))
+
+    operations = [lambda index=index: login(index) for index in range(args.requests)]
+    return run_operations(ctx, operations, args.concurrency)
+
+
+def scenario_listing(ctx):
+    """瀏覽為主：80% 列出資料夾、20% 查詢登入狀態"""
+    args = ctx.args
+    clients = ctx.client_pool(args.concurrency)
+    rng = random.Random(1)
+
+    def operation():
+        if rng.random() < 0.8:
+            folder = rng.choice(ctx.folders)
+            return lambda: with_client(clients, lambda c: check_response(c.get('/api/files', query_string={"path": folder})))
+        return lambda: with_client(clients, lambda c: check_response(c.get('/api/status')))
+
+    operations = [operation() for _ in range(args.requests)]
+    return run_operations(ctx, operations, args.concurrency)
+
+
+def scenario_uploads(ctx):
+    """平行上傳大型檔案"""
+    args = ctx.args
+    clients = ctx.client_pool(args.concurrency)
+    payload = os.urandom(args.upload_mb * 1024 * 1024)
+
+    def upload(index):
+        def call(client):
+            return check_response(client.post('/api/upload', content_type='multipart/form-data', data={
+                "path": "/home/www",
+                "overwrite": "true",
+                "file": (io.BytesIO(payload), f"upload{index:04d}.bin")
+            }))
+        return with_client(clients, call)
+
+    operations = [lambda index=index: upload(index) for index in range(args.uploads)]
+    result = run_operations(ctx, operations, args.concurrency)
+    result["upload_mb"] = args.upload_mb
+    result["throughput_mb_s"] = round(args.uploads * args.upload_mb / result["elapsed_s"], 2) if result["elapsed_s"] else 0.0
+    return result
+
+
+def scenario_session_growth(ctx):
+    """session 數量成長時的請求延遲與 session 檔案 I/O"""
+    args = ctx.args
+    manager = ctx.server.session_manager
+    clients = ctx.client_pool(args.concurrency)
+    steps = {}
+    now = time.time()
+    for target in args.growth_steps:
+        # 直接加入合成的 session（與登入建立的結構相同），不經過 NAS
+        while len(manager.sessions) < target:
+            session_id = str(uuid.uuid4())
+            manager.sessions[session_id] = {
+                "sid": uuid.uuid4().hex,
+                "syno_token": uuid.uuid4().hex[:16],
+                "login_time": now,
+                "credentials": {"account": f"user{len(manager.sessions)}", "password": "x"},
+                "expires_at": now + 86400 * 365,
+                "last_activity": now,
+                "session_id": session_id
+            }
+        log(f"  session_growth: {len(manager.sessions)} sessions")
+        folder = ctx.folders[0]
+        operations = [lambda: with_client(clients, lambda c: check_response(c.get('/api/files', query_string={"path": folder})))
+                      for _ in range(args.growth_requests)]
+        steps[str(target)] = run_operations(ctx, operations, args.concurrency)
+    return {"steps": steps}
+
+
+# ============= 與基準比較 =============
+
+def flatten(results):
+    """把各情境（含 session_growth 的各階段）攤平成 {名稱: 結果}"""
+    flat = {}
+    for name, result in results.items():
+        if "steps" in result:
+            for step, step_result in result["steps"].items():
+                flat[f"{name}[{step}]"] = step_result
+        else:
+            flat[name] = result
+    return flat
+
+
+def error_rate(result):
+    return result["errors"] / result["requests"] if result["requests"] else 0.0
+
+
+def compare(baseline, current, tolerance):
+    """p95 延遲變慢或吞吐量下降超過 tolerance 比例，或錯誤率高於基準時視為退化
+
+    錯誤率不套用 tolerance：請求快速失敗會讓延遲與吞吐量看起來變好，必須另外檢查。
+    """
+    regressions = []
+    baseline_flat = flatten(baseline.get("scenarios", {}))
+    for name, result in flatten(current["scenarios"]).items():
+        before = baseline_flat.get(name)
+        if before is None:
+            continue
+        if before["latency_ms"]["p95"] and result["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['latency_ms']['p95']}ms -> {result['latency_ms']['p95']}ms")
+        if before["throughput_rps"] and result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if error_rate(result) > error_rate(before):
+            regressions.append(f"{name}: errors {before['errors']}/{before['requests']} -> {result['errors']}/{result['requests']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以內嵌的模擬 NAS 對 API 伺服器進行效能測試，結果以 JSON 輸出")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="要執行的情境，可重複指定，預設全部")
+    parser.add_argument("--config", default="config.json", help="作為基礎的設定檔")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="login_storm 與 listing 的請求數")
+    parser.add_argument("--uploads", type=int, default=16, help="uploads 情境的上傳次數")
+    parser.add_argument("--upload-mb", type=int, default=8, help="每個上傳檔案的大小（MB）")
+    parser.add_argument("--growth-steps", type=lambda value: [int(item) for item in value.split(',')],
+                        default=[1000, 10000, 100000], help="session_growth 的 session 數，以逗號分隔")
+    parser.add_argument("--growth-requests", type=int, default=20, help="session_growth 每個階段的請求數")
+    parser.add_argument("--seed-files", type=int, default=500)
+    parser.add_argument("--seed-folders", type=int, default=10)
+    parser.add_argument("--nas-latency", type=float, default=0.0, help="模擬 NAS 每個請求的延遲（秒）")
+    parser.add_argument("--nas-bandwidth", type=int, default=0, help="模擬 NAS 的傳輸頻寬（位元組/秒），0 為不限制")
+    parser.add_argument("--quick", action="store_true", help="縮小規模，適合 CI 快速檢查")
+    parser.add_argument("--output", help="結果寫入檔案（預設輸出到 stdout）")
+    parser.add_argument("--baseline", help="與先前的結果比較，退化時以狀態碼 1 結束")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允許的退化比例")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.requests = min(args.requests, 100)
+        args.uploads = min(args.uploads, 4)
+        args.upload_mb = min(args.upload_mb, 2)
+        args.growth_steps = [step for step in args.growth_steps if step <= 10000] or [1000]
+        args.growth_requests = min(args.growth_requests, 10)
+
+    ctx = BenchContext(args)
+    results = {}
+    try:
+        for name in args.scenario or SCENARIOS:
+            log(f"執行情境: {name}")
+            results[name] = globals()[f"scenario_{name}"](ctx)
+    finally:
+        ctx.close()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        "scenarios": results
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            log(f"效能退化: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
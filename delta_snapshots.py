@@ -0,0 +1,79 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def entry_fingerprint(item):
+    """以類型、大小與修改時間組成項目指紋
+
+    直接保存欄位本身而非 hash() 值，避免雜湊碰撞漏判變更，也不受各行程的雜湊隨機化影響。
+    """
+    additional = item.get('additional', {})
+    times = additional.get('time', {})
+    return (bool(item.get('isdir')), additional.get('size'), times.get('mtime'), times.get('crtime'))
+
+
+class SnapshotStore:
+    """以 LRU 保存資料夾快照（名稱 -> 指紋），供增量列表比對
+
+    游標為快照內容的雜湊值，內容相同的列表共用同一份快照；
+    快照數或總項目數超過上限時淘汰最久未使用的快照。
+    """
+
+    def __init__(self, max_snapshots=2000, max_entries=2000000):
+        self.max_snapshots = max_snapshots
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.snapshots = OrderedDict()
+        self.total_entries = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_cursor(owner, path, fingerprints):
+        digest = hashlib.sha256(f"{owner}\0{path}".encode('utf-8'))
+        for name in sorted(fingerprints):
+            digest.update(f"\0{name}\0{fingerprints[name]}".encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def save(self, owner, path, fingerprints):
+        """保存快照並回傳游標"""
+        cursor = self.make_cursor(owner, path, fingerprints)
+        with self.lock:
+            if cursor in self.snapshots:
+                self.snapshots.move_to_end(cursor)
+                return cursor
+            self.snapshots[cursor] = (owner, path, fingerprints)
+            self.total_entries += len(fingerprints)
+            while len(self.snapshots) > 1 and (len(self.snapshots) > self.max_snapshots
+                                               or self.total_entries > self.max_entries):
+                _, (_, _, evicted) = self.snapshots.popitem(last=False)
+                self.total_entries -= len(evicted)
+                self.evictions += 1
+        return cursor
+
+    def get(self, cursor, owner, path):
+        """取得快照指紋，游標不存在、已淘汰或不屬於此使用者與路徑時回傳 None"""
+        with self.lock:
+            snapshot = self.snapshots.get(cursor)
+            if snapshot is None or snapshot[0] != owner or snapshot[1] != path:
+                return None
+            self.snapshots.move_to_end(cursor)
+            return snapshot[2]
+
+    @staticmethod
+    def diff(old, new):
+        """比對兩份快照，回傳 (新增, 刪除, 修改) 的名稱列表"""
+        added = [name for name in new if name not in old]
+        removed = [name for name in old if name not in new]
+        modified = [name for name, fingerprint in new.items() if name in old and old[name] != fingerprint]
+        return added, removed, modified
+
+    def stats(self):
+        with self.lock:
+            return {
+                "snapshots": len(self.snapshots),
+                "entries": self.total_entries,
+                "max_snapshots": self.max_snapshots,
+                "max_entries": self.max_entries,
+                "evictions": self.evictions
+            }
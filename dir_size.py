@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class DirSizeCache:
+    """資料夾大小快取，以資料夾 mtime 判斷新鮮度
+
+    計算交給有上限的執行緒池；過期的結果先回傳舊值並在背景重新計算，
+    同一資料夾同時只會有一個計算中的任務。
+    """
+
+    def __init__(self, compute, concurrency=2, max_age=3600, max_entries=10000):
+        self.compute = compute
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dirsize")
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.pending = {}
+
+    def _submit(self, key, mtime, user_session):
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._run, key, mtime, user_session)
+                self.pending[key] = future
+            return future
+
+    def _run(self, key, mtime, user_session):
+        try:
+            data = self.compute(user_session, key[1])
+            result = {
+                "total_size": data.get("total_size"),
+                "num_dir": data.get("num_dir"),
+                "num_file": data.get("num_file"),
+                "mtime": mtime,
+                "computed_at": time.time()
+            }
+            with self.lock:
+                self.entries[key] = result
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            return result
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _is_fresh(self, entry, mtime):
+        return entry["mtime"] == mtime and time.time() - entry["computed_at"] < self.max_age
+
+    def get(self, owner, user_session, mtimes, wait_timeout=None):
+        """取得多個資料夾的大小，mtimes 為 {path: 目前 mtime}
+
+        沒有快取的資料夾最多等待 wait_timeout 秒（None 為不等待），仍未完成的標為 pending。
+        """
+        results = {}
+        waiting = {}
+        for path, mtime in mtimes.items():
+            key = (owner, path)
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+            if entry is not None and self._is_fresh(entry, mtime):
+                results[path] = dict(entry, path=path, status="fresh")
+                continue
+            future = self._submit(key, mtime, user_session)
+            if entry is not None:
+                results[path] = dict(entry, path=path, status="stale")
+            else:
+                waiting[path] = future
+
+        if waiting and wait_timeout:
+            wait(list(waiting.values()), timeout=wait_timeout)
+        for path, future in waiting.items():
+            if not future.done():
+                results[path] = {"path": path, "status": "pending"}
+            elif future.exception() is not None:
+                results[path] = {"path": path, "status": "error", "error": str(future.exception())}
+            else:
+                results[path] = dict(future.result(), path=path, status="fresh")
+        return results
+
+    def invalidate(self, prefixes):
+        """移除受影響路徑本身、其子資料夾與所有上層資料夾的快取"""
+        def affected(path):
+            return any(path == prefix
+                       or path.startswith(prefix.rstrip('/') + '/')
+                       or prefix.startswith(path.rstrip('/') + '/')
+                       for prefix in prefixes)
+
+        with self.lock:
+            for key in [key for key in self.entries if affected(key[1])]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "pending": len(self.pending), "max_entries": self.max_entries}
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class CacheWriter:
+    """寫入快取的暫存檔，完成後以 commit() 加入快取"""
+
+    def __init__(self, cache, key, tag=None):
+        self.cache = cache
+        self.key = key
+        self.tag = tag
+        self.temp_path = os.path.join(cache.directory, f".tmp-{uuid.uuid4().hex}")
+        self.file = open(self.temp_path, 'wb')
+        self.size = 0
+        self.done = False
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        if self.done:
+            return
+        self.done = True
+        self.file.close()
+        self.cache._commit(self.key, self.temp_path, self.size, self.tag)
+
+    def abort(self):
+        if self.done:
+            return
+        self.done = True
+        self.file.close()
+        self.cache._abort(self.key, self.temp_path)
+
+
+class DiskLRUCache:
+    """以磁碟儲存、依總大小限制的 LRU 快取"""
+
+    def __init__(self, directory, max_bytes, max_entry_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> size
+        self.tags = {}  # key -> 標記（例如 NAS 路徑），用於失效
+        self.pending = set()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """掃描快取目錄，依最後存取時間重建 LRU 順序"""
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-'):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+        with self.lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(*parts):
+        """由多個欄位產生快取鍵"""
+        return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """查詢快取，命中時回傳檔案路徑"""
+        with self.lock:
+            size = self.entries.get(key)
+            if size is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += size
+        path = self.path_for(key)
+        try:
+            # 更新存取時間，重啟後仍能保留 LRU 順序
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self._remove(key)
+            return None
+        return path
+
+    def writer(self, key, size=None, tag=None):
+        """取得寫入器；過大或已有其他請求寫入中則回傳 None"""
+        if size is not None and size > self.max_entry_bytes:
+            return None
+        with self.lock:
+            if key in self.entries or key in self.pending:
+                return None
+            self.pending.add(key)
+        return CacheWriter(self, key, tag)
+
+    def _commit(self, key, temp_path, size, tag):
+        with self.lock:
+            self.pending.discard(key)
+            if size > self.max_entry_bytes:
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, self.path_for(key))
+            self.entries[key] = size
+            self.total_bytes += size
+            if tag is not None:
+                self.tags[key] = tag
+            self._evict()
+
+    def _abort(self, key, temp_path):
+        with self.lock:
+            self.pending.discard(key)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def _remove(self, key):
+        size = self.entries.pop(key, None)
+        self.tags.pop(key, None)
+        if size is None:
+            return
+        self.total_bytes -= size
+        try:
+            os.remove(self.path_for(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate(self, match):
+        """移除標記符合條件的項目"""
+        with self.lock:
+            keys = [key for key, tag in self.tags.items() if match(tag)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def stats(self):
+        """快取統計"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,232 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# 轉送給 NAS 的請求標頭
+FORWARD_REQUEST_HEADERS = ('Range', 'If-Range')
+
+# 轉送回客戶端的回應標頭
+FORWARD_RESPONSE_HEADERS = (
+    'Content-Length', 'Content-Range', 'Accept-Ranges',
+    'ETag', 'Last-Modified', 'Content-Type', 'Content-Disposition'
+)
+
+
+class DownloadStream:
+    """NAS 下載串流：以固定大小分塊輸出，結束或關閉時釋放排程名額"""
+
+    def __init__(self, response, chunk_size, on_chunk=None, on_close=None):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            # 不解碼 Content-Encoding，確保位元組數與轉送的 Content-Length 一致
+            for chunk in self.response.raw.stream(self.chunk_size, decode_content=False):
+                if self.on_chunk:
+                    self.on_chunk(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.response.close()
+        if self.on_close:
+            self.on_close()
+
+
+def forward_request_headers(headers):
+    """挑出需轉送給 NAS 的請求標頭"""
+    forwarded = {'Accept-Encoding': 'identity'}
+    for name in FORWARD_REQUEST_HEADERS:
+        if headers.get(name):
+            forwarded[name] = headers[name]
+    return forwarded
+
+
+def forward_response_headers(response, file_name):
+    """挑出需轉送回客戶端的回應標頭"""
+    forwarded = {}
+    for name in FORWARD_RESPONSE_HEADERS:
+        if response.headers.get(name):
+            forwarded[name] = response.headers[name]
+    if 'Content-Disposition' not in forwarded:
+        forwarded['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(file_name)}"
+    forwarded.setdefault('Accept-Ranges', 'bytes')
+    return forwarded
+
+
+class TeeStream:
+    """將下載串流同時寫入磁碟快取，完整傳輸後才加入快取"""
+
+    def __init__(self, stream, writer, expected_size):
+        self.stream = stream
+        self.writer = writer
+        self.expected_size = expected_size
+
+    def __iter__(self):
+        completed = False
+        try:
+            for chunk in self.stream:
+                if self.writer:
+                    try:
+                        self.writer.write(chunk)
+                    except OSError:
+                        self.writer.abort()
+                        self.writer = None
+                yield chunk
+            completed = True
+        finally:
+            self._finish(completed)
+
+    def _finish(self, completed):
+        if not self.writer:
+            return
+        if completed and self.writer.size == self.expected_size:
+            self.writer.commit()
+        else:
+            self.writer.abort()
+
+    def close(self):
+        self.stream.close()
+        self._finish(False)
+
+
+class BufferBudget:
+    """所有平行下載共用的重組緩衝上限（位元組）
+
+    每個範圍送出前先保留其大小，輸出後才歸還；總量超過上限時暫停送出新的範圍。
+    沒有其他保留時一律允許，確保單一範圍大於上限時仍能前進。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def _fits(self, amount):
+        return self.used == 0 or self.used + amount <= self.max_bytes
+
+    def acquire(self, amount, blocking=True, timeout=None):
+        """保留 amount 位元組，成功回傳 True；非阻塞或逾時未取得時回傳 False"""
+        with self.cond:
+            if blocking:
+                if not self.cond.wait_for(lambda: self._fits(amount), timeout):
+                    return False
+            elif not self._fits(amount):
+                return False
+            self.used += amount
+            return True
+
+    def release(self, amount):
+        with self.cond:
+            self.used -= amount
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"used_bytes": self.used, "max_bytes": self.max_bytes}
+
+
+class ParallelRangeFetcher:
+    """以多條連線平行抓取檔案的位元組範圍，並依序重組成串流
+
+    同時進行的範圍數會依實測吞吐量在 min_workers 與 max_workers 之間調整；
+    已送出但尚未輸出的範圍數不超過 max_buffered_parts；若提供 budget（BufferBudget），
+    所有下載的重組緩衝總量也受其限制。本下載沒有任何已送出的範圍時才會阻塞等待 budget，
+    等待超過 budget_timeout 秒則中止下載。
+    """
+
+    def __init__(self, fetch_range, total_size, part_size, chunk_size,
+                 min_workers=2, max_workers=8, max_buffered_parts=16, adapt_every=4,
+                 budget=None, budget_timeout=None):
+        self.fetch_range = fetch_range
+        self.total_size = total_size
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers)
+        self.max_buffered_parts = max(max_buffered_parts, self.max_workers)
+        self.adapt_every = adapt_every
+        self.budget = budget
+        self.budget_timeout = budget_timeout
+        self.reserved = {}  # 已向 budget 保留的範圍 -> 位元組數
+        self.workers = min_workers
+        self.executor = None
+        self.closed = False
+
+    def _adapt(self, window_bytes, window_seconds, last_throughput):
+        """爬山法調整併發數：吞吐量提升就加一條連線，下降就減一條"""
+        throughput = window_bytes / max(window_seconds, 1e-6)
+        if last_throughput is not None:
+            if throughput > last_throughput * 1.1 and self.workers < self.max_workers:
+                self.workers += 1
+            elif throughput < last_throughput * 0.9 and self.workers > self.min_workers:
+                self.workers -= 1
+        return throughput
+
+    def __iter__(self):
+        num_parts = (self.total_size + self.part_size - 1) // self.part_size
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {}
+        next_submit = 0
+        next_yield = 0
+        last_throughput = None
+        window_bytes = 0
+        window_start = time.monotonic()
+        try:
+            while next_yield < num_parts:
+                in_flight = sum(1 for future in futures.values() if not future.done())
+                while (next_submit < num_parts and in_flight < self.workers
+                       and next_submit - next_yield < self.max_buffered_parts):
+                    start = next_submit * self.part_size
+                    end = min(start + self.part_size, self.total_size) - 1
+                    if self.budget is not None:
+                        waiting_for_first = next_submit == next_yield
+                        if not self.budget.acquire(end - start + 1, blocking=waiting_for_first,
+                                                   timeout=self.budget_timeout):
+                            if waiting_for_first:
+                                raise Exception("平行下載緩衝已滿，等待逾時")
+                            break
+                        self.reserved[next_submit] = end - start + 1
+                    futures[next_submit] = self.executor.submit(self.fetch_range, start, end)
+                    next_submit += 1
+                    in_flight += 1
+
+                part = next_yield
+                data = futures.pop(part).result()
+                next_yield += 1
+                for offset in range(0, len(data), self.chunk_size):
+                    yield data[offset:offset + self.chunk_size]
+                self._release(part)
+
+                window_bytes += len(data)
+                if next_yield % self.adapt_every == 0:
+                    now = time.monotonic()
+                    last_throughput = self._adapt(window_bytes, now - window_start, last_throughput)
+                    window_bytes = 0
+                    window_start = now
+        finally:
+            self.close()
+
+    def _release(self, part):
+        amount = self.reserved.pop(part, None)
+        if amount is not None:
+            self.budget.release(amount)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        # 尚未輸出的範圍（含已取消或仍在下載者）不再佔用緩衝額度
+        for part in list(self.reserved):
+            self._release(part)
@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+
+class InvalidTokenError(Exception):
+    """下載 token 無效或已過期"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def download_tokens_available():
+    """是否可簽發下載 token（已安裝 cryptography）"""
+    return AESGCM is not None
+
+
+class DownloadTokenSigner:
+    """簽發與驗證短效下載 token
+
+    token 自含所需資訊：路徑、使用者與到期時間以明文作為 AES-GCM 的附加驗證資料（AAD），
+    NAS 憑證則以 AES-GCM 加密；竄改任一部分都會使驗證失敗。驗證只需 CPU 運算，不依賴任何共用狀態，
+    設定相同 DOWNLOAD_TOKEN_SECRET 的其他 worker 行程（或重啟後的行程）都能驗證。
+    """
+
+    NONCE_SIZE = 12
+
+    def __init__(self, secret, ttl=300):
+        if AESGCM is None:
+            raise RuntimeError("伺服器未安裝 cryptography，無法簽發下載 token")
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        if not secret:
+            raise ValueError("下載 token 需要設定密鑰")
+        self.aead = AESGCM(hmac.new(secret, b'download-token-aead', hashlib.sha256).digest())
+        self.ttl = ttl
+
+    def issue(self, path, user, sid, syno_token, ttl=None):
+        """簽發下載 token"""
+        claims = json.dumps({
+            "p": path,
+            "u": user,
+            "e": int(time.time() + (ttl or self.ttl))
+        }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        credentials = json.dumps({"s": sid, "t": syno_token}, separators=(',', ':')).encode('utf-8')
+        nonce = os.urandom(self.NONCE_SIZE)
+        sealed = nonce + self.aead.encrypt(nonce, credentials, claims)
+        return f"{_b64encode(claims)}.{_b64encode(sealed)}"
+
+    def verify(self, token):
+        """驗證 token 並回傳內容 {path, user, expires_at, sid, syno_token}"""
+        try:
+            claims_text, sealed_text = token.split('.', 1)
+            claims = _b64decode(claims_text)
+            sealed = _b64decode(sealed_text)
+        except (ValueError, TypeError):
+            raise InvalidTokenError("下載 token 格式錯誤")
+
+        if len(sealed) <= self.NONCE_SIZE:
+            raise InvalidTokenError("下載 token 格式錯誤")
+        try:
+            credentials = self.aead.decrypt(sealed[:self.NONCE_SIZE], sealed[self.NONCE_SIZE:], claims)
+        except InvalidTag:
+            raise InvalidTokenError("下載 token 簽章無效")
+
+        payload = json.loads(claims.decode('utf-8'))
+        if payload["e"] < time.time():
+            raise InvalidTokenError("下載 token 已過期")
+        credentials = json.loads(credentials.decode('utf-8'))
+
+        return {
+            "path": payload["p"],
+            "user": payload["u"],
+            "expires_at": payload["e"],
+            "sid": credentials["s"],
+            "syno_token": credentials["t"]
+        }
@@ -0,0 +1,14 @@
+class NasApiError(Exception):
+    """NAS API 回傳失敗"""
+
+    def __init__(self, code, message=None):
+        self.code = code
+        super().__init__(message or f"NAS API 錯誤: {code}")
+
+
+class SchedulerBusyError(Exception):
+    """等待 NAS 呼叫名額逾時"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        super().__init__(f"NAS 呼叫排隊超過 {timeout} 秒，請稍後再試")
@@ -0,0 +1,47 @@
+import threading
+import time
+
+
+class ReadinessProbe:
+    """快取的就緒檢查
+
+    結果保留 ttl 秒（失敗結果保留 failure_ttl 秒，較快重試）；過期時只有一個請求實際執行檢查，
+    其餘同時到達的請求直接回傳上一次結果，不會對 NAS 造成併發探測。
+    """
+
+    def __init__(self, check, ttl=10, failure_ttl=2):
+        self.check = check
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.lock = threading.Lock()
+        self.result = None
+
+    def _expired(self, result):
+        if result is None:
+            return True
+        ttl = self.ttl if result["ready"] else self.failure_ttl
+        return time.time() - result["checked_at"] >= ttl
+
+    def get(self):
+        """回傳 (結果, 是否為快取)"""
+        result = self.result
+        if not self._expired(result):
+            return result, True
+        if not self.lock.acquire(blocking=result is None):
+            return result, True
+        try:
+            # 等待鎖的期間可能已由其他請求更新
+            if not self._expired(self.result):
+                return self.result, True
+            started = time.perf_counter()
+            try:
+                self.check()
+                result = {"ready": True}
+            except Exception as e:
+                result = {"ready": False, "error": str(e)}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["checked_at"] = time.time()
+            self.result = result
+            return result, False
+        finally:
+            self.lock.release()
@@ -0,0 +1,96 @@
+import json
+import re
+import sys
+import threading
+import time
+
+LEVELS = {
+    "DEBUG": 10,
+    "INFO": 20,
+    "WARNING": 30,
+    "ERROR": 40
+}
+
+# 欄位名稱（不分大小寫）符合時整個值遮蔽
+SENSITIVE_KEYS = {"sid", "_sid", "token", "syno_token", "synotoken", "x-syno-token",
+                  "password", "passwd", "secret"}
+
+# 字串中的查詢參數，例如下載連結裡的 _sid=...&SynoToken=...
+SENSITIVE_PARAM = re.compile(r'(?i)((?:_sid|sid|synotoken|syno_token|token|passwd|password)=)[^&\s"\']+')
+
+REDACTED = "***"
+
+
+def redact(value):
+    """遞迴遮蔽敏感欄位與字串中的敏感查詢參數"""
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in SENSITIVE_KEYS else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return SENSITIVE_PARAM.sub(r'\1' + REDACTED, value)
+    return value
+
+
+class StructuredLogger:
+    """分級的 JSON Lines 日誌
+
+    低於設定等級的事件在取樣與格式化之前就直接略過；data 可為函式，只在確定輸出時才呼叫。
+    sample_every 設定 {事件: N} 時，該事件每 N 次只輸出一次，並在紀錄中附上 sampled=N。
+    """
+
+    def __init__(self, level="INFO", stream=None, sample_every=None):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.context = None  # 回傳額外欄位（例如請求 ID）的函式
+        self.configure(level, stream, sample_every)
+
+    def configure(self, level="INFO", stream=None, sample_every=None):
+        self.level = LEVELS.get(str(level).upper(), LEVELS["INFO"])
+        self.stream = stream or sys.stdout
+        self.sample_every = dict(sample_every or {})
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def log(self, level, event, data=None):
+        if LEVELS[level] < self.level:
+            return
+        every = self.sample_every.get(event)
+        if every and every > 1:
+            with self.lock:
+                count = self.counts.get(event, 0)
+                self.counts[event] = count + 1
+            if count % every:
+                return
+
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        if every and every > 1:
+            record["sampled"] = every
+        if self.context is not None:
+            record.update(self.context() or {})
+        if callable(data):
+            data = data()
+        if data is not None:
+            record["data"] = redact(data)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def debug(self, event, data=None):
+        self.log("DEBUG", event, data)
+
+    def info(self, event, data=None):
+        self.log("INFO", event, data)
+
+    def warning(self, event, data=None):
+        self.log("WARNING", event, data)
+
+    def error(self, event, data=None):
+        self.log("ERROR", event, data)
+
+
+# 全域共用的日誌實例，啟動時由 server.py 依設定呼叫 configure()
+logger = StructuredLogger()
@@ -0,0 +1,194 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    account TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    isdir INTEGER NOT NULL,
+    size INTEGER,
+    mtime INTEGER,
+    PRIMARY KEY (account, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (account, parent);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (account, name);
+CREATE TABLE IF NOT EXISTS folders (
+    account TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (account, path)
+) WITHOUT ROWID;
+"""
+
+
+def _prefix_upper_bound(prefix):
+    """字串前綴範圍查詢的上界（不含）"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _subtree_bounds(path):
+    prefix = path.rstrip('/') + '/'
+    return prefix, _prefix_upper_bound(prefix)
+
+
+class MetadataIndex:
+    """以 SQLite 儲存的檔案中繼資料索引，資料依帳號區隔
+
+    folders 表記錄每個已索引資料夾在列表當下的 mtime，增量更新時只重新列出 mtime 改變的資料夾。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    # ============= 寫入 =============
+
+    def _delete_subtree(self, account, path):
+        low, high = _subtree_bounds(path)
+        self.conn.execute("DELETE FROM entries WHERE account = ? AND path >= ? AND path < ?", (account, low, high))
+        self.conn.execute("DELETE FROM folders WHERE account = ? AND path >= ? AND path < ?", (account, low, high))
+        self.conn.execute("DELETE FROM folders WHERE account = ? AND path = ?", (account, path))
+
+    def remove_subtree(self, account, path):
+        """移除資料夾本身及其下所有項目"""
+        with self.lock, self.conn:
+            self._delete_subtree(account, path)
+            self.conn.execute("DELETE FROM entries WHERE account = ? AND path = ?", (account, path))
+
+    def replace_folder(self, account, folder_path, folder_mtime, items):
+        """以新的列表結果取代資料夾內容，回傳尚未索引的子資料夾 [(path, mtime)]"""
+        rows = []
+        child_dirs = {}
+        for item in items:
+            additional = item.get('additional', {})
+            mtime = additional.get('time', {}).get('mtime')
+            isdir = bool(item.get('isdir'))
+            rows.append((account, item['path'], folder_path, item.get('name', ''), int(isdir),
+                         additional.get('size'), mtime))
+            if isdir:
+                child_dirs[item['path']] = mtime or 0
+
+        with self.lock, self.conn:
+            old_dirs = {row[0] for row in self.conn.execute(
+                "SELECT path FROM entries WHERE account = ? AND parent = ? AND isdir = 1", (account, folder_path))}
+            # 已消失的子資料夾連同整棵子樹一起移除
+            for path in old_dirs - set(child_dirs):
+                self._delete_subtree(account, path)
+            self.conn.execute("DELETE FROM entries WHERE account = ? AND parent = ?", (account, folder_path))
+            self.conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)",
+                              (account, folder_path, folder_mtime, time.time()))
+            indexed = {row[0] for row in self.conn.execute(
+                "SELECT path FROM folders WHERE account = ? AND path >= ? AND path < ?",
+                (account,) + _subtree_bounds(folder_path))}
+        return [(path, mtime) for path, mtime in child_dirs.items() if path not in indexed]
+
+    def invalidate(self, prefixes):
+        """路徑已在 NAS 上變更：移除其子樹，並讓父資料夾在下次更新時重新列出"""
+        with self.lock, self.conn:
+            for prefix in prefixes:
+                self.conn.execute("DELETE FROM entries WHERE path = ?", (prefix,))
+                low, high = _subtree_bounds(prefix)
+                self.conn.execute("DELETE FROM entries WHERE path >= ? AND path < ?", (low, high))
+                self.conn.execute("DELETE FROM folders WHERE path = ? OR (path >= ? AND path < ?)", (prefix, low, high))
+                parent = prefix.rsplit('/', 1)[0] or '/'
+                self.conn.execute("UPDATE folders SET mtime = -1 WHERE path = ?", (parent,))
+
+    # ============= 更新 =============
+
+    def folder_mtimes(self, account, root):
+        """root 及其下所有已索引資料夾的 mtime"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, mtime FROM folders WHERE account = ? AND (path = ? OR (path >= ? AND path < ?))",
+                (account, root) + _subtree_bounds(root)).fetchall()
+        return dict(rows)
+
+    def refresh(self, account, root, list_folder, get_mtimes, concurrency=4):
+        """建立或增量更新 root 以下的索引
+
+        list_folder(path) 回傳資料夾內容；get_mtimes(paths) 回傳 {path: mtime}，不存在的路徑不列出。
+        """
+        root = '/' + root.strip('/')
+        known = self.folder_mtimes(account, root)
+        stats = {"checked": len(known), "listed": 0, "removed": 0, "errors": 0}
+
+        if root not in known:
+            current = get_mtimes([root])
+            if root not in current:
+                raise FileNotFoundError(f"資料夾不存在: {root}")
+            todo = [(root, current[root])]
+        else:
+            current = get_mtimes(list(known))
+            todo = []
+            for path, old_mtime in known.items():
+                if path not in current:
+                    self.remove_subtree(account, path)
+                    stats["removed"] += 1
+                elif current[path] != old_mtime:
+                    todo.append((path, current[path]))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = {executor.submit(list_folder, path): (path, mtime) for path, mtime in todo}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, mtime = pending.pop(future)
+                    try:
+                        items = future.result()
+                    except Exception:
+                        stats["errors"] += 1
+                        continue
+                    stats["listed"] += 1
+                    # 新出現的子資料夾需要完整建立索引
+                    for child, child_mtime in self.replace_folder(account, path, mtime, items):
+                        pending[executor.submit(list_folder, child)] = (child, child_mtime)
+        return stats
+
+    # ============= 查詢 =============
+
+    @staticmethod
+    def _row_to_entry(row):
+        path, name, isdir, size, mtime = row
+        return {"path": path, "name": name, "isdir": bool(isdir), "size": size, "mtime": mtime}
+
+    def lookup(self, account, path):
+        """查詢單一路徑"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path, name, isdir, size, mtime FROM entries WHERE account = ? AND path = ?",
+                (account, path)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def search(self, account, query, mode='prefix', limit=100):
+        """前綴或子字串搜尋；前綴以 / 開頭時比對完整路徑，否則比對檔名"""
+        if mode == 'substring':
+            escaped = query.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+            sql = ("SELECT path, name, isdir, size, mtime FROM entries "
+                   "WHERE account = ? AND name LIKE ? ESCAPE '!' ORDER BY path LIMIT ?")
+            args = (account, f"%{escaped}%", limit)
+        else:
+            column = 'path' if query.startswith('/') else 'name'
+            sql = (f"SELECT path, name, isdir, size, mtime FROM entries "
+                   f"WHERE account = ? AND {column} >= ? AND {column} < ? ORDER BY path LIMIT ?")
+            args = (account, query, _prefix_upper_bound(query), limit)
+        with self.lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def stats(self, account):
+        """索引統計"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries WHERE account = ?", (account,)).fetchone()[0]
+            folders, last = self.conn.execute(
+                "SELECT COUNT(*), MAX(indexed_at) FROM folders WHERE account = ?", (account,)).fetchone()
+        return {"entries": entries, "folders": folders, "last_indexed_at": last}
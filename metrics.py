@@ -0,0 +1,97 @@
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """Prometheus 文字格式的計數器、直方圖與量測值
+
+    熱路徑上只做一次加鎖與字典更新；量測值（gauge）在抓取時才由回呼函式計算。
+    標籤以 ((名稱, 值), ...) 的 tuple 表示。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}    # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [各區間次數..., 總和, 次數]}
+        self.gauges = {}      # name -> 回呼函式，回傳 [(labels, value)]
+        self.help = {}        # name -> (類型, 說明)
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels=(), amount=1):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                counts = series[labels] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def gauge(self, name, text, collect):
+        """註冊量測值，collect() 回傳 [(labels, value)]"""
+        self.describe(name, 'gauge', text)
+        self.gauges[name] = collect
+
+    def render(self):
+        """輸出 Prometheus 文字格式"""
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {labels: list(counts) for labels, counts in series.items()}
+                          for name, series in self.histograms.items()}
+
+        lines = []
+
+        def header(name, default_kind):
+            kind, text = self.help.get(name, (default_kind, ''))
+            if text:
+                lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for name, series in sorted(counters.items()):
+            header(name, 'counter')
+            for labels, value in series.items():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for name, series in sorted(histograms.items()):
+            header(name, 'histogram')
+            for labels, counts in series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels, (("le", "+Inf"),))} {counts[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {counts[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {counts[-1]}')
+
+        for name, collect in sorted(self.gauges.items()):
+            try:
+                samples = collect()
+            except Exception:
+                continue
+            header(name, 'gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,658 @@
+import argparse
+import base64
+import fnmatch
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+
+from flask import Flask, request, jsonify, Response
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+# 1x1 PNG，作為縮圖回應
+THUMBNAIL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+# DSM 錯誤碼
+ERROR_UNKNOWN_API = 102
+ERROR_UNKNOWN_METHOD = 103
+ERROR_SID_NOT_FOUND = 119
+ERROR_AUTH_FAILED = 400
+ERROR_NO_SUCH_FILE = 408
+ERROR_FILE_EXISTS = 414
+ERROR_NO_SUCH_TASK = 599
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def parse_list(value):
+    """DSM 的路徑/ID 參數可為 JSON 陣列、JSON 字串或以逗號分隔的字串"""
+    if value is None:
+        return []
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return [item for item in value.split(',') if item]
+    if isinstance(parsed, list):
+        return [str(item) for item in parsed]
+    return [str(parsed)]
+
+
+def parse_value(value, default=None):
+    """單一參數可能以 JSON 編碼（例如 "\\"/home\\"" 或 true）"""
+    if value is None:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_error_spec(spec):
+    """解析 --error 參數：API[.method]=錯誤碼[:機率]，例如 SYNO.FileStation.Upload=418:0.1"""
+    key, _, value = spec.partition('=')
+    code, _, rate = value.partition(':')
+    if not key or not code:
+        raise ValueError(f"錯誤注入格式不正確: {spec}")
+    return key, (int(code), float(rate) if rate else 1.0)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不輸出每個請求的存取紀錄（嵌入測試或效能測試時使用）"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class DSMError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class MockDSM:
+    """本機模擬的 Synology DSM（entry.cgi 與 fbdownload），檔案存放於 root 目錄
+
+    - latency / jitter：每個請求固定延遲加上 0~jitter 的隨機延遲（秒）
+    - bandwidth：上傳與下載的每秒位元組上限，0 為不限制
+    - errors：{"API" 或 "API.method": (錯誤碼, 機率)}，依機率回傳 DSM 錯誤；
+      鍵為 "fbdownload" 時錯誤碼作為 HTTP 狀態碼
+    - task_duration：背景任務（刪除、複製、壓縮、搜尋等）回報完成前經過的秒數
+    - accounts：{帳號: 密碼}，None 時接受任何帳號密碼
+    """
+
+    def __init__(self, root=None, latency=0, jitter=0, bandwidth=0, errors=None,
+                 task_duration=1.0, accounts=None):
+        self.root = os.path.abspath(root or tempfile.mkdtemp(prefix="mock_dsm_"))
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.errors = dict(errors or {})
+        self.task_duration = task_duration
+        self.accounts = accounts
+        self.lock = threading.Lock()
+        self.sessions = {}  # sid -> {"account", "token"}
+        self.links = {}     # id -> 分享連結
+        self.tasks = {}     # taskid -> 任務
+        self.calls = Counter()
+        self.handlers = {
+            ("SYNO.API.Info", "query"): self.api_info,
+            ("SYNO.API.Auth", "login"): self.auth_login,
+            ("SYNO.API.Auth", "logout"): self.auth_logout,
+            ("SYNO.FileStation.List", "list"): self.list_folder,
+            ("SYNO.FileStation.List", "list_share"): self.list_share,
+            ("SYNO.FileStation.List", "getinfo"): self.get_info,
+            ("SYNO.FileStation.Upload", "upload"): self.upload,
+            ("SYNO.FileStation.CreateFolder", "create"): self.create_folder,
+            ("SYNO.FileStation.Delete", "start"): self.delete_start,
+            ("SYNO.FileStation.CopyMove", "start"): self.copy_move_start,
+            ("SYNO.FileStation.Compress", "start"): self.compress_start,
+            ("SYNO.FileStation.DirSize", "start"): self.dir_size_start,
+            ("SYNO.FileStation.Search", "start"): self.search_start,
+            ("SYNO.FileStation.Search", "list"): self.search_list,
+            ("SYNO.FileStation.Thumb", "get"): self.thumbnail,
+            ("SYNO.FileStation.Sharing", "list"): self.share_list,
+            ("SYNO.FileStation.Sharing", "create"): self.share_create,
+            ("SYNO.FileStation.Sharing", "edit"): self.share_edit,
+            ("SYNO.FileStation.Sharing", "delete"): self.share_delete,
+        }
+        self.task_apis = {"SYNO.FileStation.Delete", "SYNO.FileStation.CopyMove", "SYNO.FileStation.Compress",
+                          "SYNO.FileStation.DirSize", "SYNO.FileStation.Search"}
+        self.app = self.create_app()
+
+    # ============= 檔案系統 =============
+
+    def real_path(self, path):
+        """NAS 路徑轉為 root 底下的實際路徑，不允許跳出 root"""
+        real = os.path.normpath(os.path.join(self.root, str(path).lstrip('/')))
+        if real != self.root and not real.startswith(self.root + os.sep):
+            raise DSMError(ERROR_NO_SUCH_FILE)
+        return real
+
+    def file_info(self, path):
+        real = self.real_path(path)
+        st = os.stat(real)
+        isdir = os.path.isdir(real)
+        name = os.path.basename(path.rstrip('/')) or '/'
+        return {
+            "path": path,
+            "name": name,
+            "isdir": isdir,
+            "additional": {
+                "real_path": real,
+                "size": 0 if isdir else st.st_size,
+                "owner": {"user": "admin", "group": "users", "uid": 1024, "gid": 100},
+                "time": {"atime": int(st.st_atime), "mtime": int(st.st_mtime),
+                         "ctime": int(st.st_ctime), "crtime": int(st.st_ctime)},
+                "perm": {"posix": 777, "is_acl_mode": False, "acl": {"append": True, "del": True,
+                                                                      "exec": True, "read": True, "write": True}},
+                "type": "" if isdir else os.path.splitext(name)[1].lstrip('.').upper()
+            }
+        }
+
+    def seed(self, files=100, folders=10, file_size=4096):
+        """建立 /home/www 底下的範例檔案，方便手動測試"""
+        base = self.real_path("/home/www")
+        os.makedirs(base, exist_ok=True)
+        for index in range(folders):
+            os.makedirs(os.path.join(base, f"folder{index:03d}"), exist_ok=True)
+        for index in range(files):
+            folder = os.path.join(base, f"folder{index % folders:03d}") if folders else base
+            with open(os.path.join(folder, f"file{index:05d}.txt"), 'wb') as f:
+                f.write(os.urandom(file_size))
+
+    # ============= 請求處理 =============
+
+    def create_app(self):
+        app = Flask("mock_dsm")
+
+        @app.before_request
+        def inject_latency():
+            if request.path.startswith('/mock/'):
+                return None
+            delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay > 0:
+                time.sleep(delay)
+            return None
+
+        @app.route('/webapi/entry.cgi', methods=['GET', 'POST'])
+        def entry():
+            api = request.values.get('api', '')
+            method = request.values.get('method', '')
+            with self.lock:
+                self.calls[f"{api}.{method}"] += 1
+            try:
+                self.inject_error(api, method)
+                handler = self.handlers.get((api, method))
+                if handler is None:
+                    if method in ('status', 'stop', 'clean') and api in self.task_apis:
+                        handler = getattr(self, f"task_{method}")
+                    elif any(key[0] == api for key in self.handlers):
+                        raise DSMError(ERROR_UNKNOWN_METHOD)
+                    else:
+                        raise DSMError(ERROR_UNKNOWN_API)
+                if (api, method) not in (("SYNO.API.Info", "query"), ("SYNO.API.Auth", "login")):
+                    self.require_session()
+                result = handler()
+            except DSMError as e:
+                return jsonify({"success": False, "error": {"code": e.code}})
+            if isinstance(result, Response):
+                return result
+            return jsonify({"success": True, "data": result if result is not None else {}})
+
+        @app.route('/fbdownload/<path:name>', methods=['GET'])
+        def fbdownload(name):
+            with self.lock:
+                self.calls["fbdownload"] += 1
+            return self.download()
+
+        @app.route('/mock/config', methods=['GET', 'POST'])
+        def mock_config():
+            """執行中調整延遲、頻寬與錯誤注入"""
+            if request.method == 'POST':
+                data = request.get_json(silent=True) or {}
+                for key in ('latency', 'jitter', 'bandwidth', 'task_duration'):
+                    if key in data:
+                        setattr(self, key, data[key])
+                if 'errors' in data:
+                    self.errors = {key: (int(value[0]), float(value[1])) if isinstance(value, list)
+                                   else (int(value), 1.0) for key, value in data['errors'].items()}
+            return jsonify(self.settings())
+
+        @app.route('/mock/stats', methods=['GET'])
+        def mock_stats():
+            with self.lock:
+                return jsonify({"calls": dict(self.calls), "sessions": len(self.sessions),
+                                "links": len(self.links), "tasks": len(self.tasks), "root": self.root})
+
+        @app.route('/mock/reset', methods=['POST'])
+        def mock_reset():
+            """清除呼叫計數、登入狀態、分享連結與任務（不刪除檔案）"""
+            with self.lock:
+                self.calls.clear()
+                self.sessions.clear()
+                self.links.clear()
+                self.tasks.clear()
+            return jsonify({"success": True})
+
+        return app
+
+    def settings(self):
+        return {"latency": self.latency, "jitter": self.jitter, "bandwidth": self.bandwidth,
+                "task_duration": self.task_duration,
+                "errors": {key: list(value) for key, value in self.errors.items()}}
+
+    def inject_error(self, api, method):
+        for key in (f"{api}.{method}", api):
+            spec = self.errors.get(key)
+            if spec is not None and random.random() < spec[1]:
+                raise DSMError(spec[0])
+
+    def require_session(self):
+        sid = request.values.get('_sid')
+        token = request.headers.get('X-SYNO-TOKEN') or request.values.get('SynoToken')
+        with self.lock:
+            session = self.sessions.get(sid)
+        if session is None or (token is not None and token != session["token"]):
+            raise DSMError(ERROR_SID_NOT_FOUND)
+        return session
+
+    def throttle(self, nbytes):
+        if self.bandwidth and nbytes > 0:
+            time.sleep(nbytes / self.bandwidth)
+
+    # ============= SYNO.API =============
+
+    def api_info(self):
+        query = request.values.get('query', 'all')
+        apis = {"SYNO.API.Auth": {"path": "entry.cgi", "minVersion": 1, "maxVersion": 7},
+                "SYNO.FileStation.List": {"path": "entry.cgi", "minVersion": 1, "maxVersion": 2}}
+        if query != 'all':
+            apis = {name: value for name, value in apis.items() if name in query.split(',')}
+        return apis
+
+    def auth_login(self):
+        account = request.values.get('account', '')
+        password = request.values.get('passwd', '')
+        if not account or (self.accounts is not None and self.accounts.get(account) != password):
+            raise DSMError(ERROR_AUTH_FAILED)
+        sid = uuid.uuid4().hex
+        token = uuid.uuid4().hex[:16]
+        with self.lock:
+            self.sessions[sid] = {"account": account, "token": token}
+        return {"sid": sid, "synotoken": token, "did": "", "is_portal_port": False}
+
+    def auth_logout(self):
+        with self.lock:
+            self.sessions.pop(request.values.get('_sid'), None)
+        return None
+
+    # ============= SYNO.FileStation.List =============
+
+    def list_folder(self, folder_path=None):
+        folder_path = folder_path or parse_value(request.values.get('folder_path'), '/')
+        real = self.real_path(folder_path)
+        if not os.path.isdir(real):
+            raise DSMError(ERROR_NO_SUCH_FILE)
+        names = os.listdir(real)
+        sort_by = request.values.get('sort_by', 'name')
+        entries = [self.file_info(folder_path.rstrip('/') + '/' + name) for name in names]
+        if sort_by == 'size':
+            entries.sort(key=lambda item: item["additional"]["size"])
+        elif sort_by == 'mtime':
+            entries.sort(key=lambda item: item["additional"]["time"]["mtime"])
+        else:
+            entries.sort(key=lambda item: item["name"])
+        if request.values.get('sort_direction', 'ASC').upper() == 'DESC':
+            entries.reverse()
+        offset = int(request.values.get('offset', 0))
+        limit = int(request.values.get('limit', 0)) or len(entries)
+        return {"files": entries[offset:offset + limit], "total": len(entries), "offset": offset}
+
+    def list_share(self):
+        data = self.list_folder('/')
+        return {"shares": data["files"], "total": data["total"], "offset": data["offset"]}
+
+    def get_info(self):
+        files = []
+        for path in parse_list(request.values.get('path')):
+            if os.path.exists(self.real_path(path)):
+                files.append(self.file_info(path))
+            else:
+                files.append({"path": path, "name": os.path.basename(path), "code": ERROR_NO_SUCH_FILE})
+        return {"files": files}
+
+    # ============= 上傳與建立資料夾 =============
+
+    def upload(self):
+        if 'file' not in request.files:
+            raise DSMError(401)
+        upload = request.files['file']
+        folder = self.real_path(request.form.get('path', '/'))
+        if not os.path.isdir(folder):
+            if request.form.get('create_parents', 'false').lower() != 'true':
+                raise DSMError(ERROR_NO_SUCH_FILE)
+            os.makedirs(folder, exist_ok=True)
+        target = os.path.join(folder, os.path.basename(upload.filename))
+        overwrite = request.form.get('overwrite', 'false').lower() in ('true', 'overwrite')
+        if os.path.exists(target) and not overwrite:
+            raise DSMError(ERROR_FILE_EXISTS)
+        upload.save(target)
+        self.throttle(os.path.getsize(target))
+        return {"blSkip": False, "file": upload.filename, "pid": os.getpid(), "progress": 100}
+
+    def create_folder(self):
+        folder_paths = parse_list(request.values.get('folder_path'))
+        names = parse_list(request.values.get('name'))
+        if len(folder_paths) == 1 and len(names) > 1:
+            folder_paths = folder_paths * len(names)
+        force_parent = str(parse_value(request.values.get('force_parent'), False)).lower() == 'true'
+        folders = []
+        for folder_path, name in zip(folder_paths, names):
+            parent = self.real_path(folder_path)
+            if not os.path.isdir(parent) and not force_parent:
+                raise DSMError(ERROR_NO_SUCH_FILE)
+            path = folder_path.rstrip('/') + '/' + name
+            os.makedirs(self.real_path(path), exist_ok=True)
+            folders.append({"isdir": True, "name": name, "path": path})
+        return {"folders": folders}
+
+    # ============= 背景任務 =============
+
+    def start_task(self, api, **data):
+        task_id = f"FileStation_{uuid.uuid4().hex[:16]}"
+        with self.lock:
+            self.tasks[task_id] = dict(data, api=api, started=time.time())
+        return {"taskid": task_id}
+
+    def get_task(self):
+        task_id = str(parse_value(request.values.get('taskid'), ''))
+        with self.lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            raise DSMError(ERROR_NO_SUCH_TASK)
+        return task
+
+    def task_progress(self, task):
+        if self.task_duration <= 0:
+            return 1.0
+        return min(1.0, (time.time() - task["started"]) / self.task_duration)
+
+    def task_status(self):
+        task = self.get_task()
+        progress = self.task_progress(task)
+        data = {"finished": progress >= 1.0, "progress": round(progress, 3), "path": task.get("path", "")}
+        data.update(task.get("result", {}))
+        return data
+
+    def task_stop(self):
+        self.get_task()
+        return None
+
+    def task_clean(self):
+        task_id = str(parse_value(request.values.get('taskid'), ''))
+        with self.lock:
+            self.tasks.pop(task_id, None)
+        return None
+
+    def remove_path(self, path):
+        real = self.real_path(path)
+        if os.path.isdir(real):
+            shutil.rmtree(real)
+        elif os.path.exists(real):
+            os.remove(real)
+
+    def delete_start(self):
+        paths = parse_list(request.values.get('path'))
+        for path in paths:
+            self.remove_path(path)
+        return self.start_task("SYNO.FileStation.Delete", path=paths[-1] if paths else "",
+                               result={"processed_num": len(paths), "total": len(paths)})
+
+    def copy_move_start(self):
+        paths = parse_list(request.values.get('path'))
+        dest = self.real_path(parse_value(request.values.get('dest_folder_path'), '/'))
+        remove_src = request.values.get('remove_src', 'false').lower() == 'true'
+        overwrite = request.values.get('overwrite', 'false').lower() == 'true'
+        if not os.path.isdir(dest):
+            raise DSMError(ERROR_NO_SUCH_FILE)
+        processed = 0
+        for path in paths:
+            source = self.real_path(path)
+            if not os.path.exists(source):
+                raise DSMError(ERROR_NO_SUCH_FILE)
+            target = os.path.join(dest, os.path.basename(source))
+            if os.path.exists(target):
+                if not overwrite:
+                    continue
+                self.remove_path(os.path.relpath(target, self.root))
+            if remove_src:
+                shutil.move(source, target)
+            elif os.path.isdir(source):
+                shutil.copytree(source, target)
+            else:
+                shutil.copy2(source, target)
+            processed += 1
+        return self.start_task("SYNO.FileStation.CopyMove", path=paths[-1] if paths else "",
+                               result={"processed_num": processed, "total": len(paths)})
+
+    def compress_start(self):
+        paths = parse_list(request.values.get('path'))
+        dest_path = parse_value(request.values.get('dest_file_path'))
+        dest = self.real_path(dest_path)
+        if not os.path.isdir(os.path.dirname(dest)):
+            raise DSMError(ERROR_NO_SUCH_FILE)
+        with zipfile.ZipFile(dest, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for path in paths:
+                source = self.real_path(path)
+                if not os.path.exists(source):
+                    raise DSMError(ERROR_NO_SUCH_FILE)
+                base = os.path.dirname(source)
+                if os.path.isdir(source):
+                    for folder, _, names in os.walk(source):
+                        for name in names:
+                            full = os.path.join(folder, name)
+                            archive.write(full, os.path.relpath(full, base))
+                else:
+                    archive.write(source, os.path.basename(source))
+        return self.start_task("SYNO.FileStation.Compress", path=dest_path,
+                               result={"dest_file_path": dest_path})
+
+    def dir_size_start(self):
+        total_size = num_dir = num_file = 0
+        for path in parse_list(request.values.get('path')):
+            real = self.real_path(path)
+            if not os.path.exists(real):
+                raise DSMError(ERROR_NO_SUCH_FILE)
+            for folder, dirs, names in os.walk(real):
+                num_dir += len(dirs)
+                num_file += len(names)
+                total_size += sum(os.path.getsize(os.path.join(folder, name)) for name in names)
+        return self.start_task("SYNO.FileStation.DirSize",
+                               result={"total_size": total_size, "num_dir": num_dir, "num_file": num_file})
+
+    def search_start(self):
+        pattern = request.values.get('pattern', '') or '*'
+        if '*' not in pattern and '?' not in pattern:
+            pattern = f"*{pattern}*"
+        extension = (request.values.get('extension') or '').lower()
+        hits = []
+        for root in parse_list(request.values.get('folder_path')):
+            for folder, dirs, names in os.walk(self.real_path(root)):
+                for name in sorted(dirs + names):
+                    if not fnmatch.fnmatch(name.lower(), pattern.lower()):
+                        continue
+                    if extension and not name.lower().endswith('.' + extension):
+                        continue
+                    hits.append('/' + os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, '/'))
+        return self.start_task("SYNO.FileStation.Search", hits=hits)
+
+    def search_list(self):
+        task = self.get_task()
+        progress = self.task_progress(task)
+        available = task["hits"][:int(len(task["hits"]) * progress)]
+        offset = int(request.values.get('offset', 0))
+        limit = int(request.values.get('limit', 0)) or len(available)
+        files = [self.file_info(path) for path in available[offset:offset + limit]
+                 if os.path.exists(self.real_path(path))]
+        return {"files": files, "total": len(available), "offset": offset, "finished": progress >= 1.0}
+
+    # ============= 縮圖、分享連結與下載 =============
+
+    def thumbnail(self):
+        if not os.path.isfile(self.real_path(request.values.get('path', ''))):
+            raise DSMError(ERROR_NO_SUCH_FILE)
+        return Response(THUMBNAIL_PNG, mimetype='image/png')
+
+    def share_list(self):
+        with self.lock:
+            links = list(self.links.values())
+        offset = int(request.values.get('offset', 0))
+        limit = int(request.values.get('limit', 0)) or len(links)
+        return {"links": links[offset:offset + limit], "total": len(links), "offset": offset}
+
+    def share_options(self):
+        return {
+            "has_password": bool(request.values.get('password')),
+            "date_expired": parse_value(request.values.get('date_expired'), ""),
+            "date_available": parse_value(request.values.get('date_available'), "")
+        }
+
+    def share_create(self):
+        paths = parse_list(request.values.get('path'))
+        for path in paths:
+            if not os.path.exists(self.real_path(path)):
+                raise DSMError(ERROR_NO_SUCH_FILE)
+        links = []
+        for path in paths:
+            link_id = uuid.uuid4().hex[:9]
+            link = dict(self.share_options(), id=link_id, path=path, name=os.path.basename(path),
+                        url=f"{request.host_url}sharing/{link_id}", qrcode="", status="valid",
+                        isFolder=os.path.isdir(self.real_path(path)), link_owner="admin")
+            links.append(link)
+        with self.lock:
+            for link in links:
+                self.links[link["id"]] = link
+        return {"links": links, "has_folder": any(link["isFolder"] for link in links)}
+
+    def share_edit(self):
+        options = self.share_options()
+        with self.lock:
+            for link_id in parse_list(request.values.get('id')):
+                if link_id not in self.links:
+                    raise DSMError(ERROR_NO_SUCH_FILE)
+                self.links[link_id].update(options)
+        return None
+
+    def share_delete(self):
+        with self.lock:
+            for link_id in parse_list(request.values.get('id')):
+                self.links.pop(link_id, None)
+        return None
+
+    def download(self):
+        try:
+            self.require_session()
+        except DSMError:
+            return Response(status=403)
+        spec = self.errors.get("fbdownload")
+        if spec is not None and random.random() < spec[1]:
+            return Response(status=spec[0])
+        try:
+            path = bytes.fromhex(request.args.get('dlink', '').strip('"')).decode('utf-8')
+            real = self.real_path(path)
+        except (ValueError, DSMError):
+            return Response(status=404)
+        if not os.path.isfile(real):
+            return Response(status=404)
+
+        st = os.stat(real)
+        size = st.st_size
+        etag = f'"{size:x}-{int(st.st_mtime):x}"'
+        start, end, status = 0, size - 1, 200
+        range_header = request.headers.get('Range', '')
+        if_range = request.headers.get('If-Range')
+        if range_header.startswith('bytes=') and (if_range is None or if_range == etag):
+            first, _, last = range_header[6:].split(',')[0].partition('-')
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(0, size - int(last))
+            if start > end or start >= size:
+                return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+
+        def generate():
+            with open(real, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    self.throttle(len(chunk))
+                    yield chunk
+
+        headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Length": str(end - start + 1),
+                   "Content-Disposition": f'attachment; filename="{os.path.basename(real)}"'}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(generate(), status=status, mimetype='application/octet-stream', headers=headers)
+
+    # ============= 啟動 =============
+
+    def serve(self, host="127.0.0.1", port=5099, quiet=True):
+        """在背景執行緒啟動（port 為 0 時自動選擇），回傳 (server, NAS_BASE_URL)"""
+        server = make_server(host, port, self.app, threaded=True,
+                             request_handler=QuietRequestHandler if quiet else None)
+        threading.Thread(target=server.serve_forever, name="mock-dsm", daemon=True).start()
+        return server, f"http://{host}:{server.server_port}/webapi/entry.cgi"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機模擬的 Synology DSM，用於離線測試與效能測試")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--root", help="模擬 NAS 的檔案目錄（預設為暫存目錄）")
+    parser.add_argument("--seed", action="store_true", help="在 /home/www 建立範例檔案")
+    parser.add_argument("--latency", type=float, default=0, help="每個請求的固定延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="額外的隨機延遲上限（秒）")
+    parser.add_argument("--bandwidth", type=int, default=0, help="上傳/下載每秒位元組上限，0 為不限制")
+    parser.add_argument("--task-duration", type=float, default=1.0, help="背景任務完成所需秒數")
+    parser.add_argument("--error", action="append", default=[], metavar="API[.method]=CODE[:RATE]",
+                        help="錯誤注入，可重複指定，例如 SYNO.FileStation.Upload=418:0.1")
+    parser.add_argument("--account", action="append", default=[], metavar="USER:PASSWORD",
+                        help="允許的帳號，未指定時接受任何帳號密碼")
+    args = parser.parse_args()
+
+    accounts = dict(item.split(':', 1) for item in args.account) if args.account else None
+    mock = MockDSM(
+        root=args.root,
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        errors=dict(parse_error_spec(spec) for spec in args.error),
+        task_duration=args.task_duration,
+        accounts=accounts
+    )
+    os.makedirs(mock.real_path("/home/www"), exist_ok=True)
+    if args.seed:
+        mock.seed()
+
+    print("=== Mock DSM ===")
+    print(f"檔案目錄: {mock.root}")
+    print(f"NAS_BASE_URL=http://{args.host}:{args.port}/webapi/entry.cgi")
+    mock.app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
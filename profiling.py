@@ -0,0 +1,118 @@
+import cProfile
+import heapq
+import hmac
+import io
+import itertools
+import marshal
+import pstats
+import threading
+import time
+from collections import OrderedDict
+
+
+class RequestProfiler:
+    """以 cProfile 剖析單一請求
+
+    cProfile 只追蹤呼叫 start() 的執行緒；同時只允許一個請求被剖析，忙碌時 start() 回傳 None。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def start(self):
+        if not self.lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except Exception:
+            self.lock.release()
+            raise
+        return profile
+
+    def stop(self, profile):
+        try:
+            profile.disable()
+        finally:
+            self.lock.release()
+        return pstats.Stats(profile)
+
+
+class ProfileStore:
+    """保留最近 max_profiles 份剖析結果，可下載為 .prof（pstats 格式）或文字摘要"""
+
+    def __init__(self, max_profiles=20):
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    def save(self, profile_id, stats, info):
+        entry = dict(info, id=profile_id, created_at=time.time(), stats=stats)
+        with self.lock:
+            self.profiles[profile_id] = entry
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+        return profile_id
+
+    def list(self):
+        with self.lock:
+            entries = list(self.profiles.values())
+        return [{key: value for key, value in entry.items() if key != 'stats'}
+                for entry in reversed(entries)]
+
+    def get(self, profile_id):
+        with self.lock:
+            return self.profiles.get(profile_id)
+
+    @staticmethod
+    def dump(entry):
+        """pstats 可讀取的 .prof 內容（與 Stats.dump_stats 相同格式）"""
+        return marshal.dumps(entry['stats'].stats)
+
+    @staticmethod
+    def text(entry, limit=50):
+        """依累計時間排序的文字摘要"""
+        stream = io.StringIO()
+        pstats.Stats(stream=stream).add(entry['stats']).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+
+class SlowRequestLog:
+    """保留耗時最長的 N 個請求與其各階段耗時
+
+    以最小堆積維護，只有比目前第 N 名慢的請求才需要加鎖更新。
+    """
+
+    def __init__(self, size=50):
+        self.size = size
+        self.lock = threading.Lock()
+        self.heap = []
+        self.counter = itertools.count()
+
+    def record(self, duration, info):
+        if self.size <= 0:
+            return
+        if len(self.heap) >= self.size and duration <= self.heap[0][0]:
+            return
+        item = (duration, next(self.counter), dict(info, duration_ms=round(duration * 1000, 1), at=time.time()))
+        with self.lock:
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, item)
+            elif duration > self.heap[0][0]:
+                heapq.heapreplace(self.heap, item)
+
+    def slowest(self):
+        with self.lock:
+            items = sorted(self.heap, reverse=True)
+        return [info for _, _, info in items]
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+
+
+def token_matches(expected, provided):
+    """以固定時間比較管理 token；未設定 token 時一律不通過"""
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(str(expected).encode('utf-8'), str(provided).encode('utf-8'))
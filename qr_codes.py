@@ -0,0 +1,34 @@
+import base64
+from functools import lru_cache
+from io import BytesIO
+
+try:
+    import segno
+except ImportError:
+    segno = None
+
+QR_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+QR_MIN_SIZE = 64
+QR_MAX_SIZE = 1024
+QR_BORDER = 4
+
+
+def qr_available():
+    """是否可產生 QR code（已安裝 segno）"""
+    return segno is not None
+
+
+@lru_cache(maxsize=1024)
+def qr_data_uri(text, size=200, fmt="png"):
+    """產生 QR code 的 data URI，size 為最小邊長（像素）；相同參數直接回傳記憶的結果"""
+    if segno is None:
+        raise RuntimeError("伺服器未安裝 segno，無法產生 QR code")
+    qr = segno.make(text, error='m')
+    width = qr.symbol_size(scale=1, border=QR_BORDER)[0]
+    buffer = BytesIO()
+    qr.save(buffer, kind=fmt, scale=max(1, -(-size // width)), border=QR_BORDER)
+    return f"data:{QR_FORMATS[fmt]};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
@@ -1,63 +1,194 @@
-from flask import request, jsonify, send_from_directory
+from flask import request, jsonify, send_from_directory, send_file, Response, g
 import datetime
 import time
 import json
-from io import BytesIO
-import os
+import uuid
+import threading
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from download_proxy import forward_response_headers, TeeStream
+from zip_stream import stream_zip, COMPRESSION_MODES
+from download_tokens import InvalidTokenError
+from errors import NasApiError, SchedulerBusyError
+from scheduler import PRIORITY_BULK
+from tree_walk import walk_tree
+from delta_snapshots import entry_fingerprint
+from disk_cache import DiskLRUCache
+from logger import logger
+from tracing import tracer, server_timing
+from profiling import ProfileStore, token_matches
+from qr_codes import qr_available, qr_data_uri, QR_FORMATS, QR_MIN_SIZE, QR_MAX_SIZE
+
+THUMBNAIL_SIZES = ('small', 'medium', 'large')
 
 def register_routes(app, session_manager, requests_session, config, utils):
     """註冊所有路由"""
     
+    # 進行中的目錄走訪 walk_id -> (擁有者, 取消事件)
+    active_walks = {}
+    
+    # 中繼資料索引更新狀態 (擁有者, 根路徑) -> 狀態
+    index_refreshes = {}
+    index_refreshes_lock = threading.Lock()
+    
+    # ============= 請求指標與追蹤 =============
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        # 沿用客戶端或前端代理帶入的 X-Request-ID，否則產生新的
+        g.trace = tracer.start_trace(
+            request.headers.get('X-Request-ID'),
+            f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}",
+            {"http.method": request.method, "http.target": request.path}
+        )
+        g.request_id = g.trace.request_id
+        # 管理者以 X-Profile 標頭或 _profile 參數帶入 token 時剖析此請求
+        g.profile = None
+        profile_token = request.headers.get('X-Profile') or request.args.get('_profile')
+        if utils.profiler is not None and profile_token:
+            if not token_matches(config.PROFILING_ADMIN_TOKEN, profile_token):
+                g.profile_status = "denied"
+            else:
+                g.profile = utils.profiler.start()
+                g.profile_status = "busy" if g.profile is None else uuid.uuid4().hex
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        labels = (("route", route), ("method", request.method))
+        utils.metrics.inc('dsm_http_requests_total', labels + (("status", str(response.status_code)),))
+        if response.status_code >= 500:
+            utils.metrics.inc('dsm_http_request_errors_total', labels)
+        
+        trace = g.get('trace')
+        if trace is not None:
+            response.headers['X-Request-ID'] = trace.request_id
+            if trace.recording and config.TRACING_SERVER_TIMING:
+                response.headers['Server-Timing'] = server_timing(trace, time.perf_counter() - started)
+        profile = g.get('profile')
+        profile_status = g.get('profile_status')
+        if profile_status:
+            # 剖析編號先行回傳，剖析在回應傳送完畢後才存入
+            response.headers['X-Profile-Id'] = profile_status
+        # 回應關閉時請求上下文可能已結束，先取出需要的欄位
+        info = {
+            "request_id": trace.request_id if trace is not None else None,
+            "method": request.method,
+            "route": route,
+            "path": request.path,
+            "status": response.status_code
+        }
+        
+        def record_duration():
+            duration = time.perf_counter() - started
+            utils.metrics.observe('dsm_http_request_duration_seconds', labels, duration)
+            if profile is not None:
+                utils.profile_store.save(profile_status, utils.profiler.stop(profile),
+                                         dict(info, duration_ms=round(duration * 1000, 1)))
+            if utils.slow_requests is not None:
+                timings = {}
+                if trace is not None and trace.recording:
+                    timings = {name: {"count": count, "duration_ms": round(total * 1000, 1)}
+                               for name, (count, total) in trace.timings().items()}
+                utils.slow_requests.record(duration, dict(info, timings=timings))
+            if trace is not None:
+                tracer.finish_trace(trace, {"http.route": route, "http.status_code": response.status_code},
+                                    error=response.status_code >= 500)
+        
+        # 一般回應在傳送完畢、關閉時才記錄耗時；直通回應（檔案、下載串流）不會觸發 on_close，只記錄到開始傳送
+        if response.direct_passthrough:
+            record_duration()
+        else:
+            response.call_on_close(record_duration)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus 格式的指標"""
+        return Response(utils.metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    # ============= 剖析（管理者） =============
+    
+    def admin_error_response():
+        """未啟用剖析或管理 token 不符時的回應，通過檢查則回傳 None"""
+        if utils.profiler is None:
+            return jsonify({"success": False, "error": "未啟用剖析功能"}), 404
+        if not token_matches(config.PROFILING_ADMIN_TOKEN, request.headers.get('X-Admin-Token')):
+            return jsonify({"success": False, "error": "管理 token 錯誤"}), 403
+        return None
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def list_profiles():
+        """列出已儲存的剖析結果"""
+        error = admin_error_response()
+        if error:
+            return error
+        return jsonify({"success": True, "data": {"profiles": utils.profile_store.list()}})
+
+    @app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+    def download_profile(profile_id):
+        """下載剖析結果：format=prof（pstats 檔案，預設）或 text（依累計時間排序的摘要）"""
+        error = admin_error_response()
+        if error:
+            return error
+        entry = utils.profile_store.get(profile_id)
+        if entry is None:
+            return jsonify({"success": False, "error": "剖析結果不存在或已被清除"}), 404
+        if request.args.get('format') == 'text':
+            limit = request.args.get('limit', 50, type=int)
+            return Response(ProfileStore.text(entry, limit), mimetype='text/plain')
+        return Response(
+            ProfileStore.dump(entry),
+            mimetype='application/octet-stream',
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'}
+        )
+
+    @app.route('/api/admin/slow-requests', methods=['GET'])
+    def slow_requests():
+        """最慢的 N 個請求與各階段耗時"""
+        error = admin_error_response()
+        if error:
+            return error
+        return jsonify({"success": True, "data": {"requests": utils.slow_requests.slowest()}})
+
+    @app.route('/api/admin/slow-requests/clear', methods=['POST'])
+    def clear_slow_requests():
+        error = admin_error_response()
+        if error:
+            return error
+        utils.slow_requests.clear()
+        return jsonify({"success": True, "message": "已清除"})
+    
     # ============= 健康檢查路由 =============
     
     @app.route('/health', methods=['GET'])
     def health_check():
-        """健康檢查端點"""
+        """健康檢查端點（存活探測）：只讀取記憶體中的狀態，不讀檔也不呼叫 NAS"""
         try:
-            # 檢查系統狀態
-            sessions_info = session_manager.get_all_sessions_info()
-            active_sessions = len([s for s in sessions_info if not s['is_expired']])
-            
-            # 檢查配置檔案
-            config_status = "OK"
-            try:
-                with open("config.json", "r", encoding="utf-8") as f:
-                    json.load(f)
-            except:
-                config_status = "ERROR"
-            
-            # 檢查 session 檔案
-            session_file_status = "OK"
-            try:
-                if os.path.exists(config.SESSION_FILE):
-                    with open(config.SESSION_FILE, "r", encoding="utf-8") as f:
-                        json.load(f)
-                else:
-                    session_file_status = "NOT_FOUND"
-            except:
-                session_file_status = "ERROR"
-            
             health_data = {
                 "status": "healthy",
                 "timestamp": datetime.datetime.now().isoformat(),
                 "version": "2.0.0",
                 "uptime": "運行中",
                 "system_checks": {
-                    "config_file": config_status,
-                    "session_file": session_file_status,
+                    # 設定檔在啟動時已載入；session 檔案為最近一次讀寫的結果
+                    "config_file": "OK",
+                    "session_file": session_manager.file_status,
                     "nas_base_url": config.NAS_BASE_URL,
                     "session_expire_days": config.SESSION_EXPIRE_DAYS
                 },
-                "session_stats": {
-                    "total_sessions": len(sessions_info),
-                    "active_sessions": active_sessions,
-                    "expired_sessions": len(sessions_info) - active_sessions
-                },
+                "session_stats": session_manager.session_stats(config.HEALTH_SESSION_STATS_TTL),
                 "services": {
                     "flask": "running",
                     "session_manager": "running",
                     "requests_session": "running"
-                }
+                },
+                "scheduler": utils.scheduler.stats()
             }
             
             return jsonify(health_data), 200
@@ -69,14 +200,29 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "error": str(e)
             }), 500
 
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        """就緒探測：確認 NAS 可連線，結果依 HEALTH.READY_TTL 快取"""
+        result, cached = utils.readiness.get()
+        ready = result["ready"] and session_manager.file_status != "ERROR"
+        data = {
+            "status": "ready" if ready else "not_ready",
+            "timestamp": datetime.datetime.now().isoformat(),
+            "cached": cached,
+            "checks": {
+                "nas": dict(result, checked_at=datetime.datetime.fromtimestamp(result["checked_at"]).isoformat()),
+                "session_file": session_manager.file_status
+            }
+        }
+        return jsonify(data), 200 if ready else 503
+
     # ============= 主頁和應用程式路由 =============
     
     @app.route('/', methods=['GET'])
     def index():
         """API文檔首頁"""
         # 獲取系統統計資訊
-        sessions_info = session_manager.get_all_sessions_info()
-        active_sessions = len([s for s in sessions_info if not s['is_expired']])
+        session_stats = session_manager.session_stats(config.HEALTH_SESSION_STATS_TTL)
         
         api_docs = {
             "title": "DSM Flask API Server",
@@ -84,8 +230,8 @@ def register_routes(app, session_manager, requests_session, config, utils):
             "version": "2.0.0",
             "author": "yimang",
             "system_info": {
-                "total_sessions": len(sessions_info),
-                "active_sessions": active_sessions,
+                "total_sessions": session_stats["total_sessions"],
+                "active_sessions": session_stats["active_sessions"],
                 "session_file": config.SESSION_FILE,
                 "session_expire_days": config.SESSION_EXPIRE_DAYS
             },
@@ -95,7 +241,13 @@ def register_routes(app, session_manager, requests_session, config, utils):
             },
             "endpoints": {
                 "System": {
-                    "GET /health": "系統健康檢查",
+                    "GET /health": "系統健康檢查（存活探測，不讀檔、不呼叫 NAS）",
+                    "GET /ready": "就緒探測 - 確認 NAS 可連線（結果快取）",
+                    "GET /metrics": "Prometheus 格式指標（請求數、錯誤數、延遲直方圖、連線池與傳輸量）",
+                    "GET /api/admin/profiles": "列出剖析結果（需 X-Admin-Token）",
+                    "GET /api/admin/profiles/<profile_id>": "下載剖析結果 - ?format=prof|text",
+                    "GET /api/admin/slow-requests": "最慢請求與各階段耗時",
+                    "POST /api/admin/slow-requests/clear": "清除最慢請求紀錄",
                     "GET /": "API 總覽文件",
                     "GET /app": "網頁應用程式"
                 },
@@ -106,15 +258,44 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 },
                 "File Management": {
                     "GET /api/files": "列出檔案和資料夾 - ?path=/home/www",
+                    "GET /api/files/delta": "增量列表（回傳游標，帶上次游標只回傳差異）- ?path=&cursor=",
+                    "GET /api/walk": "遞迴列出目錄樹（NDJSON 串流）- ?path=&max_depth=&pattern=&exclude=",
+                    "POST /api/walk/<walk_id>/cancel": "取消進行中的目錄走訪",
+                    "GET /api/search": "搜尋檔名（NDJSON 串流）- ?folder_path=&pattern=&extension=&size_from=&size_to=&mtime_from=&mtime_to=&limit=",
+                    "POST /api/dirsize": "查詢資料夾大小（依 mtime 快取）- {paths: [], wait?}",
                     "POST /api/upload": "上傳檔案 - FormData{file, path, overwrite}",
-                    "POST /api/create-folder": "建立新資料夾 - {folder_path, name}",
+                    "POST /api/create-folder": "建立新資料夾 - {folder_path, name}（可為陣列）或 {paths: []} 建立整棵目錄樹",
                     "POST /api/delete": "刪除檔案/資料夾 - {paths: []}",
-                    "GET /api/download": "取得下載連結 - ?path=/path/to/file"
+                    "POST /api/copy": "在 NAS 上複製檔案/資料夾 - {paths: [], dest_folder_path, overwrite?}",
+                    "POST /api/move": "在 NAS 上移動檔案/資料夾 - {paths: [], dest_folder_path, overwrite?}",
+                    "GET /api/download": "取得下載連結 - ?path=/path/to/file&mode=proxy(選用，由伺服器提供檔案)",
+                    "GET /api/download/stream": "由伺服器串流下載檔案（支援 Range）- ?path=/path/to/file&parallel=true(選用，平行範圍下載)",
+                    "GET /api/dl/<token>": "以 /api/download 簽發的短效 token 下載檔案（免 session）",
+                    "POST /api/download/batch": "批次取得下載連結 - {paths: []}",
+                    "GET /api/download/cache": "下載快取統計（命中率、節省位元組、淘汰次數）",
+                    "GET /api/thumbnail": "取得縮圖 - ?path=&size=small|medium|large&mtime=(選用，帶入後可長期快取)",
+                    "POST /api/thumbnails": "批次取得縮圖（base64 data URI）- {paths: [], size?}",
+                    "POST /api/download/zip": "即時打包多個檔案/資料夾為 ZIP 串流 - {paths, compression?, name?}"
                 },
                 "Advanced Features": {
-                    "POST /api/share": "建立分享連結 - {paths, password?, date_expired?, date_available?}",
+                    "POST /api/share": "建立分享連結（未設密碼或期限時重用既有連結）- {paths, password?, date_expired?, date_available?, reuse?, qr?, qr_size?, qr_format?}",
+                    "POST /api/share/bulk": "為大量路徑建立分享連結，回傳逐項結果 - {paths, password?, date_expired?, date_available?, reuse?, qr?, qr_size?, qr_format?}",
+                    "GET /api/share/list": "列出分享連結 - ?refresh=true(選用，略過快取)",
+                    "POST /api/share/edit": "修改分享連結 - {ids: [], password?, date_expired?, date_available?}",
+                    "POST /api/share/delete": "刪除分享連結 - {ids: []}",
                     "POST /api/compress": "壓縮檔案 - {source_paths, dest_path, options?}"
                 },
+                "Index": {
+                    "GET /api/index": "本機中繼資料索引統計與更新狀態",
+                    "POST /api/index/refresh": "建立或增量更新索引 - {path, wait?}",
+                    "GET /api/index/search": "在索引中搜尋 - ?q=&mode=prefix|substring&limit=",
+                    "GET /api/index/info": "以索引查詢路徑資訊 - ?path=（可重複）"
+                },
+                "Tasks": {
+                    "GET /api/tasks": "列出背景任務（刪除、壓縮等）",
+                    "GET /api/tasks/<task_id>": "查詢背景任務進度",
+                    "GET /api/tasks/<task_id>/events": "以 SSE 推送背景任務進度"
+                },
                 "Debug": {
                     "GET /api/sessions": "檢視所有 sessions (調試用)"
                 }
@@ -153,7 +334,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
             result = utils.nas_login(data['account'], data['password'])
             return jsonify(result)
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
 
     @app.route('/api/status', methods=['GET'])
     def status():
@@ -191,7 +372,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "sessions": sessions_info
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
 
     @app.route('/api/files', methods=['GET'])
     def list_files():
@@ -222,7 +403,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             headers = {"X-SYNO-TOKEN": user_session['syno_token']}
             
-            response = requests_session.get(config.NAS_BASE_URL, params=params, headers=headers)
+            response = utils.nas_request('get', utils.get_user_key(user_session), params=params, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -235,7 +416,342 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "data": result["data"]
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
+
+    @app.route('/api/files/delta', methods=['GET'])
+    def list_files_delta():
+        """增量列表：帶上次的游標時只回傳新增、刪除與修改的項目"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            path = '/' + request.args.get('path', '/home/www').strip('/')
+            cursor = request.args.get('cursor')
+            user_session = utils.get_user_session()
+            owner = utils.get_user_key(user_session)
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            items = {}
+            for item in utils.iter_folder(user_session, path, additional=('size', 'time', 'type')):
+                items[item['name']] = item
+            fingerprints = {name: entry_fingerprint(item) for name, item in items.items()}
+            
+            def entry(item):
+                additional = item.get('additional', {})
+                return {
+                    "path": item.get('path'),
+                    "name": item.get('name'),
+                    "isdir": bool(item.get('isdir')),
+                    "size": additional.get('size'),
+                    "mtime": additional.get('time', {}).get('mtime')
+                }
+            
+            store = utils.snapshot_store
+            previous = store.get(cursor, owner, path) if cursor else None
+            if previous is None:
+                # 游標未知或已淘汰：回傳完整列表，客戶端應以此取代本地狀態
+                added, removed, modified = list(items), [], []
+            else:
+                added, removed, modified = store.diff(previous, fingerprints)
+            
+            return jsonify({
+                "success": True,
+                "data": {
+                    "path": path,
+                    "cursor": store.save(owner, path, fingerprints),
+                    "reset": previous is None,
+                    "added": [entry(items[name]) for name in added],
+                    "modified": [entry(items[name]) for name in modified],
+                    "removed": [path.rstrip('/') + '/' + name for name in removed],
+                    "total": len(items)
+                }
+            })
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"獲取檔案列表失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/walk', methods=['GET'])
+    def walk_files():
+        """遞迴列出整棵目錄樹，以 NDJSON 串流輸出"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            path = request.args.get('path', '/home/www')
+            max_depth = request.args.get('max_depth', type=int)
+            include = request.args.getlist('pattern')
+            exclude = request.args.getlist('exclude')
+            concurrency = min(max(request.args.get('concurrency', config.WALK_CONCURRENCY, type=int), 1),
+                              config.WALK_CONCURRENCY)
+            user_session = utils.get_user_session()
+            owner = utils.get_user_key(user_session)
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            def list_folder(folder):
+                return list(utils.iter_folder(user_session, folder, additional=('size', 'time', 'type'),
+                                              priority=PRIORITY_BULK))
+            
+            walk_id = uuid.uuid4().hex
+            cancel_event = threading.Event()
+            
+            def generate():
+                entries = 0
+                errors = 0
+                # 在產生器內登記：客戶端在第一個區塊前就中斷時產生器不會執行，也就不會留下登記
+                active_walks[walk_id] = (owner, cancel_event)
+                try:
+                    yield json.dumps({"type": "start", "walk_id": walk_id, "path": path}, ensure_ascii=False) + "\n"
+                    for kind, item in walk_tree(list_folder, path, max_depth, include, exclude,
+                                                concurrency, cancel_event):
+                        if kind == "error":
+                            errors += 1
+                            yield json.dumps({"type": "error", **item}, ensure_ascii=False) + "\n"
+                            continue
+                        entries += 1
+                        additional = item.get('additional', {})
+                        yield json.dumps({
+                            "type": "entry",
+                            "path": item.get('path'),
+                            "name": item.get('name'),
+                            "isdir": bool(item.get('isdir')),
+                            "depth": item['depth'],
+                            "size": additional.get('size'),
+                            "mtime": additional.get('time', {}).get('mtime')
+                        }, ensure_ascii=False) + "\n"
+                    yield json.dumps({
+                        "type": "done",
+                        "entries": entries,
+                        "errors": errors,
+                        "cancelled": cancel_event.is_set()
+                    }) + "\n"
+                finally:
+                    # 客戶端中斷連線時也會走到這裡，停止尚未開始的列表呼叫
+                    cancel_event.set()
+                    active_walks.pop(walk_id, None)
+            
+            return Response(generate(), mimetype='application/x-ndjson')
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/walk/<walk_id>/cancel', methods=['POST'])
+    def cancel_walk(walk_id):
+        """取消進行中的目錄走訪"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        walk = active_walks.get(walk_id)
+        if walk is None or walk[0] != utils.get_user_key(utils.get_user_session()):
+            return jsonify({"success": False, "error": "走訪不存在或已結束"}), 404
+        
+        walk[1].set()
+        return jsonify({"success": True, "message": "已取消走訪"})
+
+    @app.route('/api/search', methods=['GET'])
+    def search_files():
+        """以 SYNO.FileStation.Search 搜尋檔名，邊搜尋邊以 NDJSON 串流結果"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            folder_path = request.args.get('folder_path', '/home/www')
+            limit = min(request.args.get('limit', config.SEARCH_MAX_RESULTS, type=int), config.SEARCH_MAX_RESULTS)
+            search_params = {
+                "folder_path": json.dumps(folder_path),
+                "recursive": request.args.get('recursive', 'true').lower(),
+                "filetype": request.args.get('filetype', 'all')
+            }
+            # 選用的篩選條件原樣轉給 NAS（大小以位元組、時間以 Unix 秒為單位）
+            for name in ('pattern', 'extension', 'size_from', 'size_to', 'mtime_from', 'mtime_to'):
+                if request.args.get(name):
+                    search_params[name] = request.args[name]
+            if 'pattern' not in search_params and 'extension' not in search_params:
+                return jsonify({"success": False, "error": "請提供pattern或extension"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            results = utils.iter_search_results(user_session, search_params, limit=limit)
+            
+            def generate():
+                found = 0
+                try:
+                    yield json.dumps({"type": "start", "folder_path": folder_path}, ensure_ascii=False) + "\n"
+                    for item in results:
+                        found += 1
+                        additional = item.get('additional', {})
+                        yield json.dumps({
+                            "type": "entry",
+                            "path": item.get('path'),
+                            "name": item.get('name'),
+                            "isdir": bool(item.get('isdir')),
+                            "size": additional.get('size'),
+                            "mtime": additional.get('time', {}).get('mtime')
+                        }, ensure_ascii=False) + "\n"
+                    yield json.dumps({"type": "done", "results": found, "truncated": found >= limit}) + "\n"
+                except Exception as e:
+                    yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+                finally:
+                    # 客戶端中斷連線時關閉搜尋，讓 NAS 任務被停止並清除
+                    results.close()
+            
+            return Response(generate(), mimetype='application/x-ndjson')
+        except Exception as e:
+            return exception_response(e)
+
+    # ============= 中繼資料索引路由 =============
+    
+    def index_disabled_response():
+        return jsonify({"success": False, "error": "未啟用中繼資料索引"}), 404
+
+    def run_index_refresh(user_session, owner, root, state):
+        def list_folder(folder):
+            return list(utils.iter_folder(user_session, folder, additional=('size', 'time'),
+                                          priority=PRIORITY_BULK))
+        
+        try:
+            state["stats"] = utils.metadata_index.refresh(
+                owner, root, list_folder,
+                lambda paths: utils.get_mtimes(user_session, paths),
+                concurrency=config.INDEX_CONCURRENCY
+            )
+            state["status"] = "finished"
+        except Exception as e:
+            state["status"] = "error"
+            state["error"] = str(e)
+        finally:
+            state["finished_at"] = time.time()
+
+    @app.route('/api/index/refresh', methods=['POST'])
+    def refresh_index():
+        """建立或增量更新中繼資料索引（只重新列出 mtime 改變的資料夾）"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        if utils.metadata_index is None:
+            return index_disabled_response()
+        
+        data = request.get_json(silent=True) or {}
+        root = '/' + data.get('path', '/home/www').strip('/')
+        user_session = utils.get_user_session()
+        owner = utils.get_user_key(user_session)
+        
+        # 更新最後活動時間
+        session_manager.update_last_activity()
+        
+        with index_refreshes_lock:
+            state = index_refreshes.get((owner, root))
+            if state is not None and state["status"] == "running":
+                return jsonify({"success": True, "message": "索引更新進行中", "data": state}), 202
+            state = {"path": root, "status": "running", "started_at": time.time(),
+                     "finished_at": None, "stats": None, "error": None}
+            index_refreshes[(owner, root)] = state
+        
+        worker = threading.Thread(target=run_index_refresh, args=(user_session, owner, root, state),
+                                  name=f"index-refresh-{owner}", daemon=True)
+        worker.start()
+        if data.get('wait'):
+            worker.join()
+            if state["status"] == "error":
+                return jsonify({"success": False, "error": state["error"], "data": state}), 500
+            return jsonify({"success": True, "message": "索引更新完成", "data": state})
+        return jsonify({"success": True, "message": "索引更新已啟動", "data": state}), 202
+
+    @app.route('/api/index', methods=['GET'])
+    def index_status():
+        """中繼資料索引統計與更新狀態"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        if utils.metadata_index is None:
+            return jsonify({"success": True, "enabled": False})
+        
+        owner = utils.get_user_key(utils.get_user_session())
+        with index_refreshes_lock:
+            refreshes = [state for (key, _), state in index_refreshes.items() if key == owner]
+        return jsonify({
+            "success": True,
+            "enabled": True,
+            "data": utils.metadata_index.stats(owner),
+            "refreshes": refreshes
+        })
+
+    @app.route('/api/index/search', methods=['GET'])
+    def index_search():
+        """在本機索引中以前綴或子字串搜尋"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        if utils.metadata_index is None:
+            return index_disabled_response()
+        
+        query = request.args.get('q', '')
+        mode = request.args.get('mode', 'prefix')
+        if not query:
+            return jsonify({"success": False, "error": "請提供q"}), 400
+        if mode not in ('prefix', 'substring'):
+            return jsonify({"success": False, "error": f"不支援的搜尋模式: {mode}"}), 400
+        limit = min(request.args.get('limit', 100, type=int), config.INDEX_SEARCH_MAX_RESULTS)
+        
+        owner = utils.get_user_key(utils.get_user_session())
+        results = utils.metadata_index.search(owner, query, mode, limit)
+        return jsonify({
+            "success": True,
+            "data": {"files": results, "total": len(results), "truncated": len(results) >= limit}
+        })
+
+    @app.route('/api/index/info', methods=['GET'])
+    def index_info():
+        """以本機索引查詢路徑資訊（類似 getinfo，不存在的路徑回傳 code 408）"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        if utils.metadata_index is None:
+            return index_disabled_response()
+        
+        paths = request.args.getlist('path')
+        if not paths:
+            return jsonify({"success": False, "error": "請提供path"}), 400
+        
+        owner = utils.get_user_key(utils.get_user_session())
+        files = []
+        for path in paths:
+            path = '/' + path.strip('/')
+            files.append(utils.metadata_index.lookup(owner, path) or {"path": path, "code": 408})
+        return jsonify({"success": True, "data": {"files": files}})
+
+    @app.route('/api/dirsize', methods=['POST'])
+    def dir_size():
+        """查詢資料夾大小：有快取立即回傳，過期的在背景重新計算"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths']:
+                return jsonify({"success": False, "error": "請提供資料夾路徑列表"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            paths = ['/' + path.strip('/') for path in data['paths']]
+            mtimes = utils.get_mtimes(user_session, paths)
+            wait_timeout = config.DIRSIZE_WAIT_TIMEOUT if data.get('wait', True) else None
+            results = utils.dir_sizes.get(utils.get_user_key(user_session), user_session, mtimes, wait_timeout)
+            
+            return jsonify({
+                "success": True,
+                "data": [results.get(path) or {"path": path, "status": "error", "error": "資料夾不存在"}
+                         for path in paths]
+            })
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"查詢資料夾大小失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
 
     @app.route('/api/upload', methods=['POST'])
     def upload_file():
@@ -244,10 +760,13 @@ def register_routes(app, session_manager, requests_session, config, utils):
             return jsonify({"success": False, "error": "請先登入"}), 401
         
         try:
-            if 'file' not in request.files:
+            # 登入檢查通過後才解析表單（含上傳檔案），解析時間獨立成一個 span
+            with tracer.span("request.parse", size=request.content_length):
+                files = request.files
+            if 'file' not in files:
                 return jsonify({"success": False, "error": "未選擇檔案"}), 400
             
-            file = request.files['file']
+            file = files['file']
             target_path = request.form.get('path', '/home/www')
             overwrite = request.form.get('overwrite', 'true').lower() == 'true'
             user_session = utils.get_user_session()
@@ -260,9 +779,6 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             file_data = file.read()
             
-            upload_url = f"{config.NAS_BASE_URL}?api=SYNO.FileStation.Upload&method=upload&version=2&_sid={user_session['sid']}"
-            
-            files = {'file': (file.filename, BytesIO(file_data))}
             data = {
                 'mtime': str(int(time.time() * 1000)),
                 'overwrite': str(overwrite).lower(),
@@ -270,9 +786,8 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 'size': str(len(file_data))
             }
             
-            headers = {"X-SYNO-TOKEN": user_session['syno_token']}
-            
-            response = requests_session.post(upload_url, files=files, data=data, headers=headers)
+            # 上傳屬於大量傳輸，由排程器限制頻寬
+            response = utils.nas_upload(user_session, file.filename, file_data, data)
             response.raise_for_status()
             
             result = response.json()
@@ -286,7 +801,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "data": result
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
 
     @app.route('/api/create-folder', methods=['POST'])
     def create_folder():
@@ -296,8 +811,12 @@ def register_routes(app, session_manager, requests_session, config, utils):
         
         try:
             data = request.get_json()
+            if data and 'paths' in data:
+                return create_folder_tree(data)
             if not data or 'folder_path' not in data or 'name' not in data:
                 return jsonify({"success": False, "error": "請提供folder_path和name"}), 400
+            if isinstance(data['folder_path'], list) or isinstance(data['name'], list):
+                return create_folder_list(data)
             
             user_session = utils.get_user_session()
             
@@ -319,7 +838,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
             }
             
-            response = requests_session.post(config.NAS_BASE_URL, data=params, headers=headers)
+            response = utils.nas_request('post', utils.get_user_key(user_session), data=params, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -333,7 +852,82 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 "data": result
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
+
+    def bulk_folder_response(results):
+        """整理批次建立資料夾的逐項結果"""
+        failed = len([item for item in results if not item['success']])
+        if results and failed == len(results):
+            return jsonify({"success": False, "error": "建立資料夾失敗", "results": results}), 500
+        return jsonify({
+            "success": True,
+            "message": "資料夾建立完成" if not failed else f"資料夾建立完成，{failed} 個失敗",
+            "failed": failed,
+            "results": results
+        })
+
+    def create_folder_list(data):
+        """folder_path / name 為陣列時，逐項配對後批次建立"""
+        folder_paths = data['folder_path'] if isinstance(data['folder_path'], list) else [data['folder_path']]
+        names = data['name'] if isinstance(data['name'], list) else [data['name']]
+        if len(folder_paths) == 1 and len(names) > 1:
+            folder_paths = folder_paths * len(names)
+        if len(folder_paths) != len(names) or not names:
+            return jsonify({"success": False, "error": "folder_path 與 name 的數量必須相同"}), 400
+        
+        user_session = utils.get_user_session()
+        
+        # 更新最後活動時間
+        session_manager.update_last_activity()
+        
+        results = utils.create_folders(user_session, list(zip(folder_paths, names)),
+                                       force_parent=bool(data.get('force_parent', False)))
+        return bulk_folder_response(results)
+
+    def create_folder_tree(data):
+        """依完整路徑列表建立整棵目錄樹，只對葉節點呼叫 NAS（父層由 force_parent 建立）"""
+        paths = data['paths']
+        if not isinstance(paths, list) or not paths or not all(isinstance(path, str) and path.strip('/') for path in paths):
+            return jsonify({"success": False, "error": "paths 必須是一個包含至少一個資料夾路徑的列表"}), 400
+        
+        # 正規化並去除重複，保留請求順序
+        normalized = list(dict.fromkeys('/' + path.strip('/') for path in paths))
+        ancestors = set()
+        for path in normalized:
+            parts = path.split('/')
+            for depth in range(2, len(parts)):
+                ancestors.add('/'.join(parts[:depth]))
+        leaves = [path for path in normalized if path not in ancestors]
+        
+        user_session = utils.get_user_session()
+        
+        # 更新最後活動時間
+        session_manager.update_last_activity()
+        
+        leaf_results = utils.create_folders(
+            user_session,
+            [(leaf.rsplit('/', 1)[0] or '/', leaf.rsplit('/', 1)[1]) for leaf in leaves],
+            force_parent=True
+        )
+        
+        # 只要有一個子孫葉節點建立成功，其所有父層也已存在
+        by_path = {item['path']: item for item in leaf_results}
+        created_ancestors = set()
+        for item in leaf_results:
+            if item['success']:
+                parts = item['path'].split('/')
+                for depth in range(2, len(parts)):
+                    created_ancestors.add('/'.join(parts[:depth]))
+        
+        results = []
+        for path in normalized:
+            if path in by_path:
+                results.append(by_path[path])
+            elif path in created_ancestors:
+                results.append({"path": path, "success": True})
+            else:
+                results.append({"path": path, "success": False, "error": "子資料夾建立失敗"})
+        return bulk_folder_response(results)
 
     @app.route('/api/delete', methods=['POST'])
     def delete_files():
@@ -362,7 +956,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             headers = {"X-SYNO-TOKEN": user_session['syno_token']}
             
-            response = requests_session.get(config.NAS_BASE_URL, params=params, headers=headers)
+            response = utils.nas_request('get', utils.get_user_key(user_session), params=params, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -370,13 +964,110 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 error_code = result.get("error", {}).get("code", "未知錯誤")
                 return jsonify({"success": False, "error": f"刪除失敗: {error_code}"}), 500
             
+            task = utils.task_tracker.track(
+                result["data"]["taskid"], "SYNO.FileStation.Delete", "2", "delete",
+                utils.get_user_key(user_session), user_session,
+                on_finish=lambda task: utils.invalidate_paths(data['paths'])
+            )
+            
             return jsonify({
                 "success": True,
                 "message": "刪除任務已啟動",
-                "data": result["data"]
+                "data": result["data"],
+                "task": task
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
+
+    def start_copy_move(remove_src):
+        """啟動 SYNO.FileStation.CopyMove 任務（依批次大小拆分）"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        action = "移動" if remove_src else "複製"
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths'] or not data.get('dest_folder_path'):
+                return jsonify({"success": False, "error": "請提供paths列表和dest_folder_path"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            paths = data['paths']
+            dest_folder_path = data['dest_folder_path']
+            overwrite = data.get('overwrite')
+            owner = utils.get_user_key(user_session)
+            
+            # 移動會影響來源與目的地，複製只影響目的地
+            dest_paths = [dest_folder_path.rstrip('/') + '/' + path.rstrip('/').split('/')[-1] for path in paths]
+            affected = dest_paths + (paths if remove_src else [])
+            
+            tasks = []
+            results = []
+            batch_size = config.COPY_MOVE_BATCH_SIZE
+            for start in range(0, len(paths), batch_size):
+                batch = paths[start:start + batch_size]
+                params = {
+                    "api": "SYNO.FileStation.CopyMove",
+                    "method": "start",
+                    "version": "3",
+                    "path": json.dumps(batch),
+                    "dest_folder_path": json.dumps(dest_folder_path),
+                    "remove_src": str(remove_src).lower(),
+                    "accurate_progress": "true"
+                }
+                if overwrite is not None:
+                    params["overwrite"] = str(bool(overwrite)).lower()
+                
+                # 某一批失敗時仍繼續其餘批次，已啟動的任務必須回傳給客戶端以便追蹤或取消
+                item = {"batch": start // batch_size, "paths": batch}
+                try:
+                    result = utils.call_nas_api(user_session, params, http_method='post')
+                except NasApiError as e:
+                    results.append(dict(item, success=False, error=f"{action}失敗: {e.code}"))
+                    continue
+                except Exception as e:
+                    results.append(dict(item, success=False, error=str(e)))
+                    continue
+                task = utils.task_tracker.track(
+                    result["taskid"], "SYNO.FileStation.CopyMove", "3", "move" if remove_src else "copy",
+                    owner, user_session,
+                    on_finish=lambda task: utils.invalidate_paths(affected)
+                )
+                tasks.append(task)
+                results.append(dict(item, success=True, task=task))
+            
+            failed = len([item for item in results if not item['success']])
+            if failed == len(results):
+                return jsonify({"success": False, "error": results[0]["error"], "tasks": [], "results": results}), 500
+            if failed:
+                return jsonify({
+                    "success": False,
+                    "error": f"{action}任務部分啟動，{failed} 批失敗",
+                    "failed": failed,
+                    "tasks": tasks,
+                    "results": results
+                })
+            
+            return jsonify({
+                "success": True,
+                "message": f"{action}任務已啟動",
+                "tasks": tasks
+            })
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/copy', methods=['POST'])
+    def copy_files():
+        """在 NAS 上複製檔案或資料夾"""
+        return start_copy_move(remove_src=False)
+
+    @app.route('/api/move', methods=['POST'])
+    def move_files():
+        """在 NAS 上移動檔案或資料夾"""
+        return start_copy_move(remove_src=True)
 
     @app.route('/api/share', methods=['POST'])
     def create_share():
@@ -392,13 +1083,32 @@ def register_routes(app, session_manager, requests_session, config, utils):
             paths_to_share = data['paths']
             if not paths_to_share or not isinstance(paths_to_share, list):
                 return jsonify({"success": False, "error": "paths 必須是一個包含至少一個路徑的列表"}), 400
+            qr, qr_error = qr_options(data)
+            if qr_error:
+                return jsonify({"success": False, "error": qr_error}), 400
             
             user_session = utils.get_user_session()
             
             # 更新最後活動時間
             session_manager.update_last_activity()
             
-            utils.debug_log("開始建立分享連結", {
+            owner = utils.get_user_key(user_session)
+            has_options = any(data.get(key) for key in ('password', 'date_expired', 'date_available'))
+            
+            # 未指定密碼或期限時，重用既有的有效連結，不必讓 NAS 重新建立
+            reused = {}
+            if not has_options and data.get('reuse', True):
+                reused = find_reusable_links(user_session, owner, paths_to_share)
+            reused_links = [dict(reused[path], reused=True) for path in paths_to_share if path in reused]
+            paths_to_share = [path for path in paths_to_share if path not in reused]
+            if not paths_to_share:
+                return jsonify({
+                    "success": True,
+                    "message": "已重用既有的分享連結",
+                    "data": {"links": [with_qr_code(link, qr) for link in reused_links]}
+                })
+            
+            logger.debug("share_create", lambda: {
                 "paths": paths_to_share,
                 "password_protected": bool(data.get('password')),
                 "date_expired": data.get('date_expired'),
@@ -424,11 +1134,11 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             headers = {"X-SYNO-TOKEN": user_session['syno_token']}
             
-            response = requests_session.post(config.NAS_BASE_URL, data=api_params, headers=headers)
+            response = utils.nas_request('post', utils.get_user_key(user_session), data=api_params, headers=headers)
             response.raise_for_status()
             
             response_data = response.json()
-            utils.debug_log("建立分享連結回應", response_data)
+            logger.debug("share_create_response", response_data)
             
             if not response_data.get("success"):
                 error_code = response_data.get("error", {}).get("code", "未知錯誤")
@@ -439,18 +1149,204 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             if "data" in response_data and "links" in response_data["data"] and response_data["data"]["links"]:
                 share_data = response_data["data"]
+                utils.share_links.put(owner, share_data["links"])
+                share_data["links"] = [with_qr_code(link, qr) for link in reused_links + share_data["links"]]
                 return jsonify({
                     "success": True,
                     "message": "分享連結建立成功",
                     "data": share_data
                 })
             else:
-                utils.debug_log("成功回應但未找到 links 欄位", response_data)
+                logger.warning("share_create_missing_links", response_data)
                 return jsonify({"success": False, "error": "建立分享連結成功，但回應中未找到連結資訊"}), 500
             
         except Exception as e:
-            utils.debug_log("建立分享連結錯誤", str(e))
-            return jsonify({"success": False, "error": str(e)}), 500
+            logger.error("share_create_failed", {"error": str(e)})
+            return exception_response(e)
+
+    def qr_options(data):
+        """解析 QR code 參數，回傳 ((尺寸, 格式) 或 None, 錯誤訊息)"""
+        if not data.get('qr'):
+            return None, None
+        # 在呼叫 NAS 建立連結前確認可產生 QR code，避免留下未回傳的分享連結
+        if not qr_available():
+            return None, "伺服器未安裝 segno，無法產生 QR code"
+        qr_format = data.get('qr_format', 'png')
+        if qr_format not in QR_FORMATS:
+            return None, f"不支援的 QR code 格式: {qr_format}"
+        try:
+            qr_size = int(data.get('qr_size', 200))
+        except (TypeError, ValueError):
+            return None, "qr_size 必須是整數"
+        return (min(max(qr_size, QR_MIN_SIZE), QR_MAX_SIZE), qr_format), None
+
+    def with_qr_code(link, qr):
+        """在連結的 qrcode 欄位填入伺服器產生的 QR code data URI"""
+        url = link.get('url') or link.get('link')
+        if not qr or not url:
+            return link
+        return dict(link, qrcode=qr_data_uri(url, *qr))
+
+    def find_reusable_links(user_session, owner, paths):
+        """查詢可重用的分享連結，查詢失敗時視為沒有"""
+        try:
+            return utils.share_links.find_reusable(owner, paths, lambda: utils.list_share_links(user_session))
+        except Exception as e:
+            logger.warning("share_list_failed", {"error": str(e)})
+            return {}
+
+    @app.route('/api/share/bulk', methods=['POST'])
+    def create_share_bulk():
+        """為大量路徑建立分享連結，回傳逐項結果"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths']:
+                return jsonify({"success": False, "error": "paths 必須是一個包含至少一個路徑的列表"}), 400
+            if len(data['paths']) > config.SHARE_BULK_MAX_PATHS:
+                return jsonify({"success": False, "error": f"一次最多 {config.SHARE_BULK_MAX_PATHS} 個路徑"}), 400
+            
+            user_session = utils.get_user_session()
+            owner = utils.get_user_key(user_session)
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            qr, qr_error = qr_options(data)
+            if qr_error:
+                return jsonify({"success": False, "error": qr_error}), 400
+            
+            paths = list(dict.fromkeys(data['paths']))
+            options = {key: data[key] for key in ('password', 'date_expired', 'date_available') if data.get(key)}
+            reused = {}
+            if not options and data.get('reuse', True):
+                reused = find_reusable_links(user_session, owner, paths)
+            
+            created = utils.create_share_links(user_session, [path for path in paths if path not in reused], options)
+            utils.share_links.put(owner, [item['link'] for item in created if item['success']])
+            created = {item['path']: item for item in created}
+            
+            results = []
+            for path in paths:
+                if path in reused:
+                    results.append({"path": path, "success": True, "reused": True, "link": reused[path]})
+                else:
+                    results.append(dict(created[path], reused=False))
+                if qr and results[-1]['success']:
+                    results[-1]['link'] = with_qr_code(results[-1]['link'], qr)
+            
+            failed = len([item for item in results if not item['success']])
+            if failed == len(results):
+                return jsonify({"success": False, "error": "建立分享連結失敗", "results": results}), 500
+            return jsonify({
+                "success": True,
+                "message": "分享連結建立完成" if not failed else f"分享連結建立完成，{failed} 個失敗",
+                "reused": len(reused),
+                "failed": failed,
+                "results": results
+            })
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/share/list', methods=['GET'])
+    def list_shares():
+        """列出使用者的分享連結"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            links = utils.share_links.links(
+                utils.get_user_key(user_session),
+                lambda: utils.list_share_links(user_session),
+                refresh=request.args.get('refresh', 'false').lower() == 'true'
+            )
+            return jsonify({
+                "success": True,
+                "data": {"links": list(links.values()), "total": len(links)}
+            })
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"列出分享連結失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
+
+    def valid_share_ids(data):
+        """ids 必須是非空的字串列表（以逗號串接後送往 NAS，因此不可含逗號）"""
+        if not isinstance(data, dict):
+            return False
+        ids = data.get('ids')
+        return (isinstance(ids, list) and bool(ids)
+                and all(isinstance(share_id, str) and share_id and ',' not in share_id for share_id in ids))
+
+    @app.route('/api/share/edit', methods=['POST'])
+    def edit_share():
+        """修改分享連結的密碼或期限"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not valid_share_ids(data):
+                return jsonify({"success": False, "error": "請提供分享連結ID列表"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            params = {
+                "api": "SYNO.FileStation.Sharing",
+                "version": "3",
+                "method": "edit",
+                "id": ",".join(data['ids'])
+            }
+            # 空字串代表清除密碼或期限
+            for key in ('password', 'date_expired', 'date_available'):
+                if key in data:
+                    params[key] = data[key] or ""
+            
+            utils.call_nas_api(user_session, params, http_method='post')
+            utils.share_links.forget(utils.get_user_key(user_session))
+            return jsonify({"success": True, "message": "分享連結已更新"})
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"修改分享連結失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/share/delete', methods=['POST'])
+    def delete_share():
+        """刪除分享連結"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not valid_share_ids(data):
+                return jsonify({"success": False, "error": "請提供分享連結ID列表"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            utils.call_nas_api(user_session, {
+                "api": "SYNO.FileStation.Sharing",
+                "version": "3",
+                "method": "delete",
+                "id": ",".join(data['ids'])
+            }, http_method='post')
+            utils.share_links.remove(utils.get_user_key(user_session), set(data['ids']))
+            return jsonify({"success": True, "message": "分享連結已刪除"})
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"刪除分享連結失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
 
     @app.route('/api/compress', methods=['POST'])
     def compress_files():
@@ -496,7 +1392,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
             
             headers = {"X-SYNO-TOKEN": user_session['syno_token']}
             
-            response = requests_session.post(config.NAS_BASE_URL, params=params, headers=headers)
+            response = utils.nas_request('post', utils.get_user_key(user_session), params=params, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -504,13 +1400,72 @@ def register_routes(app, session_manager, requests_session, config, utils):
                 error_code = result.get("error", {}).get("code", "未知錯誤")
                 return jsonify({"success": False, "error": f"壓縮失敗: {error_code}"}), 500
             
+            task = utils.task_tracker.track(
+                result["data"]["taskid"], "SYNO.FileStation.Compress", "3", "compress",
+                utils.get_user_key(user_session), user_session
+            )
+            
             return jsonify({
                 "success": True,
                 "message": "壓縮任務已啟動",
-                "data": result["data"]
+                "data": result["data"],
+                "task": task
             })
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
+
+    @app.route('/api/tasks', methods=['GET'])
+    def list_tasks():
+        """列出目前使用者的背景任務"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        user_session = utils.get_user_session()
+        return jsonify({
+            "success": True,
+            "tasks": utils.task_tracker.list_tasks(utils.get_user_key(user_session))
+        })
+
+    @app.route('/api/tasks/<task_id>', methods=['GET'])
+    def task_status(task_id):
+        """查詢背景任務進度"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        user_session = utils.get_user_session()
+        task = utils.task_tracker.get(task_id, utils.get_user_key(user_session))
+        if task is None:
+            return jsonify({"success": False, "error": "任務不存在"}), 404
+        
+        return jsonify({"success": True, "task": task})
+
+    @app.route('/api/tasks/<task_id>/events', methods=['GET'])
+    def task_events(task_id):
+        """以 Server-Sent Events 推送背景任務進度"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        owner = utils.get_user_key(utils.get_user_session())
+        task = utils.task_tracker.get(task_id, owner)
+        if task is None:
+            return jsonify({"success": False, "error": "任務不存在"}), 404
+        
+        def generate():
+            version = -1
+            while True:
+                task = utils.task_tracker.wait_for_change(task_id, owner, version, timeout=15)
+                if task is None:
+                    break
+                if task["version"] == version:
+                    # 逾時沒有變化，送出註解行維持連線
+                    yield ": keepalive\n\n"
+                    continue
+                version = task["version"]
+                yield f"event: progress\ndata: {json.dumps(task, ensure_ascii=False)}\n\n"
+                if task["status"] != "running":
+                    break
+        
+        return Response(generate(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
 
     @app.route('/api/logout', methods=['POST'])
     def logout():
@@ -519,7 +1474,7 @@ def register_routes(app, session_manager, requests_session, config, utils):
             result = utils.logout()
             return jsonify(result)
         except Exception as e:
-            return jsonify({"success": False, "error": str(e)}), 500
+            return exception_response(e)
 
     @app.route('/api/download', methods=['GET'])
     def download_file():
@@ -532,22 +1487,391 @@ def register_routes(app, session_manager, requests_session, config, utils):
             if not file_path:
                 return jsonify({"success": False, "error": "請提供檔案路徑"}), 400
             
-            utils.debug_log("開始下載檔案", {"file_path": file_path})
+            logger.debug("download_start", {"file_path": file_path})
+            
+            # 由伺服器提供檔案內容（有啟用時經過磁碟快取）
+            if request.args.get('mode') == 'proxy':
+                return proxy_download(file_path)
             
             download_url = utils.generate_download_link_with_sid(file_path)
             
+            download_data = {
+                "url": download_url,
+                "stream_url": f"/api/download/stream?path={quote(file_path)}"
+            }
+            if utils.download_tokens is not None:
+                token = utils.issue_download_token(utils.get_user_session(), file_path)
+                download_data["token_url"] = f"/api/dl/{token}"
+                download_data["token_expires_in"] = utils.download_tokens.ttl
+            
             return jsonify({
                 "success": True,
-                "data": {"url": download_url},
+                "data": download_data,
                 "method": "fbdownload_with_sid"
             })
             
         except Exception as e:
-            utils.debug_log("下載錯誤", str(e))
-            return jsonify({"success": False, "error": str(e)}), 500
+            logger.error("download_failed", {"error": str(e)})
+            return exception_response(e)
+
+    def proxy_download(file_path):
+        """以 NAS 路徑加上 mtime/size 為鍵，經由磁碟快取提供檔案"""
+        if not file_path.startswith('/'):
+            file_path = '/' + file_path
+        file_name = file_path.rstrip('/').split('/')[-1]
+        user_session = utils.get_user_session()
+        
+        # 更新最後活動時間
+        session_manager.update_last_activity()
+        
+        cache = utils.download_cache
+        if cache is None:
+            nas_response, stream = utils.open_download_stream(user_session, file_path, request.headers)
+            return stream_response(nas_response, stream, file_name)
+        
+        # 以目前使用者的權限查詢中繼資料，同時驗證快取新鮮度
+        try:
+            file_info = utils.get_file_info(user_session, [file_path])
+        except NasApiError as e:
+            # DSM 408：檔案或資料夾不存在
+            if e.code == 408:
+                return jsonify({"success": False, "error": "檔案不存在"}), 404
+            raise
+        if not file_info or file_info[0].get('code'):
+            return jsonify({"success": False, "error": "檔案不存在"}), 404
+        if file_info[0].get('isdir'):
+            return jsonify({"success": False, "error": "無法下載資料夾"}), 400
+        
+        size = file_info[0].get('additional', {}).get('size', 0)
+        mtime = file_info[0].get('additional', {}).get('time', {}).get('mtime', 0)
+        cache_key = cache.make_key(file_path, mtime, size)
+        
+        cached_path = cache.get(cache_key)
+        if cached_path:
+            try:
+                return send_file(cached_path, as_attachment=True, download_name=file_name,
+                                 conditional=True, etag=cache_key)
+            except FileNotFoundError:
+                # 查詢後到傳送前被淘汰，改由 NAS 串流
+                pass
+        
+        # 未命中：部分範圍請求直接轉送，完整下載則同時寫入快取
+        if request.headers.get('Range'):
+            nas_response, stream = utils.open_download_stream(user_session, file_path, request.headers)
+            return stream_response(nas_response, stream, file_name)
+        
+        nas_response, stream = utils.open_download_stream(user_session, file_path)
+        writer = None
+        if nas_response.status_code == 200:
+            writer = cache.writer(cache_key, size, tag=file_path)
+        if writer:
+            stream = TeeStream(stream, writer, size)
+        return stream_response(nas_response, stream, file_name)
+
+    def stream_response(nas_response, stream, file_name):
+        """將 NAS 下載串流包裝為 Flask 回應"""
+        if nas_response.status_code >= 400 and nas_response.status_code != 416:
+            stream.close()
+            if nas_response.status_code == 404:
+                return jsonify({"success": False, "error": "檔案不存在"}), 404
+            return jsonify({"success": False, "error": f"下載失敗: HTTP {nas_response.status_code}"}), 500
+        
+        headers = forward_response_headers(nas_response, file_name)
+        return Response(stream, status=nas_response.status_code, headers=headers, direct_passthrough=True)
+
+    @app.route('/api/download/cache', methods=['GET'])
+    def download_cache_stats():
+        """下載快取統計"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        if utils.download_cache is None:
+            return jsonify({"success": True, "enabled": False})
+        return jsonify({
+            "success": True,
+            "enabled": True,
+            "data": utils.download_cache.stats()
+        })
+
+    @app.route('/api/download/batch', methods=['POST'])
+    def download_batch():
+        """批次取得下載連結"""
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths']:
+                return jsonify({"success": False, "error": "paths 必須是一個包含至少一個路徑的列表"}), 400
+            
+            if len(data['paths']) > config.DOWNLOAD_BATCH_MAX_PATHS:
+                return jsonify({"success": False, "error": f"一次最多 {config.DOWNLOAD_BATCH_MAX_PATHS} 個路徑"}), 400
+            
+            if not all(isinstance(path, str) and path for path in data['paths']):
+                return jsonify({"success": False, "error": "paths 中的每一項都必須是非空字串"}), 400
+            
+            # 只查詢一次 session，登入檢查與連結生成共用
+            user_session = utils.get_user_session()
+            if not user_session or not user_session.get('sid') or not user_session.get('syno_token'):
+                return jsonify({"success": False, "error": "請先登入"}), 401
+            
+            links = utils.generate_download_links_with_sid(data['paths'], user_session)
+            
+            return jsonify({
+                "success": True,
+                "data": {"links": links, "count": len(links)},
+                "method": "fbdownload_with_sid"
+            })
+            
+        except Exception as e:
+            logger.error("download_batch_failed", {"error": str(e)})
+            return exception_response(e)
+
+    @app.route('/api/download/zip', methods=['POST'])
+    def download_zip():
+        """將多個檔案/資料夾即時打包成 ZIP 串流下載"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths']:
+                return jsonify({"success": False, "error": "paths 必須是一個包含至少一個路徑的列表"}), 400
+            
+            compression = data.get('compression', 'store')
+            if compression not in COMPRESSION_MODES:
+                return jsonify({"success": False, "error": "compression 必須是 store 或 deflate"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            paths = ['/' + path.lstrip('/') for path in data['paths']]
+            file_infos = utils.get_file_info(user_session, paths)
+            missing = [info.get('path') for info in file_infos if info.get('code')]
+            if missing:
+                return jsonify({"success": False, "error": f"檔案不存在: {', '.join(missing)}"}), 404
+            
+            archive_name = data.get('name') or 'download.zip'
+            
+            def open_file(path):
+                nas_response, stream = utils.open_download_stream(user_session, path)
+                if nas_response.status_code != 200:
+                    stream.close()
+                    logger.warning("zip_entry_skipped", {"path": path, "status": nas_response.status_code})
+                    return None
+                return stream
+            
+            def children_of(info, prefix):
+                for child in utils.iter_folder(user_session, info['path'], additional=('size', 'time'),
+                                               priority=PRIORITY_BULK):
+                    yield child, f"{prefix}/{child['name']}"
+            
+            def zip_entries():
+                # 以迭代器堆疊深度優先走訪，資料夾內容逐頁取得
+                stack = [iter([(info, info.get('name') or info['path'].rstrip('/').split('/')[-1])
+                               for info in file_infos])]
+                while stack:
+                    item = next(stack[-1], None)
+                    if item is None:
+                        stack.pop()
+                        continue
+                    info, arcname = item
+                    additional = info.get('additional', {})
+                    mtime = additional.get('time', {}).get('mtime', 0)
+                    if info.get('isdir'):
+                        yield arcname, 0, mtime, None
+                        stack.append(children_of(info, arcname))
+                    else:
+                        yield arcname, additional.get('size', 0), mtime, lambda path=info['path']: open_file(path)
+            
+            return Response(
+                stream_zip(zip_entries(), COMPRESSION_MODES[compression]),
+                mimetype='application/zip',
+                headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(archive_name)}"}
+            )
+            
+        except Exception as e:
+            logger.error("zip_download_failed", {"error": str(e)})
+            return exception_response(e)
+
+    @app.route('/api/dl/<token>', methods=['GET'])
+    def token_download(token):
+        """以簽章 token 下載檔案（只驗證簽章，不查詢 session）"""
+        if utils.download_tokens is None:
+            return jsonify({"success": False, "error": "未設定下載 token 密鑰"}), 500
+        
+        try:
+            claims = utils.download_tokens.verify(token)
+        except InvalidTokenError as e:
+            return jsonify({"success": False, "error": str(e)}), 403
+        
+        try:
+            # 由 token 內容組出呼叫 NAS 所需的最少資訊
+            token_session = {
+                'sid': claims['sid'],
+                'syno_token': claims['syno_token'],
+                'credentials': {'account': claims['user']}
+            }
+            nas_response, stream = utils.open_download_stream(token_session, claims['path'], request.headers)
+            return stream_response(nas_response, stream, claims['path'].rstrip('/').split('/')[-1])
+        except Exception as e:
+            logger.error("token_download_failed", {"error": str(e)})
+            return exception_response(e)
+
+    @app.route('/api/download/stream', methods=['GET'])
+    def stream_download():
+        """由伺服器代理串流下載檔案（支援 Range / If-Range）"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            file_path = request.args.get('path')
+            if not file_path:
+                return jsonify({"success": False, "error": "請提供檔案路徑"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            file_name = file_path.rstrip('/').split('/')[-1]
+            
+            # 平行範圍下載僅用於完整下載，續傳請求仍走單一串流
+            if request.args.get('parallel') == 'true' and not request.headers.get('Range'):
+                probe, fetcher = utils.open_parallel_download(user_session, file_path)
+                if fetcher:
+                    headers = forward_response_headers(probe, file_name)
+                    headers.pop('Content-Range', None)
+                    headers['Content-Length'] = str(fetcher.total_size)
+                    return Response(fetcher, status=200, headers=headers, direct_passthrough=True)
+                if probe.status_code == 404:
+                    return jsonify({"success": False, "error": "檔案不存在"}), 404
+            
+            nas_response, stream = utils.open_download_stream(user_session, file_path, request.headers)
+            return stream_response(nas_response, stream, file_name)
+            
+        except Exception as e:
+            logger.error("stream_download_failed", {"error": str(e)})
+            return exception_response(e)
+
+    # ============= 縮圖路由 =============
+    
+    def image_mimetype(data):
+        """依檔頭判斷縮圖格式，NAS 預設回傳 JPEG"""
+        if data.startswith(b'\x89PNG'):
+            return 'image/png'
+        if data.startswith(b'GIF8'):
+            return 'image/gif'
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return 'image/webp'
+        return 'image/jpeg'
+
+    @app.route('/api/thumbnail', methods=['GET'])
+    def thumbnail():
+        """取得單一檔案縮圖（磁碟快取，附 ETag 與 Cache-Control）"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            file_path = '/' + request.args.get('path', '').strip('/')
+            size_class = request.args.get('size', 'small')
+            if file_path == '/':
+                return jsonify({"success": False, "error": "請提供檔案路徑"}), 400
+            if size_class not in THUMBNAIL_SIZES:
+                return jsonify({"success": False, "error": f"不支援的縮圖尺寸: {size_class}"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            # 每次都以目前使用者的權限查詢 mtime，快取不會繞過 NAS 權限
+            mtime = utils.get_mtimes(user_session, [file_path]).get(file_path)
+            if mtime is None:
+                return jsonify({"success": False, "error": "檔案不存在"}), 404
+            
+            # 網址帶有正確 mtime 時內容不會再變，可讓瀏覽器長期快取
+            if request.args.get('mtime', type=int) == mtime:
+                cache_control = 'private, max-age=31536000, immutable'
+            else:
+                cache_control = f'private, max-age={config.THUMBNAIL_MAX_AGE}'
+            
+            etag = DiskLRUCache.make_key(file_path, mtime, size_class)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                etag, data = utils.get_thumbnail(user_session, file_path, mtime, size_class)
+                response = Response(data, mimetype=image_mimetype(data))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"取得縮圖失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
+
+    @app.route('/api/thumbnails', methods=['POST'])
+    def thumbnails_batch():
+        """批次取得縮圖，以 base64 data URI 回傳"""
+        if not utils.is_logged_in():
+            return jsonify({"success": False, "error": "請先登入"}), 401
+        
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('paths'), list) or not data['paths']:
+                return jsonify({"success": False, "error": "請提供檔案路徑列表"}), 400
+            if len(data['paths']) > config.THUMBNAIL_BATCH_MAX_PATHS:
+                return jsonify({"success": False, "error": f"一次最多 {config.THUMBNAIL_BATCH_MAX_PATHS} 個檔案"}), 400
+            size_class = data.get('size', 'small')
+            if size_class not in THUMBNAIL_SIZES:
+                return jsonify({"success": False, "error": f"不支援的縮圖尺寸: {size_class}"}), 400
+            
+            user_session = utils.get_user_session()
+            
+            # 更新最後活動時間
+            session_manager.update_last_activity()
+            
+            paths = ['/' + path.strip('/') for path in data['paths']]
+            mtimes = utils.get_mtimes(user_session, paths)
+            
+            def load(path):
+                if path not in mtimes:
+                    return {"path": path, "error": "檔案不存在"}
+                try:
+                    etag, image = utils.get_thumbnail(user_session, path, mtimes[path], size_class)
+                except NasApiError as e:
+                    return {"path": path, "error": f"取得縮圖失敗: {e.code}"}
+                except Exception as e:
+                    return {"path": path, "error": str(e)}
+                return {
+                    "path": path,
+                    "mtime": mtimes[path],
+                    "etag": etag,
+                    "data": f"data:{image_mimetype(image)};base64,{base64.b64encode(image).decode('ascii')}"
+                }
+            
+            with ThreadPoolExecutor(max_workers=config.THUMBNAIL_BATCH_CONCURRENCY) as executor:
+                results = list(executor.map(load, paths))
+            
+            return jsonify({"success": True, "data": results})
+        except NasApiError as e:
+            return jsonify({"success": False, "error": f"取得縮圖失敗: {e.code}"}), 500
+        except Exception as e:
+            return exception_response(e)
 
     # ============= 錯誤處理 =============
     
+    def exception_response(e):
+        """未預期例外的回應：排程器排隊逾時為 503，其餘為 500"""
+        if isinstance(e, SchedulerBusyError):
+            return scheduler_busy(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    @app.errorhandler(SchedulerBusyError)
+    def scheduler_busy(error):
+        response = jsonify({"success": False, "error": str(error)})
+        response.headers['Retry-After'] = str(max(1, int(error.timeout)))
+        return response, 503
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({"success": False, "error": "API端點不存在"}), 404
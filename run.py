@@ -1,8 +1,4 @@
-import json
-from server import app
-
-with open("config.json", "r", encoding="utf-8") as f:
-    config_data = json.load(f)
+from server import app, config_data
 
 HOST = config_data["FLASK"]["HOST"]
 PORT = config_data["FLASK"]["PORT"]
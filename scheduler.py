@@ -0,0 +1,187 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from errors import SchedulerBusyError
+
+# 優先等級：互動式請求（列表、狀態、分享）優先於大量傳輸（上傳、下載代理）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class TokenBucket:
+    """每秒位元組數的 Token Bucket（允許短暫透支，再以睡眠償還）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """扣除 token，並回傳需要等待的秒數"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class ThrottledReader:
+    """依使用者頻寬限制讀取的檔案包裝，供 requests 串流上傳使用"""
+
+    def __init__(self, scheduler, user, fileobj, length):
+        self.scheduler = scheduler
+        self.user = user
+        self.fileobj = fileobj
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        if chunk:
+            self.scheduler.throttle(self.user, len(chunk))
+        return chunk
+
+
+class NasScheduler:
+    """NAS 呼叫排程器：全域與每位使用者的併發限制、頻寬限制及優先等級
+
+    互動式與大量傳輸分別計算每位使用者的名額：下載串流會持有名額直到客戶端讀完，
+    若共用同一個上限，開著數個下載的使用者連列表都無法進行。
+    """
+
+    def __init__(self, max_concurrency=10, per_user_concurrency=4, bulk_concurrency=6,
+                 per_user_bytes_per_sec=0, burst_bytes=None, per_user_bulk_concurrency=None,
+                 acquire_timeout=None):
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.bulk_concurrency = min(bulk_concurrency, max_concurrency)
+        self.per_user_bulk_concurrency = min(per_user_bulk_concurrency or per_user_concurrency,
+                                             self.bulk_concurrency)
+        self.acquire_timeout = acquire_timeout
+        self.per_user_bytes_per_sec = per_user_bytes_per_sec
+        self.burst_bytes = burst_bytes
+        self.cond = threading.Condition()
+        self.active = 0
+        self.active_bulk = 0
+        self.waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+        self.interactive_waiting = {}  # user -> 排隊中的互動式請求數
+        self.user_active = {PRIORITY_INTERACTIVE: {}, PRIORITY_BULK: {}}  # 優先等級 -> {user: 執行中數量}
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+
+    def _can_run(self, user, priority):
+        if self.active >= self.max_concurrency:
+            return False
+        if self.user_active[priority].get(user, 0) >= self.user_limit(priority):
+            return False
+        if priority == PRIORITY_BULK:
+            # 有可立即執行的互動式請求排隊時，大量傳輸讓出名額
+            if self.active_bulk >= self.bulk_concurrency or self._interactive_runnable():
+                return False
+        return True
+
+    def user_limit(self, priority):
+        """每位使用者在此優先等級的併發上限"""
+        return self.per_user_bulk_concurrency if priority == PRIORITY_BULK else self.per_user_concurrency
+
+    def _interactive_runnable(self):
+        """是否有互動式請求排隊且未受其使用者的併發上限阻擋
+
+        只被自己使用者上限卡住的請求不算，避免單一使用者大量互動式請求讓所有人的大量傳輸停擺。
+        """
+        active = self.user_active[PRIORITY_INTERACTIVE]
+        return any(active.get(user, 0) < self.per_user_concurrency for user in self.interactive_waiting)
+
+    def acquire(self, user, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """取得執行名額（必要時阻塞等待），超過 timeout 秒仍未取得時拋出 SchedulerBusyError"""
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            self.waiting[priority] += 1
+            if priority == PRIORITY_INTERACTIVE:
+                self.interactive_waiting[user] = self.interactive_waiting.get(user, 0) + 1
+            try:
+                while not self._can_run(user, priority):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        # 自己不再排隊後，被互動式請求擋住的大量傳輸可能可以執行
+                        self.cond.notify_all()
+                        raise SchedulerBusyError(timeout)
+                    self.cond.wait(remaining)
+            finally:
+                self.waiting[priority] -= 1
+                if priority == PRIORITY_INTERACTIVE:
+                    remaining = self.interactive_waiting[user] - 1
+                    if remaining > 0:
+                        self.interactive_waiting[user] = remaining
+                    else:
+                        del self.interactive_waiting[user]
+            self.active += 1
+            if priority == PRIORITY_BULK:
+                self.active_bulk += 1
+            active = self.user_active[priority]
+            active[user] = active.get(user, 0) + 1
+
+    def release(self, user, priority=PRIORITY_INTERACTIVE):
+        """釋放執行名額"""
+        with self.cond:
+            self.active -= 1
+            if priority == PRIORITY_BULK:
+                self.active_bulk -= 1
+            active = self.user_active[priority]
+            remaining = active.get(user, 1) - 1
+            if remaining > 0:
+                active[user] = remaining
+            else:
+                active.pop(user, None)
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, user, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """以 with 區塊持有執行名額"""
+        self.acquire(user, priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(user, priority)
+
+    def throttle(self, user, nbytes):
+        """依使用者的頻寬限制等待"""
+        if not self.per_user_bytes_per_sec or nbytes <= 0:
+            return
+        with self.buckets_lock:
+            bucket = self.buckets.get(user)
+            if bucket is None:
+                bucket = TokenBucket(self.per_user_bytes_per_sec, self.burst_bytes)
+                self.buckets[user] = bucket
+        delay = bucket.consume(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle_iter(self, user, chunks):
+        """包裝位元組迭代器，逐塊套用頻寬限制"""
+        for chunk in chunks:
+            self.throttle(user, len(chunk))
+            yield chunk
+
+    def stats(self):
+        """排程器目前狀態"""
+        with self.cond:
+            users = self.user_active[PRIORITY_INTERACTIVE].keys() | self.user_active[PRIORITY_BULK].keys()
+            return {
+                "active": self.active,
+                "active_bulk": self.active_bulk,
+                "waiting_interactive": self.waiting[PRIORITY_INTERACTIVE],
+                "waiting_bulk": self.waiting[PRIORITY_BULK],
+                "active_users": len(users),
+                "max_concurrency": self.max_concurrency
+            }
@@ -1,37 +1,151 @@
 from flask import Flask, session
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 import os
+import threading
 from dotenv import load_dotenv
 import uuid
 from datetime import datetime
 from router import register_routes
+from scheduler import NasScheduler, ThrottledReader, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from download_proxy import BufferBudget, DownloadStream, ParallelRangeFetcher, forward_request_headers
+from disk_cache import DiskLRUCache
+from errors import NasApiError
+from download_tokens import DownloadTokenSigner, download_tokens_available
+from task_tracker import TaskTracker
+from metadata_index import MetadataIndex
+from delta_snapshots import SnapshotStore
+from dir_size import DirSizeCache
+from share_links import ShareLinkCache
+from metrics import MetricsRegistry
+from logger import logger
+from health import ReadinessProbe
+from profiling import RequestProfiler, ProfileStore, SlowRequestLog
+from tracing import tracer, TraceExporter, TracingJSONProvider, SPAN_KIND_CLIENT
 import urllib3
+from urllib3 import encode_multipart_formdata
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
 
 # 禁用SSL警告
 urllib3.disable_warnings()
 
 load_dotenv()
 
-with open("config.json", "r", encoding="utf-8") as f:
+# 設定檔路徑可由環境變數指定（例如測試時使用另一份設定）
+CONFIG_FILE = os.getenv("DSM_CONFIG_FILE", "config.json")
+with open(CONFIG_FILE, "r", encoding="utf-8") as f:
     config_data = json.load(f)
 
 app = Flask(__name__, static_folder='.')
 app.secret_key = os.getenv("FLASK_SECRET_KEY")  # 用於 Flask session
+app.json = TracingJSONProvider(app)  # jsonify 序列化計入追蹤
 
 # 簡易設定
 class Config:
-    NAS_BASE_URL = config_data["NAS"]["NAS_BASE_URL"] 
+    NAS_BASE_URL = os.getenv("NAS_BASE_URL") or config_data["NAS"]["NAS_BASE_URL"]
     NAS_TIMEOUT = config_data["NAS"]["NAS_TIMEOUT"]
     SESSION_FILE = config_data["SESSION"]["SESSION_FILE"] 
     SESSION_EXPIRE_DAYS = config_data["SESSION"]["SESSION_EXPIRE_DAYS"] 
+    DOWNLOAD_TOKEN_TTL = config_data.get("DOWNLOAD", {}).get("TOKEN_TTL", 300)
+    DOWNLOAD_BATCH_MAX_PATHS = config_data.get("DOWNLOAD", {}).get("BATCH_MAX_PATHS", 1000)
+    CREATE_FOLDER_BATCH_SIZE = config_data.get("FOLDERS", {}).get("CREATE_BATCH_SIZE", 200)
+    COPY_MOVE_BATCH_SIZE = config_data.get("TASKS", {}).get("COPY_MOVE_BATCH_SIZE", 200)
+    DOWNLOAD_CHUNK_SIZE = config_data.get("DOWNLOAD", {}).get("CHUNK_SIZE", 64 * 1024)
+    DOWNLOAD_PARALLEL_MIN_SIZE = config_data.get("DOWNLOAD", {}).get("PARALLEL_MIN_SIZE", 64 * 1024 * 1024)
+    DOWNLOAD_PARALLEL_PART_SIZE = config_data.get("DOWNLOAD", {}).get("PARALLEL_PART_SIZE", 8 * 1024 * 1024)
+    DOWNLOAD_PARALLEL_MIN_WORKERS = config_data.get("DOWNLOAD", {}).get("PARALLEL_MIN_WORKERS", 2)
+    DOWNLOAD_PARALLEL_MAX_WORKERS = config_data.get("DOWNLOAD", {}).get("PARALLEL_MAX_WORKERS", 8)
+    DOWNLOAD_PARALLEL_MAX_BUFFERED_PARTS = config_data.get("DOWNLOAD", {}).get("PARALLEL_MAX_BUFFERED_PARTS", 16)
+    DOWNLOAD_PARALLEL_MAX_BUFFER_BYTES = config_data.get("DOWNLOAD", {}).get("PARALLEL_MAX_BUFFER_BYTES", 128 * 1024 * 1024)
+    DOWNLOAD_CACHE_ENABLED = config_data.get("DOWNLOAD", {}).get("CACHE_ENABLED", False)
+    DOWNLOAD_CACHE_DIR = config_data.get("DOWNLOAD", {}).get("CACHE_DIR", "download_cache")
+    DOWNLOAD_CACHE_MAX_BYTES = config_data.get("DOWNLOAD", {}).get("CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+    DOWNLOAD_CACHE_MAX_FILE_BYTES = config_data.get("DOWNLOAD", {}).get("CACHE_MAX_FILE_BYTES", 256 * 1024 * 1024)
+    WALK_CONCURRENCY = config_data.get("WALK", {}).get("CONCURRENCY", 4)
+    SEARCH_POLL_MIN_INTERVAL = config_data.get("SEARCH", {}).get("POLL_MIN_INTERVAL", 0.3)
+    SEARCH_POLL_MAX_INTERVAL = config_data.get("SEARCH", {}).get("POLL_MAX_INTERVAL", 3)
+    SEARCH_MAX_RESULTS = config_data.get("SEARCH", {}).get("MAX_RESULTS", 5000)
+    TASK_POLL_MIN_INTERVAL = config_data.get("TASKS", {}).get("POLL_MIN_INTERVAL", 0.5)
+    TASK_POLL_MAX_INTERVAL = config_data.get("TASKS", {}).get("POLL_MAX_INTERVAL", 10)
+    TASK_RETENTION_SECONDS = config_data.get("TASKS", {}).get("RETENTION_SECONDS", 600)
+    DELTA_MAX_SNAPSHOTS = config_data.get("DELTA", {}).get("MAX_SNAPSHOTS", 2000)
+    DELTA_MAX_ENTRIES = config_data.get("DELTA", {}).get("MAX_ENTRIES", 2000000)
+    DIRSIZE_CONCURRENCY = config_data.get("DIRSIZE", {}).get("CONCURRENCY", 2)
+    DIRSIZE_MAX_AGE = config_data.get("DIRSIZE", {}).get("MAX_AGE", 3600)
+    DIRSIZE_MAX_ENTRIES = config_data.get("DIRSIZE", {}).get("MAX_ENTRIES", 10000)
+    DIRSIZE_WAIT_TIMEOUT = config_data.get("DIRSIZE", {}).get("WAIT_TIMEOUT", 20)
+    DIRSIZE_TIMEOUT = config_data.get("DIRSIZE", {}).get("TIMEOUT", 600)
+    DIRSIZE_POLL_MIN_INTERVAL = config_data.get("DIRSIZE", {}).get("POLL_MIN_INTERVAL", 0.3)
+    DIRSIZE_POLL_MAX_INTERVAL = config_data.get("DIRSIZE", {}).get("POLL_MAX_INTERVAL", 3)
+    THUMBNAIL_CACHE_ENABLED = config_data.get("THUMBNAIL", {}).get("CACHE_ENABLED", False)
+    THUMBNAIL_CACHE_DIR = config_data.get("THUMBNAIL", {}).get("CACHE_DIR", "thumbnail_cache")
+    THUMBNAIL_CACHE_MAX_BYTES = config_data.get("THUMBNAIL", {}).get("CACHE_MAX_BYTES", 256 * 1024 * 1024)
+    THUMBNAIL_MAX_AGE = config_data.get("THUMBNAIL", {}).get("MAX_AGE", 300)
+    THUMBNAIL_BATCH_MAX_PATHS = config_data.get("THUMBNAIL", {}).get("BATCH_MAX_PATHS", 200)
+    THUMBNAIL_BATCH_CONCURRENCY = config_data.get("THUMBNAIL", {}).get("BATCH_CONCURRENCY", 4)
+    SHARE_CACHE_TTL = config_data.get("SHARE", {}).get("CACHE_TTL", 300)
+    SHARE_BATCH_SIZE = config_data.get("SHARE", {}).get("BATCH_SIZE", 100)
+    SHARE_BULK_MAX_PATHS = config_data.get("SHARE", {}).get("BULK_MAX_PATHS", 1000)
+    INDEX_ENABLED = config_data.get("INDEX", {}).get("ENABLED", False)
+    INDEX_DB_FILE = config_data.get("INDEX", {}).get("DB_FILE", "metadata_index.db")
+    INDEX_CONCURRENCY = config_data.get("INDEX", {}).get("CONCURRENCY", 4)
+    INDEX_SEARCH_MAX_RESULTS = config_data.get("INDEX", {}).get("SEARCH_MAX_RESULTS", 1000)
+    SCHEDULER_MAX_CONCURRENCY = config_data.get("SCHEDULER", {}).get("MAX_CONCURRENCY", 10)
+    SCHEDULER_PER_USER_CONCURRENCY = config_data.get("SCHEDULER", {}).get("PER_USER_CONCURRENCY", 4)
+    SCHEDULER_BULK_CONCURRENCY = config_data.get("SCHEDULER", {}).get("BULK_CONCURRENCY", 6)
+    SCHEDULER_PER_USER_BYTES_PER_SEC = config_data.get("SCHEDULER", {}).get("PER_USER_BYTES_PER_SEC", 0)
+    SCHEDULER_PER_USER_BULK_CONCURRENCY = config_data.get("SCHEDULER", {}).get("PER_USER_BULK_CONCURRENCY", 4)
+    SCHEDULER_ACQUIRE_TIMEOUT = config_data.get("SCHEDULER", {}).get("ACQUIRE_TIMEOUT", 15)
+    HEALTH_SESSION_STATS_TTL = config_data.get("HEALTH", {}).get("SESSION_STATS_TTL", 30)
+    HEALTH_READY_TTL = config_data.get("HEALTH", {}).get("READY_TTL", 10)
+    HEALTH_READY_FAILURE_TTL = config_data.get("HEALTH", {}).get("READY_FAILURE_TTL", 2)
+    HEALTH_READY_TIMEOUT = config_data.get("HEALTH", {}).get("READY_TIMEOUT", 3)
+    LOGGING_LEVEL = config_data.get("LOGGING", {}).get("LEVEL", "INFO")
+    LOGGING_FILE = config_data.get("LOGGING", {}).get("FILE", "")
+    LOGGING_SAMPLE_EVERY = config_data.get("LOGGING", {}).get("SAMPLE_EVERY", {})
+    TRACING_ENABLED = config_data.get("TRACING", {}).get("ENABLED", False)
+    TRACING_SAMPLE_RATE = config_data.get("TRACING", {}).get("SAMPLE_RATE", 1.0)
+    TRACING_SERVER_TIMING = config_data.get("TRACING", {}).get("SERVER_TIMING", True)
+    TRACING_SERVICE_NAME = config_data.get("TRACING", {}).get("SERVICE_NAME", "dsm-api-wrapper")
+    TRACING_EXPORT_FILE = config_data.get("TRACING", {}).get("EXPORT_FILE", "")
+    TRACING_EXPORT_ENDPOINT = config_data.get("TRACING", {}).get("EXPORT_ENDPOINT", "")
+    PROFILING_ENABLED = config_data.get("PROFILING", {}).get("ENABLED", False)
+    PROFILING_MAX_PROFILES = config_data.get("PROFILING", {}).get("MAX_PROFILES", 20)
+    PROFILING_SLOW_REQUESTS = config_data.get("PROFILING", {}).get("SLOW_REQUESTS", 50)
+    PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+
+# 依設定調整全域日誌：等級、輸出位置（預設 stdout）與高頻事件取樣
+logger.configure(
+    Config.LOGGING_LEVEL,
+    open(Config.LOGGING_FILE, 'a', encoding='utf-8', buffering=1) if Config.LOGGING_FILE else None,
+    Config.LOGGING_SAMPLE_EVERY
+)
+
+# 依設定啟用請求追蹤；匯出到檔案或 collector 時由背景執行緒批次送出
+trace_exporter = None
+if Config.TRACING_ENABLED and (Config.TRACING_EXPORT_FILE or Config.TRACING_EXPORT_ENDPOINT):
+    trace_exporter = TraceExporter(
+        Config.TRACING_SERVICE_NAME,
+        file_path=Config.TRACING_EXPORT_FILE,
+        endpoint=Config.TRACING_EXPORT_ENDPOINT,
+        http_session=requests.Session() if Config.TRACING_EXPORT_ENDPOINT else None
+    )
+tracer.configure(Config.TRACING_ENABLED, trace_exporter, Config.TRACING_SAMPLE_RATE)
+logger.context = tracer.log_context
 
 # Session 管理類別
 class SessionManager:
     def __init__(self, session_file, expire_days=365):
         self.session_file = session_file
         self.expire_days = expire_days
+        self.file_status = "NOT_FOUND"  # 最近一次讀寫 session 檔案的結果，供健康檢查使用
+        self.stats_cache = None
+        # lock 保護 self.sessions 的增刪；save_lock 讓寫檔依序進行，較新的快照不會被舊的覆蓋
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
         self.sessions = self.load_sessions()
 
     def load_sessions(self):
@@ -42,26 +156,40 @@ class SessionManager:
                     data = json.load(f)
                     # 確保 data 是字典類型
                     if not isinstance(data, dict):
-                        print(f"[WARNING] Session 檔案格式錯誤，重新初始化")
+                        logger.warning("session_file_invalid", {"file": self.session_file})
+                        self.file_status = "ERROR"
                         return {}
                     # 清理過期的 sessions
                     self.cleanup_expired_sessions(data)
+                    self.file_status = "OK"
                     return data
             except (json.JSONDecodeError, IOError) as e:
-                print(f"[WARNING] 載入 session 檔案失敗: {e}")
+                self.file_status = "ERROR"
+                logger.warning("session_file_load_failed", {"file": self.session_file, "error": str(e)})
         return {}
 
     def save_sessions(self):
         """儲存 sessions 到檔案"""
         try:
-            # 確保 self.sessions 是字典
-            if not isinstance(self.sessions, dict):
-                self.sessions = {}
-            
-            with open(self.session_file, 'w', encoding='utf-8') as f:
-                json.dump(self.sessions, f, indent=2, ensure_ascii=False)
+            with self.save_lock:
+                # 在鎖內取快照再寫檔，避免其他請求同時登入時出現 dictionary changed size during iteration
+                with self.lock:
+                    # 確保 self.sessions 是字典
+                    if not isinstance(self.sessions, dict):
+                        self.sessions = {}
+                    snapshot = {session_id: dict(data) if isinstance(data, dict) else data
+                                for session_id, data in self.sessions.items()}
+                
+                # 先寫入暫存檔再替換，寫到一半失敗也不會留下損毀的 session 檔案
+                temp_file = f"{self.session_file}.tmp"
+                with tracer.span("session.save", sessions=len(snapshot)), \
+                        open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, indent=2, ensure_ascii=False)
+                os.replace(temp_file, self.session_file)
+            self.file_status = "OK"
         except IOError as e:
-            print(f"[ERROR] 儲存 session 檔案失敗: {e}")
+            self.file_status = "ERROR"
+            logger.error("session_file_save_failed", {"file": self.session_file, "error": str(e)})
 
     def cleanup_expired_sessions(self, sessions=None):
         """清理過期的 sessions"""
@@ -70,7 +198,7 @@ class SessionManager:
         
         # 確保 sessions 是字典類型
         if not isinstance(sessions, dict):
-            print(f"[WARNING] Sessions 資料類型錯誤，重新初始化")
+            logger.warning("sessions_type_invalid")
             if sessions is None:
                 self.sessions = {}
             return
@@ -78,15 +206,18 @@ class SessionManager:
         current_time = time.time()
         expired_sessions = []
         
-        for session_id, session_data in sessions.items():
+        with self.lock:
+            items = list(sessions.items())
+        for session_id, session_data in items:
             if isinstance(session_data, dict) and session_data.get('expires_at', 0) < current_time:
                 expired_sessions.append(session_id)
         
-        for session_id in expired_sessions:
-            del sessions[session_id]
+        with self.lock:
+            for session_id in expired_sessions:
+                sessions.pop(session_id, None)
         
         if expired_sessions:
-            print(f"[INFO] 清理了 {len(expired_sessions)} 個過期 session")
+            logger.info("sessions_expired_cleaned", {"count": len(expired_sessions)})
 
     def get_current_user_session_id(self):
         """獲取當前用戶的 session ID"""
@@ -96,6 +227,10 @@ class SessionManager:
 
     def get_user_session(self, session_id=None):
         """獲取用戶的 session 資料"""
+        with tracer.span("session.lookup"):
+            return self._get_user_session(session_id)
+
+    def _get_user_session(self, session_id=None):
         # 確保 self.sessions 是字典
         if not isinstance(self.sessions, dict):
             self.sessions = {}
@@ -127,7 +262,8 @@ class SessionManager:
         session_data['last_activity'] = time.time()
         session_data['session_id'] = session_id
         
-        self.sessions[session_id] = session_data
+        with self.lock:
+            self.sessions[session_id] = session_data
         self.save_sessions()
 
     def remove_session(self, session_id=None):
@@ -140,8 +276,9 @@ class SessionManager:
         if session_id is None:
             session_id = self.get_current_user_session_id()
         
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        with self.lock:
+            removed = self.sessions.pop(session_id, None)
+        if removed is not None:
             self.save_sessions()
 
     def is_logged_in(self, session_id=None):
@@ -165,6 +302,27 @@ class SessionManager:
             self.sessions[session_id]['last_activity'] = time.time()
             self.save_sessions()
 
+    def session_stats(self, max_age=30):
+        """session 總數與有效/過期數
+
+        總數直接取 dict 長度；過期數需掃描全部 session，只每 max_age 秒重新計算一次
+        （session 只會隨時間過期，新登入的都是有效的）。
+        """
+        sessions = self.sessions if isinstance(self.sessions, dict) else {}
+        now = time.time()
+        cached = self.stats_cache
+        if cached is None or now - cached[0] >= max_age:
+            expired = len([s for s in list(sessions.values())
+                           if isinstance(s, dict) and s.get('expires_at', 0) < now])
+            cached = self.stats_cache = (now, expired)
+        total = len(sessions)
+        expired = min(cached[1], total)
+        return {
+            "total_sessions": total,
+            "active_sessions": total - expired,
+            "expired_sessions": expired
+        }
+
     def get_all_sessions_info(self):
         """獲取所有 sessions 的資訊（用於調試）"""
         # 確保 self.sessions 是字典
@@ -173,7 +331,9 @@ class SessionManager:
             return []
         
         info = []
-        for session_id, session_data in self.sessions.items():
+        with self.lock:
+            items = list(self.sessions.items())
+        for session_id, session_data in items:
             if not isinstance(session_data, dict):
                 continue
                 
@@ -196,26 +356,46 @@ session_manager.save_sessions()
 # 建立requests session
 requests_session = requests.Session()
 requests_session.verify = False
+# 連線池大小需容納排程器允許的最大併發數
+nas_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.SCHEDULER_MAX_CONCURRENCY)
+requests_session.mount("https://", nas_adapter)
+requests_session.mount("http://", nas_adapter)
+
+# 建立 NAS 呼叫排程器
+nas_scheduler = NasScheduler(
+    max_concurrency=Config.SCHEDULER_MAX_CONCURRENCY,
+    per_user_concurrency=Config.SCHEDULER_PER_USER_CONCURRENCY,
+    bulk_concurrency=Config.SCHEDULER_BULK_CONCURRENCY,
+    per_user_bytes_per_sec=Config.SCHEDULER_PER_USER_BYTES_PER_SEC,
+    per_user_bulk_concurrency=Config.SCHEDULER_PER_USER_BULK_CONCURRENCY,
+    acquire_timeout=Config.SCHEDULER_ACQUIRE_TIMEOUT
+)
 
 # 工具類別
 class Utils:
-    def __init__(self, session_manager, requests_session, config):
+    def __init__(self, session_manager, requests_session, config, scheduler, download_cache=None,
+                 download_tokens=None, metrics=None):
         self.session_manager = session_manager
         self.requests_session = requests_session
         self.config = config
+        self.scheduler = scheduler
+        self.download_cache = download_cache
+        self.download_tokens = download_tokens
+        self.metrics = metrics or MetricsRegistry()
+        self.task_tracker = None
+        self.metadata_index = None
+        self.snapshot_store = None
+        self.dir_sizes = None
+        self.thumbnail_cache = None
+        self.share_links = None
+        self.parallel_buffer = None
+        self.invalidators = []
         self.timeout = (10, config.NAS_TIMEOUT)
 
     def string_to_hex(self, input_string):
         """將字串轉換為十六進制"""
         return input_string.encode('utf-8').hex()
 
-    def debug_log(self, message, data=None):
-        """Debug日誌"""
-        if data:
-            print(f"[DEBUG] {message}: {json.dumps(data, indent=2, ensure_ascii=False)}")
-        else:
-            print(f"[DEBUG] {message}")
-
     def is_logged_in(self, session_id=None):
         """檢查是否已登入"""
         return self.session_manager.is_logged_in(session_id)
@@ -224,6 +404,386 @@ class Utils:
         """獲取用戶 session"""
         return self.session_manager.get_user_session(session_id)
 
+    def get_user_key(self, user_session):
+        """取得排程用的使用者識別（帳號，其次為 session ID）"""
+        credentials = user_session.get('credentials')
+        if isinstance(credentials, dict) and credentials.get('account'):
+            return credentials['account']
+        return user_session.get('session_id', 'anonymous')
+
+    def nas_request(self, method, user_key, priority=PRIORITY_INTERACTIVE, url=None, queue_timeout=None, **kwargs):
+        """透過排程器呼叫 NAS API（排隊超過 queue_timeout 秒時拋出 SchedulerBusyError，預設依 SCHEDULER.ACQUIRE_TIMEOUT）"""
+        api, api_method = self.nas_api_labels(url, kwargs)
+        queued = time.perf_counter()
+        with tracer.span("nas.queue"):
+            self.scheduler.acquire(user_key, priority, queue_timeout)
+        try:
+            started = time.perf_counter()
+            self.metrics.observe('dsm_nas_queue_wait_seconds',
+                                 (("priority", "bulk" if priority == PRIORITY_BULK else "interactive"),),
+                                 started - queued)
+            with tracer.span("nas.request", SPAN_KIND_CLIENT, **{"dsm.api": api, "dsm.method": api_method}) as span:
+                try:
+                    response = self.requests_session.request(method, url or self.config.NAS_BASE_URL, **kwargs)
+                except Exception:
+                    self.record_nas_call(api, api_method, started, "exception")
+                    raise
+                if span is not None:
+                    span.set("http.status_code", response.status_code)
+            self.record_nas_call(api, api_method, started, response.status_code)
+            return response
+        finally:
+            self.scheduler.release(user_key, priority)
+
+    @staticmethod
+    def nas_api_labels(url, kwargs):
+        """由請求參數取出 DSM api/method，作為指標標籤"""
+        payload = kwargs.get('params') or kwargs.get('data')
+        if isinstance(payload, dict) and 'api' in payload:
+            return payload['api'], payload.get('method', '')
+        if url:
+            if '/fbdownload/' in url:
+                return 'fbdownload', 'download'
+            query = parse_qs(urlsplit(url).query)
+            if 'api' in query:
+                return query['api'][0], query.get('method', [''])[0]
+        return 'unknown', ''
+
+    def record_nas_call(self, api, api_method, started, status):
+        """記錄一次 NAS 呼叫的延遲與結果"""
+        labels = (("api", api), ("method", api_method))
+        self.metrics.observe('dsm_nas_request_duration_seconds', labels, time.perf_counter() - started)
+        self.metrics.inc('dsm_nas_requests_total', labels + (("status", str(status)),))
+        if status == "exception" or status >= 400:
+            self.metrics.inc('dsm_nas_request_errors_total', labels)
+
+    def add_invalidator(self, invalidator):
+        """註冊快取失效函式，參數為受影響的 NAS 路徑列表"""
+        self.invalidators.append(invalidator)
+
+    def invalidate_paths(self, paths):
+        """通知所有快取：這些路徑（含其下所有項目）已變更"""
+        prefixes = ['/' + path.strip('/') for path in paths]
+        for invalidator in self.invalidators:
+            try:
+                invalidator(prefixes)
+            except Exception as e:
+                logger.warning("cache_invalidation_failed", {"prefixes": prefixes, "error": str(e)})
+
+    @staticmethod
+    def path_affected(path, prefixes):
+        """判斷路徑是否等於或位於任一前綴之下"""
+        return any(path == prefix or path.startswith(prefix.rstrip('/') + '/') for prefix in prefixes)
+
+    def call_nas_api(self, user_session, params, http_method='get', priority=PRIORITY_INTERACTIVE):
+        """呼叫 NAS API 並回傳 data 欄位，失敗時拋出 NasApiError"""
+        params = dict(params, _sid=user_session['sid'])
+        headers = {"X-SYNO-TOKEN": user_session['syno_token']}
+        if http_method == 'get':
+            kwargs = {'params': params}
+        else:
+            kwargs = {'data': params}
+        
+        response = self.nas_request(http_method, self.get_user_key(user_session), priority, headers=headers, **kwargs)
+        response.raise_for_status()
+        
+        result = response.json()
+        if not result.get("success"):
+            error_code = result.get("error", {}).get("code", "未知錯誤")
+            self.metrics.inc('dsm_nas_api_errors_total',
+                             (("api", params.get("api", "")), ("method", params.get("method", "")),
+                              ("code", str(error_code))))
+            raise NasApiError(error_code)
+        return result.get("data", {})
+
+    def get_file_info(self, user_session, paths, additional=('size', 'time')):
+        """以 SYNO.FileStation.List getinfo 取得檔案資訊"""
+        data = self.call_nas_api(user_session, {
+            "api": "SYNO.FileStation.List",
+            "version": "2",
+            "method": "getinfo",
+            "path": json.dumps(list(paths)),
+            "additional": json.dumps(list(additional))
+        })
+        return data.get("files", [])
+
+    def get_mtimes(self, user_session, paths, batch_size=100):
+        """批次查詢路徑的 mtime，回傳 {path: mtime}；不存在的路徑不列出"""
+        paths = list(paths)
+        mtimes = {}
+        for start in range(0, len(paths), batch_size):
+            for info in self.get_file_info(user_session, paths[start:start + batch_size], additional=('time',)):
+                if not info.get('code'):
+                    mtimes[info['path']] = info.get('additional', {}).get('time', {}).get('mtime')
+        return mtimes
+
+    def iter_folder(self, user_session, folder_path, page_size=1000,
+                    additional=('real_path', 'size', 'owner', 'time', 'perm', 'type'),
+                    priority=PRIORITY_INTERACTIVE):
+        """分頁列出資料夾內容，逐筆產生項目"""
+        offset = 0
+        while True:
+            data = self.call_nas_api(user_session, {
+                "api": "SYNO.FileStation.List",
+                "version": "2",
+                "method": "list",
+                "folder_path": folder_path,
+                "filetype": "all",
+                "sort_by": "name",
+                "sort_direction": "ASC",
+                "offset": offset,
+                "limit": page_size,
+                "additional": json.dumps(list(additional))
+            }, priority=priority)
+            files = data.get("files", [])
+            for item in files:
+                yield item
+            offset += len(files)
+            if not files or offset >= data.get("total", 0):
+                break
+
+    def create_folders(self, user_session, pairs, force_parent=False):
+        """以最少的 SYNO.FileStation.CreateFolder 呼叫建立多個資料夾，回傳逐項結果
+
+        pairs 為 (父資料夾, 名稱) 列表，每批一次呼叫；某批失敗時拆成單項重試以取得逐項結果。
+        """
+        results = []
+        batch_size = self.config.CREATE_FOLDER_BATCH_SIZE
+        for start in range(0, len(pairs), batch_size):
+            results.extend(self._create_folder_batch(user_session, pairs[start:start + batch_size], force_parent))
+        return results
+
+    def _create_folder_batch(self, user_session, pairs, force_parent):
+        paths = [folder_path.rstrip('/') + '/' + name for folder_path, name in pairs]
+        try:
+            data = self.call_nas_api(user_session, {
+                "api": "SYNO.FileStation.CreateFolder",
+                "method": "create",
+                "version": "2",
+                "folder_path": json.dumps([folder_path for folder_path, _ in pairs]),
+                "name": json.dumps([name for _, name in pairs]),
+                "force_parent": str(force_parent).lower()
+            }, http_method='post')
+        except NasApiError as e:
+            if len(pairs) == 1:
+                return [{"path": paths[0], "success": False, "error": f"建立資料夾失敗: {e.code}"}]
+            results = []
+            for pair in pairs:
+                results.extend(self._create_folder_batch(user_session, [pair], force_parent))
+            return results
+        
+        created = {folder.get('path'): folder for folder in data.get('folders', [])}
+        return [{"path": path, "success": True, "folder": created.get(path)} for path in paths]
+
+    def list_share_links(self, user_session, page_size=1000):
+        """分頁列出使用者的所有分享連結"""
+        links = []
+        while True:
+            data = self.call_nas_api(user_session, {
+                "api": "SYNO.FileStation.Sharing",
+                "version": "3",
+                "method": "list",
+                "offset": len(links),
+                "limit": page_size
+            })
+            page = data.get("links", [])
+            links.extend(page)
+            if not page or len(links) >= data.get("total", 0):
+                return links
+
+    def create_share_links(self, user_session, paths, options=None):
+        """批次建立分享連結，回傳逐項結果；某批失敗時拆成單項重試"""
+        results = []
+        batch_size = self.config.SHARE_BATCH_SIZE
+        for start in range(0, len(paths), batch_size):
+            results.extend(self._create_share_batch(user_session, paths[start:start + batch_size], options or {}))
+        return results
+
+    def _create_share_batch(self, user_session, paths, options):
+        try:
+            data = self.call_nas_api(user_session, dict(options, **{
+                "api": "SYNO.FileStation.Sharing",
+                "version": "3",
+                "method": "create",
+                "path": json.dumps(paths)
+            }), http_method='post')
+        except NasApiError as e:
+            if len(paths) == 1:
+                return [{"path": paths[0], "success": False, "error": f"建立分享連結失敗: {e.code}"}]
+            results = []
+            for path in paths:
+                results.extend(self._create_share_batch(user_session, [path], options))
+            return results
+        
+        links = {link.get('path'): link for link in data.get('links', [])}
+        results = []
+        for path in paths:
+            link = links.get(path)
+            if link is None or link.get('error'):
+                error_code = (link or {}).get('error', '未知錯誤')
+                results.append({"path": path, "success": False, "error": f"建立分享連結失敗: {error_code}"})
+            else:
+                results.append({"path": path, "success": True, "link": link})
+        return results
+
+    def iter_search_results(self, user_session, search_params, limit=None, page_size=500, cancel_event=None):
+        """啟動 SYNO.FileStation.Search 任務，逐步產生已找到的項目，結束或中斷時清除任務"""
+        data = self.call_nas_api(user_session, dict(search_params, **{
+            "api": "SYNO.FileStation.Search",
+            "version": "2",
+            "method": "start"
+        }))
+        task_id = data["taskid"]
+        emitted = 0
+        interval = self.config.SEARCH_POLL_MIN_INTERVAL
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                data = self.call_nas_api(user_session, {
+                    "api": "SYNO.FileStation.Search",
+                    "version": "2",
+                    "method": "list",
+                    "taskid": task_id,
+                    "offset": emitted,
+                    "limit": page_size if limit is None else min(page_size, limit - emitted),
+                    "additional": json.dumps(["size", "time", "type"])
+                })
+                files = data.get("files", [])
+                for item in files:
+                    yield item
+                emitted += len(files)
+                
+                if limit is not None and emitted >= limit:
+                    return
+                if files and emitted < data.get("total", 0):
+                    # 已有結果可讀，不等待直接取下一頁
+                    interval = self.config.SEARCH_POLL_MIN_INTERVAL
+                    continue
+                if data.get("finished"):
+                    return
+                time.sleep(interval)
+                interval = min(interval * 1.5, self.config.SEARCH_POLL_MAX_INTERVAL)
+        finally:
+            for method in ("stop", "clean"):
+                try:
+                    self.call_nas_api(user_session, {
+                        "api": "SYNO.FileStation.Search",
+                        "version": "2",
+                        "method": method,
+                        "taskid": task_id
+                    })
+                except Exception as e:
+                    logger.warning("search_cleanup_failed", {"task_id": task_id, "error": str(e)})
+
+    def compute_dir_size(self, user_session, folder_path):
+        """以 SYNO.FileStation.DirSize 任務計算資料夾大小，完成或逾時後停止任務"""
+        data = self.call_nas_api(user_session, {
+            "api": "SYNO.FileStation.DirSize",
+            "version": "2",
+            "method": "start",
+            "path": json.dumps([folder_path])
+        }, priority=PRIORITY_BULK)
+        task_id = data["taskid"]
+        deadline = time.monotonic() + self.config.DIRSIZE_TIMEOUT
+        interval = self.config.DIRSIZE_POLL_MIN_INTERVAL
+        try:
+            while True:
+                time.sleep(interval)
+                data = self.call_nas_api(user_session, {
+                    "api": "SYNO.FileStation.DirSize",
+                    "version": "2",
+                    "method": "status",
+                    "taskid": task_id
+                }, priority=PRIORITY_BULK)
+                if data.get("finished"):
+                    return data
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"計算資料夾大小逾時: {folder_path}")
+                interval = min(interval * 1.5, self.config.DIRSIZE_POLL_MAX_INTERVAL)
+        finally:
+            try:
+                self.call_nas_api(user_session, {
+                    "api": "SYNO.FileStation.DirSize",
+                    "version": "2",
+                    "method": "stop",
+                    "taskid": task_id
+                })
+            except Exception:
+                pass
+
+    def fetch_thumbnail(self, user_session, file_path, size_class):
+        """以 SYNO.FileStation.Thumb 取得縮圖位元組"""
+        params = {
+            "api": "SYNO.FileStation.Thumb",
+            "version": "2",
+            "method": "get",
+            "path": file_path,
+            "size": size_class,
+            "_sid": user_session['sid']
+        }
+        headers = {"X-SYNO-TOKEN": user_session['syno_token']}
+        response = self.nas_request('get', self.get_user_key(user_session), params=params, headers=headers)
+        response.raise_for_status()
+        # 失敗時 NAS 回傳 JSON 錯誤而不是圖片
+        if response.headers.get('Content-Type', '').startswith(('application/json', 'text/')):
+            error_code = response.json().get("error", {}).get("code", "未知錯誤")
+            raise NasApiError(error_code)
+        return response.content
+
+    def get_thumbnail(self, user_session, file_path, mtime, size_class):
+        """取得縮圖，回傳 (ETag, 位元組)；快取鍵包含 mtime，檔案變更後自動失效"""
+        key = DiskLRUCache.make_key(file_path, mtime, size_class)
+        cache = self.thumbnail_cache
+        if cache is None:
+            return key, self.fetch_thumbnail(user_session, file_path, size_class)
+        
+        cached_path = cache.get(key)
+        if cached_path:
+            try:
+                with open(cached_path, 'rb') as f:
+                    return key, f.read()
+            except OSError:
+                pass
+        
+        data = self.fetch_thumbnail(user_session, file_path, size_class)
+        writer = cache.writer(key, len(data), tag=file_path)
+        if writer:
+            writer.write(data)
+            writer.commit()
+        return key, data
+
+    def nas_upload(self, user_session, file_name, file_data, fields):
+        """以串流方式上傳檔案，並套用使用者頻寬限制"""
+        user_key = self.get_user_key(user_session)
+        # 檔案欄位必須放在最後
+        with tracer.span("upload.encode", size=len(file_data)):
+            body, content_type = encode_multipart_formdata(list(fields.items()) + [('file', (file_name, file_data))])
+        upload_url = f"{self.config.NAS_BASE_URL}?api=SYNO.FileStation.Upload&method=upload&version=2&_sid={user_session['sid']}"
+        headers = {
+            "X-SYNO-TOKEN": user_session['syno_token'],
+            "Content-Type": content_type
+        }
+        response = self.nas_request(
+            'post', user_key, PRIORITY_BULK, url=upload_url,
+            data=ThrottledReader(self.scheduler, user_key, BytesIO(body), len(body)),
+            headers=headers
+        )
+        self.metrics.inc('dsm_upload_bytes_total', amount=len(body))
+        return response
+
+    def check_nas_ready(self):
+        """以不需登入的 SYNO.API.Info 確認 NAS 可連線且 API 正常回應"""
+        response = self.nas_request(
+            'get', 'readiness',
+            params={"api": "SYNO.API.Info", "version": "1", "method": "query", "query": "SYNO.API.Auth"},
+            queue_timeout=self.config.HEALTH_READY_TIMEOUT,
+            timeout=self.config.HEALTH_READY_TIMEOUT
+        )
+        response.raise_for_status()
+        if not response.json().get("success"):
+            raise Exception("SYNO.API.Info 回傳失敗")
+
     def nas_login(self, account, password):
         """登入NAS系統"""
         login_params = {
@@ -243,8 +803,8 @@ class Utils:
             "client": "browser"
         }
         
-        response = self.requests_session.get(
-            self.config.NAS_BASE_URL,
+        response = self.nas_request(
+            'get', account,
             params=login_params,
             timeout=self.timeout
         )
@@ -265,11 +825,9 @@ class Utils:
         
         self.session_manager.set_user_session(session_data)
         
-        self.debug_log("登入成功", {
+        logger.info("login", lambda: {
             "account": account,
-            "session_id": self.session_manager.get_current_user_session_id()[:8] + "...",
-            "sid": session_data['sid'][:20] + "...",
-            "syno_token": session_data['syno_token'][:20] + "..."
+            "session_id": self.session_manager.get_current_user_session_id()[:8] + "..."
         })
         
         return {
@@ -298,16 +856,77 @@ class Utils:
             
             headers = {"X-SYNO-TOKEN": user_session['syno_token']}
             
-            self.requests_session.get(self.config.NAS_BASE_URL, params=params, headers=headers)
+            self.nas_request('get', self.get_user_key(user_session), params=params, headers=headers)
             
         except Exception as e:
-            self.debug_log("登出 API 呼叫失敗", str(e))
+            logger.warning("logout_api_failed", {"error": str(e)})
         
         # 移除本地 session
         self.session_manager.remove_session()
         
         return {"success": True, "message": "登出成功"}
 
+    def download_url_builder(self, user_session):
+        """預先組好與 session 相關的部分，回傳 file_path -> fbdownload 連結的函式"""
+        # 使用 _sid 參數的版本，移除 SynoHash
+        base_url = self.config.NAS_BASE_URL.replace('/webapi/entry.cgi', '')
+        query_suffix = (
+            f"noCache={int(time.time() * 1000)}&"
+            f"mode=download&"
+            f"stdhtml=false&"
+            f"_sid={user_session['sid']}&"
+            f"SynoToken={user_session['syno_token']}"
+        )
+        
+        def build(file_path):
+            hex_path = self.string_to_hex(file_path)
+            file_name = file_path.split("/")[-1]
+            return f"{base_url}/fbdownload/{file_name}?dlink=%22{hex_path}%22&{query_suffix}"
+        
+        return build
+
+    def build_download_url(self, user_session, file_path):
+        """組出 fbdownload 下載連結"""
+        return self.download_url_builder(user_session)(file_path)
+
+    def open_download_stream(self, user_session, file_path, headers=None):
+        """由伺服器向 NAS 開啟下載串流，回傳 (NAS 回應, DownloadStream)"""
+        if not file_path.startswith('/'):
+            file_path = '/' + file_path
+        
+        user_key = self.get_user_key(user_session)
+        download_url = self.build_download_url(user_session, file_path)
+        
+        # 下載代理屬於大量傳輸，名額持有到串流結束
+        with tracer.span("nas.queue"):
+            self.scheduler.acquire(user_key, PRIORITY_BULK)
+        started = time.perf_counter()
+        try:
+            with tracer.span("nas.request", SPAN_KIND_CLIENT, **{"dsm.api": "fbdownload", "dsm.method": "download"}):
+                response = self.requests_session.get(
+                    download_url,
+                    headers=forward_request_headers(headers or {}),
+                    stream=True,
+                    timeout=self.timeout
+                )
+        except Exception:
+            self.record_nas_call('fbdownload', 'download', started, "exception")
+            self.scheduler.release(user_key, PRIORITY_BULK)
+            raise
+        self.record_nas_call('fbdownload', 'download', started, response.status_code)
+        
+        def on_chunk(chunk):
+            self.metrics.inc('dsm_download_bytes_total', amount=len(chunk))
+            self.scheduler.throttle(user_key, len(chunk))
+        
+        stream = DownloadStream(
+            response,
+            self.config.DOWNLOAD_CHUNK_SIZE,
+            on_chunk=on_chunk,
+            on_close=lambda: self.scheduler.release(user_key, PRIORITY_BULK)
+        )
+        return response, stream
+
     def generate_download_link_with_sid(self, file_path):
         """生成包含_sid的下載連結"""
         user_session = self.get_user_session()
@@ -322,32 +941,113 @@ class Utils:
         if not file_path.startswith('/'):
             file_path = '/' + file_path
             
-        hex_path = self.string_to_hex(file_path)
-        file_name = file_path.split("/")[-1]
+        download_url = self.build_download_url(user_session, file_path)
         
-        # 使用 _sid 參數的版本，移除 SynoHash
-        base_url = self.config.NAS_BASE_URL.replace('/webapi/entry.cgi', '')
-        download_url = (
-            f"{base_url}/fbdownload/{file_name}?"
-            f"dlink=%22{hex_path}%22&"
-            f"noCache={int(time.time() * 1000)}&"
-            f"mode=download&"
-            f"stdhtml=false&"
-            f"_sid={user_session['sid']}&"
-            f"SynoToken={user_session['syno_token']}"
-        )
-        
-        self.debug_log("生成下載連結（含_sid）", {
+        logger.debug("download_link", lambda: {
             "file_path": file_path,
-            "hex_path": hex_path,
             "download_url": download_url,
-            "session_id": self.session_manager.get_current_user_session_id()[:8] + "...",
-            "sid": user_session['sid'][:20] + "...",
-            "syno_token": user_session['syno_token'][:20] + "..."
+            "session_id": self.session_manager.get_current_user_session_id()[:8] + "..."
         })
         
         return download_url
 
+    def issue_download_token(self, user_session, file_path):
+        """簽發短效下載 token，之後下載不需查詢 session"""
+        if self.download_tokens is None:
+            raise Exception("未設定下載 token 密鑰")
+        if not file_path.startswith('/'):
+            file_path = '/' + file_path
+        return self.download_tokens.issue(
+            file_path,
+            self.get_user_key(user_session),
+            user_session['sid'],
+            user_session['syno_token']
+        )
+
+    def generate_download_links_with_sid(self, file_paths, user_session=None):
+        """批次生成包含_sid的下載連結，session 查詢與活動時間更新只做一次"""
+        if user_session is None:
+            user_session = self.get_user_session()
+        
+        if not user_session or not user_session.get('syno_token') or not user_session.get('sid'):
+            raise Exception("請先登入")
+        
+        # 更新最後活動時間
+        self.session_manager.update_last_activity(user_session.get('session_id'))
+        
+        build = self.download_url_builder(user_session)
+        links = []
+        for file_path in file_paths:
+            # 確保路徑以 / 開頭
+            if not file_path.startswith('/'):
+                file_path = '/' + file_path
+            links.append({"path": file_path, "url": build(file_path)})
+        
+        logger.debug("download_links_batch", lambda: {
+            "count": len(links),
+            "session_id": str(user_session.get('session_id', ''))[:8] + "..."
+        })
+        
+        return links
+
+    def open_parallel_download(self, user_session, file_path):
+        """以多條平行範圍請求向 NAS 下載大型檔案
+
+        回傳 (探測回應, ParallelRangeFetcher)；檔案小於門檻或 NAS 不支援 Range 時回傳 (探測回應, None)
+        """
+        if not file_path.startswith('/'):
+            file_path = '/' + file_path
+        
+        user_key = self.get_user_key(user_session)
+        download_url = self.build_download_url(user_session, file_path)
+        
+        # 先取 1 位元組以得知檔案大小與 ETag
+        probe = self.nas_request(
+            'get', user_key, PRIORITY_BULK, url=download_url,
+            headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'},
+            stream=True,
+            timeout=self.timeout
+        )
+        probe.close()
+        content_range = probe.headers.get('Content-Range', '')
+        if probe.status_code != 206 or '/' not in content_range or content_range.endswith('/*'):
+            return probe, None
+        
+        total_size = int(content_range.rsplit('/', 1)[1])
+        if total_size < self.config.DOWNLOAD_PARALLEL_MIN_SIZE:
+            return probe, None
+        
+        etag = probe.headers.get('ETag')
+        
+        def fetch_range(start, end):
+            headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+            if etag:
+                # 檔案在下載途中被修改時 NAS 會回傳 200，避免拼接出不一致的內容
+                headers['If-Range'] = etag
+            response = self.nas_request('get', user_key, PRIORITY_BULK, url=download_url,
+                                        headers=headers, timeout=self.timeout)
+            data = response.content
+            if response.status_code != 206 or len(data) != end - start + 1:
+                raise Exception(f"範圍下載失敗: bytes={start}-{end}, HTTP {response.status_code}")
+            self.metrics.inc('dsm_download_bytes_total', amount=len(data))
+            self.scheduler.throttle(user_key, len(data))
+            return data
+        
+        # 每個範圍都要取得大量傳輸名額，超過每位使用者上限的連線只會在排程器排隊
+        worker_limit = self.scheduler.per_user_bulk_concurrency
+        fetcher = ParallelRangeFetcher(
+            fetch_range,
+            total_size,
+            self.config.DOWNLOAD_PARALLEL_PART_SIZE,
+            self.config.DOWNLOAD_CHUNK_SIZE,
+            min_workers=min(self.config.DOWNLOAD_PARALLEL_MIN_WORKERS, worker_limit),
+            max_workers=min(self.config.DOWNLOAD_PARALLEL_MAX_WORKERS, worker_limit),
+            max_buffered_parts=self.config.DOWNLOAD_PARALLEL_MAX_BUFFERED_PARTS,
+            budget=self.parallel_buffer,
+            budget_timeout=self.config.SCHEDULER_ACQUIRE_TIMEOUT
+        )
+        return probe, fetcher
+
     def get_session_info(self):
         """獲取當前用戶的 session 資訊"""
         user_session = self.get_user_session()
@@ -363,8 +1063,132 @@ class Utils:
             'is_logged_in': self.is_logged_in()
         }
 
+# 初始化下載快取（選用）
+download_cache = None
+if Config.DOWNLOAD_CACHE_ENABLED:
+    download_cache = DiskLRUCache(
+        Config.DOWNLOAD_CACHE_DIR,
+        Config.DOWNLOAD_CACHE_MAX_BYTES,
+        Config.DOWNLOAD_CACHE_MAX_FILE_BYTES
+    )
+
+# 初始化縮圖快取
+thumbnail_cache = None
+if Config.THUMBNAIL_CACHE_ENABLED:
+    thumbnail_cache = DiskLRUCache(Config.THUMBNAIL_CACHE_DIR, Config.THUMBNAIL_CACHE_MAX_BYTES)
+
+# 初始化下載 token 簽發器（可用獨立密鑰，讓多個 worker 行程共用）
+download_token_secret = os.getenv("DOWNLOAD_TOKEN_SECRET") or app.secret_key
+download_token_signer = None
+if download_token_secret and download_tokens_available():
+    download_token_signer = DownloadTokenSigner(download_token_secret, Config.DOWNLOAD_TOKEN_TTL)
+elif download_token_secret:
+    logger.warning("download_tokens_disabled", {"reason": "cryptography 未安裝"})
+
+# 初始化指標
+metrics = MetricsRegistry()
+
 # 初始化工具
-utils = Utils(session_manager, requests_session, Config)
+utils = Utils(session_manager, requests_session, Config, nas_scheduler, download_cache, download_token_signer,
+              metrics=metrics)
+
+if download_cache is not None:
+    utils.add_invalidator(
+        lambda prefixes: download_cache.invalidate(lambda tag: Utils.path_affected(tag, prefixes))
+    )
+
+# 所有平行下載共用的重組緩衝上限
+utils.parallel_buffer = BufferBudget(Config.DOWNLOAD_PARALLEL_MAX_BUFFER_BYTES)
+
+# 增量列表快照（僅存於記憶體）
+utils.snapshot_store = SnapshotStore(Config.DELTA_MAX_SNAPSHOTS, Config.DELTA_MAX_ENTRIES)
+
+# 資料夾大小快取
+utils.dir_sizes = DirSizeCache(
+    utils.compute_dir_size,
+    concurrency=Config.DIRSIZE_CONCURRENCY,
+    max_age=Config.DIRSIZE_MAX_AGE,
+    max_entries=Config.DIRSIZE_MAX_ENTRIES
+)
+utils.add_invalidator(utils.dir_sizes.invalidate)
+
+# 分享連結快取
+utils.share_links = ShareLinkCache(Config.SHARE_CACHE_TTL)
+utils.add_invalidator(utils.share_links.invalidate)
+
+if Config.INDEX_ENABLED:
+    utils.metadata_index = MetadataIndex(Config.INDEX_DB_FILE)
+    utils.add_invalidator(utils.metadata_index.invalidate)
+
+utils.thumbnail_cache = thumbnail_cache
+if thumbnail_cache is not None:
+    utils.add_invalidator(
+        lambda prefixes: thumbnail_cache.invalidate(lambda tag: Utils.path_affected(tag, prefixes))
+    )
+
+# 剖析與最慢請求紀錄（需啟用 PROFILING 並設定 PROFILING_ADMIN_TOKEN 才能使用）
+utils.profiler = None
+utils.profile_store = None
+utils.slow_requests = None
+if Config.PROFILING_ENABLED:
+    utils.profiler = RequestProfiler()
+    utils.profile_store = ProfileStore(Config.PROFILING_MAX_PROFILES)
+    utils.slow_requests = SlowRequestLog(Config.PROFILING_SLOW_REQUESTS)
+    if not Config.PROFILING_ADMIN_TOKEN:
+        logger.warning("profiling_admin_token_missing")
+
+# 就緒檢查（結果快取，避免負載平衡器的頻繁探測打到 NAS）
+utils.readiness = ReadinessProbe(utils.check_nas_ready, Config.HEALTH_READY_TTL, Config.HEALTH_READY_FAILURE_TTL)
+
+# 初始化任務追蹤器（透過 utils 查詢 NAS 任務狀態）
+utils.task_tracker = TaskTracker(
+    utils.call_nas_api,
+    min_interval=Config.TASK_POLL_MIN_INTERVAL,
+    max_interval=Config.TASK_POLL_MAX_INTERVAL,
+    retention_seconds=Config.TASK_RETENTION_SECONDS
+)
+
+# 註冊指標說明與抓取時才計算的量測值
+def nas_pool_usage():
+    """NAS 連線池使用中的連線數與上限"""
+    samples = []
+    pools = nas_adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        labels = (("host", pool.host),)
+        samples.append((labels + (("state", "in_use"),), pool.pool.maxsize - pool.pool.qsize()))
+        samples.append((labels + (("state", "max"),), pool.pool.maxsize))
+    return samples
+
+def session_counts():
+    stats = session_manager.session_stats(Config.HEALTH_SESSION_STATS_TTL)
+    return [((("state", "active"),), stats["active_sessions"]), ((("state", "expired"),), stats["expired_sessions"])]
+
+metrics.describe('dsm_http_requests_total', 'counter', 'Flask 請求數（依路由、方法、狀態碼）')
+metrics.describe('dsm_http_request_errors_total', 'counter', 'Flask 5xx 回應數')
+metrics.describe('dsm_http_request_duration_seconds', 'histogram', 'Flask 請求處理時間（含回應傳送；檔案與下載串流只計到開始傳送）')
+metrics.describe('dsm_nas_requests_total', 'counter', 'NAS 呼叫數（依 DSM api、method、HTTP 狀態碼）')
+metrics.describe('dsm_nas_request_errors_total', 'counter', 'NAS 呼叫連線失敗或 HTTP 錯誤數')
+metrics.describe('dsm_nas_api_errors_total', 'counter', 'DSM API 回傳 success=false 的次數（依錯誤碼）')
+metrics.describe('dsm_nas_request_duration_seconds', 'histogram', 'NAS 呼叫延遲（串流下載為取得回應標頭的時間）')
+metrics.describe('dsm_nas_queue_wait_seconds', 'histogram', '等待排程器名額的時間')
+metrics.describe('dsm_upload_bytes_total', 'counter', '上傳到 NAS 的位元組數')
+metrics.describe('dsm_download_bytes_total', 'counter', '經由伺服器自 NAS 下載的位元組數')
+metrics.gauge('dsm_nas_pool_connections', 'NAS 連線池連線數', nas_pool_usage)
+metrics.gauge('dsm_scheduler', '排程器狀態',
+              lambda: [((("state", key),), value) for key, value in nas_scheduler.stats().items()])
+metrics.gauge('dsm_sessions', '使用者 session 數', session_counts)
+if download_cache is not None:
+    metrics.gauge('dsm_download_cache', '下載快取統計',
+                  lambda: [((("stat", key),), value) for key, value in download_cache.stats().items()])
+if thumbnail_cache is not None:
+    metrics.gauge('dsm_thumbnail_cache', '縮圖快取統計',
+                  lambda: [((("stat", key),), value) for key, value in thumbnail_cache.stats().items()])
+if trace_exporter is not None:
+    metrics.gauge('dsm_trace_export', '追蹤匯出統計',
+                  lambda: [((("stat", key),), value) for key, value in trace_exporter.stats().items()])
 
 # 註冊路由
 register_routes(app, session_manager, requests_session, Config, utils)
\ No newline at end of file
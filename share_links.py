@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+def is_reusable(link):
+    """有效且未設密碼、到期日與生效日的連結可直接重用
+
+    有期限的連結即使目前有效，也可能在快取期間過期或尚未生效，因此一律不重用。
+    """
+    if link.get('status', 'valid') != 'valid' or link.get('has_password'):
+        return False
+    return not any(link.get(key) not in (None, '', 0, '0') for key in ('date_expired', 'date_available'))
+
+
+class ShareLinkCache:
+    """每位使用者的分享連結快取（路徑 -> 連結）
+
+    快取超過 ttl 秒後下次查詢時以 loader 重新向 NAS 取得完整列表；
+    建立、編輯、刪除連結時直接更新快取，不必重新列出。
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.users = {}  # owner -> (載入時間, {path: link})
+
+    def links(self, owner, loader, refresh=False):
+        """取得使用者所有連結 {path: link}"""
+        with self.lock:
+            cached = self.users.get(owner)
+            if cached is not None and not refresh and time.time() - cached[0] < self.ttl:
+                return dict(cached[1])
+        links = {}
+        for link in loader():
+            # 同一路徑有多個連結時優先保留可重用的
+            if link.get('path') not in links or is_reusable(link):
+                links[link.get('path')] = link
+        with self.lock:
+            self.users[owner] = (time.time(), links)
+        return dict(links)
+
+    def find_reusable(self, owner, paths, loader):
+        """回傳可重用的連結 {path: link}"""
+        links = self.links(owner, loader)
+        return {path: links[path] for path in paths if path in links and is_reusable(links[path])}
+
+    def put(self, owner, links):
+        """加入新建立的連結；快取尚未載入時略過，下次查詢會完整載入"""
+        with self.lock:
+            cached = self.users.get(owner)
+            if cached is None:
+                return
+            for link in links:
+                path = link.get('path')
+                if path not in cached[1] or is_reusable(link) or not is_reusable(cached[1][path]):
+                    cached[1][path] = link
+
+    def remove(self, owner, link_ids):
+        with self.lock:
+            cached = self.users.get(owner)
+            if cached is None:
+                return
+            for path in [path for path, link in cached[1].items() if link.get('id') in link_ids]:
+                del cached[1][path]
+
+    def forget(self, owner):
+        """捨棄使用者的快取（例如連結設定被修改）"""
+        with self.lock:
+            self.users.pop(owner, None)
+
+    def invalidate(self, prefixes):
+        """路徑已刪除或移動，對應的連結在 NAS 上失效"""
+        with self.lock:
+            for _, links in self.users.values():
+                for path in [path for path in links
+                             if any(path == prefix or path.startswith(prefix.rstrip('/') + '/')
+                                    for prefix in prefixes)]:
+                    del links[path]
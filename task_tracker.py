@@ -0,0 +1,142 @@
+import threading
+import time
+
+
+class TaskTracker:
+    """追蹤 NAS 非同步任務（刪除、壓縮等）
+
+    每個任務只有一個背景輪詢執行緒，依進度是否變化調整輪詢間隔；
+    所有客戶端共用同一份進度，不會各自向 NAS 查詢。
+    """
+
+    def __init__(self, call_nas_api, min_interval=0.5, max_interval=10, backoff=1.5,
+                 retention_seconds=600, max_errors=3):
+        self.call_nas_api = call_nas_api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.retention_seconds = retention_seconds
+        self.max_errors = max_errors
+        self.cond = threading.Condition()
+        self.tasks = {}
+
+    def track(self, task_id, api, version, kind, owner, user_session, on_finish=None):
+        """開始追蹤任務"""
+        task = {
+            "task_id": task_id,
+            "api": api,
+            "kind": kind,
+            "owner": owner,
+            "status": "running",
+            "progress": 0,
+            "data": {},
+            "error": None,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+            "finished_at": None,
+            "version": 0
+        }
+        # 只保留輪詢所需的 NAS 憑證
+        credentials = {
+            'sid': user_session['sid'],
+            'syno_token': user_session['syno_token'],
+            'credentials': {'account': owner}
+        }
+        with self.cond:
+            self._purge()
+            self.tasks[task_id] = task
+        threading.Thread(
+            target=self._poll,
+            args=(task, version, credentials, on_finish),
+            name=f"task-poller-{task_id}",
+            daemon=True
+        ).start()
+        return self.snapshot(task)
+
+    def _poll(self, task, version, credentials, on_finish):
+        interval = self.min_interval
+        errors = 0
+        while True:
+            time.sleep(interval)
+            try:
+                data = self.call_nas_api(credentials, {
+                    "api": task["api"],
+                    "version": version,
+                    "method": "status",
+                    "taskid": task["task_id"]
+                })
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors < self.max_errors:
+                    interval = min(interval * self.backoff, self.max_interval)
+                    continue
+                self._update(task, status="error", error=str(e))
+                break
+
+            finished = bool(data.get("finished"))
+            changed = data != task["data"]
+            self._update(
+                task,
+                data=data,
+                progress=data.get("progress", task["progress"]),
+                status="finished" if finished else "running"
+            )
+            if finished:
+                break
+            # 有進度就維持快速輪詢，沒有變化則逐步拉長間隔
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+
+        if on_finish:
+            try:
+                on_finish(self.snapshot(task))
+            except Exception:
+                pass
+
+    def _update(self, task, **fields):
+        with self.cond:
+            task.update(fields)
+            task["updated_at"] = time.time()
+            if task["status"] != "running" and task["finished_at"] is None:
+                task["finished_at"] = task["updated_at"]
+            task["version"] += 1
+            self.cond.notify_all()
+
+    def _purge(self):
+        """移除結束超過保留時間的任務"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [task_id for task_id, task in self.tasks.items()
+                   if task["finished_at"] is not None and task["finished_at"] < cutoff]
+        for task_id in expired:
+            del self.tasks[task_id]
+
+    @staticmethod
+    def snapshot(task):
+        return {key: value for key, value in task.items() if key != "owner"}
+
+    def get(self, task_id, owner):
+        """取得任務目前狀態，非擁有者視為不存在"""
+        with self.cond:
+            task = self.tasks.get(task_id)
+            if task is None or task["owner"] != owner:
+                return None
+            return self.snapshot(task)
+
+    def list_tasks(self, owner):
+        """列出使用者的任務"""
+        with self.cond:
+            self._purge()
+            return [self.snapshot(task) for task in self.tasks.values() if task["owner"] == owner]
+
+    def wait_for_change(self, task_id, owner, version, timeout):
+        """等待任務狀態版本超過 version，逾時回傳目前狀態"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                task = self.tasks.get(task_id)
+                if task is None or task["owner"] != owner:
+                    return None
+                remaining = deadline - time.monotonic()
+                if task["version"] > version or task["status"] != "running" or remaining <= 0:
+                    return self.snapshot(task)
+                self.cond.wait(remaining)
@@ -39,6 +39,10 @@ class DSMApiTester:
                     if key not in config[section]:
                         raise ValueError(f"配置檔案 {section} 段落缺少 {key}")
             
+            # 與伺服器相同，NAS_BASE_URL 環境變數優先（例如指向 mock_dsm.py）
+            if os.getenv("NAS_BASE_URL"):
+                config['NAS']['NAS_BASE_URL'] = os.getenv("NAS_BASE_URL")
+            
             print(f"✅ 成功載入配置檔案: {self.config_file}")
             return config
             
@@ -1144,7 +1148,7 @@ def main():
     print("-" * 60)
     
     # 檢查配置檔案是否存在
-    config_file = "config.json"
+    config_file = os.getenv("DSM_CONFIG_FILE", "config.json")
     if not os.path.exists(config_file):
         print(f"❌ 找不到配置檔案: {config_file}")
         print("請確認 config.json 檔案存在於當前目錄")
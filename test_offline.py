@@ -0,0 +1,325 @@
+"""離線整合測試：內嵌 mock_dsm.MockDSM，直接以 Flask test client 驅動 API
+
+不需要實體 NAS 或另外啟動伺服器：
+    python -m unittest test_offline
+    python -m pytest test_offline.py
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zipfile
+
+from mock_dsm import MockDSM
+from scheduler import NasScheduler, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from errors import SchedulerBusyError
+
+BASE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+FILE_SIZE = 1000
+CACHE_MAX_BYTES = 2500  # 可放兩個測試檔案，第三個會觸發淘汰
+
+server = None
+mock = None
+mock_server = None
+workdir = None
+
+
+def setUpModule():
+    """啟動模擬 NAS，並以暫存設定檔匯入 server（server 在匯入時讀取設定）"""
+    global server, mock, mock_server, workdir
+    workdir = tempfile.mkdtemp(prefix="dsm_test_")
+    mock = MockDSM(root=os.path.join(workdir, "nas"), task_duration=0.1)
+    mock_server, nas_base_url = mock.serve(port=0)
+    for path in ("/home/www/a.txt", "/home/www/b.txt", "/home/www/sub/c.txt",
+                 "/home/www/cache/1.txt", "/home/www/cache/2.txt", "/home/www/cache/3.txt"):
+        write_nas_file(path, os.urandom(FILE_SIZE))
+    os.makedirs(mock.real_path("/home/www/delta"), exist_ok=True)
+
+    with open(BASE_CONFIG, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config["SESSION"]["SESSION_FILE"] = os.path.join(workdir, "session.json")
+    config.setdefault("DOWNLOAD", {}).update({
+        "CACHE_ENABLED": True,
+        "CACHE_DIR": os.path.join(workdir, "download_cache"),
+        "CACHE_MAX_BYTES": CACHE_MAX_BYTES
+    })
+    config.setdefault("SCHEDULER", {})["ACQUIRE_TIMEOUT"] = 1
+    config.setdefault("INDEX", {})["DB_FILE"] = os.path.join(workdir, "metadata_index.db")
+    config.setdefault("LOGGING", {})["LEVEL"] = "ERROR"
+    config.setdefault("TRACING", {}).update({"EXPORT_FILE": "", "EXPORT_ENDPOINT": ""})
+    config_file = os.path.join(workdir, "config.json")
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    os.environ["NAS_BASE_URL"] = nas_base_url
+    os.environ["DSM_CONFIG_FILE"] = config_file
+    os.environ.setdefault("FLASK_SECRET_KEY", uuid.uuid4().hex)
+    import server as server_module
+    server = server_module
+
+
+def tearDownModule():
+    mock_server.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def write_nas_file(path, data):
+    real = mock.real_path(path)
+    os.makedirs(os.path.dirname(real), exist_ok=True)
+    with open(real, 'wb') as f:
+        f.write(data)
+
+
+def read_nas_file(path):
+    with open(mock.real_path(path), 'rb') as f:
+        return f.read()
+
+
+def login(account=None):
+    """回傳已登入的 test client（每個測試使用獨立帳號，避免快取互相影響）"""
+    client = server.app.test_client()
+    response = client.post('/api/login', json={"account": account or f"user{uuid.uuid4().hex[:8]}",
+                                               "password": "test"})
+    assert response.get_json()["success"], response.get_json()
+    return client
+
+
+def run_in_thread(target):
+    """在背景執行緒執行 target，回傳完成時設定的 Event"""
+    done = threading.Event()
+
+    def run():
+        target()
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done
+
+
+class SchedulerTest(unittest.TestCase):
+    """互動式請求優先於大量傳輸，且不會被下載串流卡住"""
+
+    def test_bulk_waits_for_runnable_interactive(self):
+        scheduler = NasScheduler(max_concurrency=2, per_user_concurrency=2, bulk_concurrency=2)
+        scheduler.acquire("x")
+        scheduler.acquire("y")
+        interactive = run_in_thread(lambda: scheduler.acquire("carol"))
+        time.sleep(0.05)
+        bulk = run_in_thread(lambda: scheduler.acquire("bob", PRIORITY_BULK))
+        time.sleep(0.05)
+
+        scheduler.release("x")
+        self.assertTrue(interactive.wait(1))
+        self.assertFalse(bulk.wait(0.2))
+        scheduler.release("y")
+        self.assertTrue(bulk.wait(1))
+
+    def test_interactive_capped_by_own_limit_does_not_block_bulk(self):
+        scheduler = NasScheduler(max_concurrency=10, per_user_concurrency=1, bulk_concurrency=4)
+        scheduler.acquire("alice")
+        run_in_thread(lambda: scheduler.acquire("alice"))
+        time.sleep(0.05)
+        bulk = run_in_thread(lambda: scheduler.acquire("bob", PRIORITY_BULK))
+        self.assertTrue(bulk.wait(1))
+
+    def test_open_bulk_streams_do_not_block_interactive(self):
+        scheduler = NasScheduler(max_concurrency=10, per_user_concurrency=2, bulk_concurrency=4,
+                                 per_user_bulk_concurrency=2)
+        scheduler.acquire("alice", PRIORITY_BULK)
+        scheduler.acquire("alice", PRIORITY_BULK)
+        scheduler.acquire("alice", PRIORITY_INTERACTIVE, timeout=0.5)
+        with self.assertRaises(SchedulerBusyError):
+            scheduler.acquire("alice", PRIORITY_BULK, timeout=0.1)
+
+    def test_queue_timeout_returns_503(self):
+        client = login()
+        scheduler = server.utils.scheduler
+        holders = [f"holder{index}" for index in range(scheduler.max_concurrency)]
+        for holder in holders:
+            scheduler.acquire(holder)
+        try:
+            response = client.get('/api/files?path=/home/www')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+        finally:
+            for holder in holders:
+                scheduler.release(holder)
+        self.assertEqual(client.get('/api/files?path=/home/www').status_code, 200)
+
+
+class DownloadTokenTest(unittest.TestCase):
+    """簽章下載 token：不需 Cookie、無法竄改、過期後拒絕"""
+
+    def setUp(self):
+        if server.utils.download_tokens is None:
+            self.skipTest("未安裝 cryptography")
+
+    def test_token_download_without_session(self):
+        client = login()
+        token_url = client.get('/api/download?path=/home/www/a.txt').get_json()["data"]["token_url"]
+
+        anonymous = server.app.test_client()
+        response = anonymous.get(token_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, read_nas_file("/home/www/a.txt"))
+
+        tampered = token_url[:-4] + ("AAAA" if not token_url.endswith("AAAA") else "BBBB")
+        self.assertEqual(anonymous.get(tampered).status_code, 403)
+
+    def test_verify_is_stateless(self):
+        from download_tokens import DownloadTokenSigner
+        token = server.utils.download_tokens.issue("/home/www/a.txt", "alice", "sid", "syno")
+        claims = DownloadTokenSigner(server.download_token_secret).verify(token)
+        self.assertEqual((claims["path"], claims["sid"]), ("/home/www/a.txt", "sid"))
+        self.assertNotIn("sid", token)
+
+    def test_expired_token_rejected(self):
+        token = server.utils.download_tokens.issue("/home/www/a.txt", "alice", "sid", "syno", ttl=-1)
+        response = server.app.test_client().get(f'/api/dl/{token}')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("過期", response.get_json()["error"])
+
+
+class StreamRangeTest(unittest.TestCase):
+    """串流下載轉送 Range，超出範圍時回傳 416"""
+
+    def test_range_and_416(self):
+        client = login()
+        content = read_nas_file("/home/www/b.txt")
+
+        response = client.get('/api/download/stream?path=/home/www/b.txt', headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, content[10:20])
+        self.assertEqual(response.headers["Content-Range"], f"bytes 10-19/{FILE_SIZE}")
+
+        response = client.get('/api/download/stream?path=/home/www/b.txt',
+                              headers={"Range": f"bytes={FILE_SIZE * 5}-"})
+        self.assertEqual(response.status_code, 416)
+
+        response = client.get('/api/download/stream?path=/home/www/b.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, content)
+
+
+class DownloadCacheTest(unittest.TestCase):
+    """代理下載的磁碟快取：命中、依大小淘汰，以及查詢後被淘汰時改由 NAS 串流"""
+
+    def download(self, client, path):
+        response = client.get(f'/api/download?mode=proxy&path={path}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, read_nas_file(path))
+
+    def test_hit_and_eviction(self):
+        client = login()
+        cache = server.utils.download_cache
+        before = cache.stats()
+        self.download(client, "/home/www/cache/1.txt")
+        self.download(client, "/home/www/cache/1.txt")
+        self.assertEqual(cache.stats()["hits"], before["hits"] + 1)
+
+        self.download(client, "/home/www/cache/2.txt")
+        self.download(client, "/home/www/cache/3.txt")
+        after = cache.stats()
+        self.assertGreater(after["evictions"], before["evictions"])
+        self.assertLessEqual(after["total_bytes"], CACHE_MAX_BYTES)
+
+        # 最久未使用的 1.txt 已被淘汰，再次下載為未命中
+        self.download(client, "/home/www/cache/1.txt")
+        self.assertEqual(cache.stats()["hits"], after["hits"])
+
+    def test_evicted_after_lookup_falls_back_to_nas(self):
+        client = login()
+        cache = server.utils.download_cache
+        original = cache.get
+        cache.get = lambda key: os.path.join(workdir, "missing")
+        try:
+            self.download(client, "/home/www/a.txt")
+        finally:
+            cache.get = original
+
+    def test_missing_file_is_404(self):
+        client = login()
+        self.assertEqual(client.get('/api/download?mode=proxy&path=/home/www/nope.txt').status_code, 404)
+
+
+class ZipDownloadTest(unittest.TestCase):
+    """ZIP 串流可被標準函式庫解開，內容與 NAS 上的檔案一致"""
+
+    def test_zip_is_valid(self):
+        client = login()
+        for compression in ("store", "deflate"):
+            response = client.post('/api/download/zip', json={"paths": ["/home/www/a.txt", "/home/www/sub"],
+                                                              "compression": compression})
+            self.assertEqual(response.status_code, 200)
+            archive = zipfile.ZipFile(io.BytesIO(response.data))
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("a.txt"), read_nas_file("/home/www/a.txt"))
+            self.assertEqual(archive.read("sub/c.txt"), read_nas_file("/home/www/sub/c.txt"))
+
+
+class DeltaListingTest(unittest.TestCase):
+    """增量列表：只回傳變更，游標未知或屬於其他路徑時重設"""
+
+    def delta(self, client, path, cursor=None):
+        query = f'/api/files/delta?path={path}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(query)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()["data"]
+
+    def test_changes_and_reset(self):
+        client = login()
+        first = self.delta(client, "/home/www/delta")
+        self.assertTrue(first["reset"])
+
+        unchanged = self.delta(client, "/home/www/delta", first["cursor"])
+        self.assertFalse(unchanged["reset"])
+        self.assertEqual((unchanged["added"], unchanged["modified"], unchanged["removed"]), ([], [], []))
+
+        write_nas_file("/home/www/delta/new.txt", b"new")
+        changed = self.delta(client, "/home/www/delta", first["cursor"])
+        self.assertFalse(changed["reset"])
+        self.assertEqual([item["name"] for item in changed["added"]], ["new.txt"])
+
+        self.assertTrue(self.delta(client, "/home/www/delta", "0" * 32)["reset"])
+        self.assertTrue(self.delta(client, "/home/www", changed["cursor"])["reset"])
+
+
+class ShareReuseTest(unittest.TestCase):
+    """未指定選項時重用既有的有效連結，有期限的連結不重用"""
+
+    def share(self, client, path):
+        response = client.post('/api/share', json={"paths": [path]})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()["data"]["links"][0]
+
+    def test_reuse(self):
+        client = login()
+        path = "/home/www/sub/c.txt"
+        created = self.share(client, path)
+        self.assertFalse(created.get("reused"))
+        creates = mock.calls["SYNO.FileStation.Sharing.create"]
+
+        reused = self.share(client, path)
+        self.assertTrue(reused.get("reused"))
+        self.assertEqual(reused["id"], created["id"])
+        self.assertEqual(mock.calls["SYNO.FileStation.Sharing.create"], creates)
+
+        response = client.post('/api/share/edit', json={"ids": [created["id"]], "date_expired": "2000-01-01"})
+        self.assertEqual(response.status_code, 200)
+        fresh = self.share(client, path)
+        self.assertFalse(fresh.get("reused"))
+        self.assertNotEqual(fresh["id"], created["id"])
+
+    def test_invalid_ids_rejected(self):
+        client = login()
+        for body in ({}, {"ids": []}, {"ids": [1]}, {"ids": "abc"}):
+            self.assertEqual(client.post('/api/share/delete', json=body).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,272 @@
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.json.provider import DefaultJSONProvider
+
+# 允許沿用的外部 X-Request-ID 格式，其餘一律重新產生
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar('trace_context', default=None)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    __slots__ = ('span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'start_ns', 'attributes', 'status')
+
+    def __init__(self, name, parent_id, kind, attributes):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_otlp(self, trace_id):
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + int(self.duration * 1e9)),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """單一請求的追蹤：請求 ID、根 span 與已結束的子 span"""
+
+    def __init__(self, request_id, recording):
+        self.request_id = request_id
+        self.trace_id = os.urandom(16).hex()
+        self.recording = recording
+        self.finished = False
+        self.lock = threading.Lock()
+        self.spans = []
+        self.root = None
+
+    def timings(self):
+        """依 span 名稱加總耗時（毫秒），保留首次出現的順序"""
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            count, duration = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (count + 1, duration + span.duration)
+        return totals
+
+
+class TraceExporter:
+    """背景執行緒批次匯出 OTLP/JSON：寫入 JSON Lines 檔案，或 POST 到 collector
+
+    佇列滿時直接丟棄並計數，匯出不會拖慢請求。
+    """
+
+    def __init__(self, service_name, file_path="", endpoint="", http_session=None,
+                 max_queue=10000, batch_size=100, interval=2.0, timeout=5):
+        self.service_name = service_name
+        self.file_path = file_path
+        self.endpoint = endpoint
+        self.http_session = http_session
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def payload(self, traces):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": self.service_name},
+                    "spans": [span.to_otlp(trace.trace_id) for trace in traces for span in trace.spans]
+                }]
+            }]
+        }
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+                self.exported += len(batch)
+            except Exception:
+                self.failed += len(batch)
+
+    def export(self, traces):
+        payload = self.payload(traces)
+        if self.file_path:
+            with open(self.file_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(payload, ensure_ascii=False, separators=(',', ':')) + "\n")
+        if self.endpoint and self.http_session is not None:
+            response = self.http_session.post(self.endpoint, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "exported": self.exported,
+                "failed": self.failed, "dropped": self.dropped}
+
+
+class Tracer:
+    """輕量的請求追蹤
+
+    每個請求都有請求 ID；啟用時以 span() 記錄各階段耗時，請求結束後交給 exporter。
+    沒有進行中的追蹤（背景執行緒、已結束的請求）時 span() 不做任何事。
+    """
+
+    def __init__(self, enabled=False, exporter=None, sample_rate=1.0):
+        self.configure(enabled, exporter, sample_rate)
+
+    def configure(self, enabled=False, exporter=None, sample_rate=1.0):
+        self.enabled = enabled
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, request_id=None, name="request", attributes=None):
+        if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = os.urandom(16).hex()
+        recording = self.enabled and (self.sample_rate >= 1 or
+                                      int.from_bytes(os.urandom(4), 'big') < self.sample_rate * 2 ** 32)
+        trace = Trace(request_id, recording)
+        if recording:
+            trace.root = Span(name, None, SPAN_KIND_SERVER, dict(attributes or {}, **{"request.id": request_id}))
+        _current.set((trace, trace.root))
+        return trace
+
+    def finish_trace(self, trace, attributes=None, error=False):
+        """結束根 span 並送出匯出；重複呼叫只有第一次有效"""
+        with trace.lock:
+            if trace.finished:
+                return
+            trace.finished = True
+        if trace.root is None:
+            return
+        trace.root.end = time.perf_counter()
+        trace.root.attributes.update(attributes or {})
+        if error:
+            trace.root.status = STATUS_ERROR
+        with trace.lock:
+            trace.spans.append(trace.root)
+        if self.exporter is not None:
+            self.exporter.submit(trace)
+
+    @staticmethod
+    def current_trace():
+        current = _current.get()
+        return current[0] if current else None
+
+    @staticmethod
+    def current_request_id():
+        current = _current.get()
+        return current[0].request_id if current else None
+
+    @contextmanager
+    def span(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        """記錄一段耗時；yield 的 span 可用 set() 補上屬性（未記錄時為 None）"""
+        current = _current.get()
+        if current is None or not current[0].recording or current[0].finished:
+            yield None
+            return
+        trace, parent = current
+        span = Span(name, parent.span_id if parent else None, kind, attributes)
+        token = _current.set((trace, span))
+        try:
+            yield span
+        except BaseException:
+            span.status = STATUS_ERROR
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current.reset(token)
+            with trace.lock:
+                trace.spans.append(span)
+
+    def log_context(self):
+        """提供給日誌附加目前的請求 ID"""
+        request_id = self.current_request_id()
+        return {"request_id": request_id} if request_id else None
+
+
+def server_timing(trace, total=None):
+    """組成 Server-Timing 標頭，例如 session.lookup;dur=0.4, nas.request;dur=31.2;desc="x2\""""
+    parts = []
+    for name, (count, duration) in trace.timings().items():
+        part = f"{name};dur={duration * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TracingJSONProvider(DefaultJSONProvider):
+    """把 jsonify 的序列化時間記錄為 serialize span"""
+
+    def response(self, *args, **kwargs):
+        with tracer.span("serialize"):
+            return super().response(*args, **kwargs)
+
+
+# 全域共用的追蹤器，啟動時由 server.py 依設定呼叫 configure()
+tracer = Tracer()
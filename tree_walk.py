@@ -0,0 +1,48 @@
+import fnmatch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def matches(name, patterns):
+    """檔名是否符合任一 glob 樣式"""
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def walk_tree(list_folder, root, max_depth=None, include=(), exclude=(), concurrency=4, cancel_event=None):
+    """以有上限的併發池逐層走訪目錄樹，逐筆產生 (事件類型, 資料)
+
+    list_folder(path) 回傳該資料夾的所有項目；include 只篩選輸出的項目，
+    exclude 則同時略過項目並不再深入符合的資料夾。
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = {}
+    queue = deque([(root, 1)])
+    try:
+        while queue or pending:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            # 先送出佇列中的資料夾，在途數量不超過併發上限
+            while queue and len(pending) < concurrency:
+                folder, depth = queue.popleft()
+                pending[executor.submit(list_folder, folder)] = (folder, depth)
+
+            done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder, depth = pending.pop(future)
+                try:
+                    items = future.result()
+                except Exception as e:
+                    yield "error", {"path": folder, "error": str(e)}
+                    continue
+                for item in items:
+                    name = item.get('name', '')
+                    if exclude and matches(name, exclude):
+                        continue
+                    is_dir = bool(item.get('isdir'))
+                    if is_dir and (max_depth is None or depth < max_depth):
+                        queue.append((item['path'], depth + 1))
+                    if include and not matches(name, include):
+                        continue
+                    yield "entry", dict(item, depth=depth)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,77 @@
+import time
+import zipfile
+
+COMPRESSION_MODES = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED
+}
+
+# ZIP 格式無法表示 1980 年以前的時間
+MIN_ZIP_TIMESTAMP = 315532800
+
+
+class _ZipOutput:
+    """僅可附加寫入的輸出緩衝，供 zipfile 以不可 seek 的模式寫入"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _zip_info(arcname, mtime, compression):
+    date_time = time.localtime(max(mtime or 0, MIN_ZIP_TIMESTAMP))[:6]
+    zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+    zinfo.compress_type = compression
+    return zinfo
+
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """將項目即時寫成 ZIP 串流
+
+    entries 為 (arcname, size, mtime, open_chunks) 的迭代器；資料夾的 open_chunks 為 None。
+    open_chunks() 回傳檔案內容的位元組迭代器，回傳 None 時略過該檔案。
+    """
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, 'w', compression=compression, allowZip64=True) as archive:
+        for arcname, size, mtime, open_chunks in entries:
+            if open_chunks is None:
+                zinfo = _zip_info(arcname.rstrip('/') + '/', mtime, zipfile.ZIP_STORED)
+                zinfo.external_attr = 0o40775 << 16 | 0x10
+                archive.writestr(zinfo, b'')
+                yield output.drain()
+                continue
+
+            chunks = open_chunks()
+            if chunks is None:
+                continue
+            zinfo = _zip_info(arcname, mtime, compression)
+            zinfo.external_attr = 0o644 << 16
+            # 先填入預期大小，讓 zipfile 判斷是否需要 ZIP64
+            zinfo.file_size = size or 0
+            try:
+                with archive.open(zinfo, 'w') as dest:
+                    for chunk in chunks:
+                        dest.write(chunk)
+                        if output.chunks:
+                            yield output.drain()
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+            yield output.drain()
+    yield output.drain()